@@ -16,6 +16,10 @@ class Calendar {
         
         // Track pending event suggestions
         this.pendingEvent = null;
+        this.pendingEvents = [];
+        
+        // Server calendar version the local events were last synced to
+        this.eventsVersion = null;
         
         this.initializeElements();
         this.attachEventListeners();
@@ -225,6 +229,7 @@ class Calendar {
             this.date.setDate(this.date.getDate() + direction);
         }
         this.render();
+        this.syncVisibleRange();
     }
 
     /**
@@ -238,6 +243,7 @@ class Calendar {
         this.calendarElement.classList.toggle('week-view', view === 'week');
         this.calendarElement.classList.toggle('day-view', view === 'day');
         this.render();
+        this.syncVisibleRange();
     }
 
     /**
@@ -895,50 +901,12 @@ class Calendar {
             return;
         }
 
-        // Send message to API
-        fetch(this.chatApiUrl, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                user_id: this.userEmail || 'default',
-                message: messageText,
-                pending_event: this.pendingEvent // Include any pending event for confirmation
-            })
-        })
-        .then(response => response.json())
+        // Stream the reply so text appears while it is being generated
+        this.streamChatMessage(messageText, thinkingMessage)
         .then(data => {
             // Remove thinking indicator
             this.messages = this.messages.filter(m => m.id !== thinkingId);
-            
-            // Handle event suggestion
-            if (data.event_suggested && data.event_data) {
-                // Store the pending event
-                this.pendingEvent = data.event_data;
-                
-                // Add the response with confirmation buttons
-                this.addBotMessage(data.response, { 
-                    eventSuggestion: true,
-                    eventData: data.event_data 
-                });
-            } else {
-                // Regular response
-                this.addBotMessage(data.response);
-                
-                // If an event was added, refresh the calendar
-                if (data.event_added && data.add_result) {
-                    console.log('Event added by chatbot:', data.add_result);
-                    // Fetch latest events instead of using the old loadUserEvents method
-                    this.fetchAndUpdateEvents();
-                    
-                    // Clear pending event since it was added
-                    this.pendingEvent = null;
-                } else if (!data.event_suggested) {
-                    // Clear pending event if no new event was suggested
-                    this.pendingEvent = null;
-                }
-            }
+            this.handleChatResponse(data);
         })
         .catch(error => {
             console.error('Error sending message to chatbot:', error);
@@ -955,6 +923,128 @@ class Calendar {
         });
     }
 
+    /**
+     * Handle a chat response body from the server
+     */
+    handleChatResponse(data) {
+        // Handle event suggestion
+        if (data.event_suggested && data.event_data) {
+            // Store the pending events (a response may suggest several)
+            this.pendingEvent = data.event_data;
+            this.pendingEvents = data.event_suggestions && data.event_suggestions.length
+                ? data.event_suggestions : [data.event_data];
+            
+            // Add the response with confirmation buttons
+            this.addBotMessage(data.response, { 
+                eventSuggestion: true,
+                eventData: data.event_data,
+                eventSuggestions: this.pendingEvents
+            });
+        } else {
+            // Regular response
+            this.addBotMessage(data.response);
+            
+            // If an event was added, refresh the calendar
+            if (data.event_added && data.add_result) {
+                console.log('Event added by chatbot:', data.add_result);
+                // Fetch only what changed instead of reloading every event
+                this.syncEventChanges();
+                
+                // Clear pending event since it was added
+                this.pendingEvent = null;
+                this.pendingEvents = [];
+            } else if (data.event_updated || data.event_deleted) {
+                // A confirmed move or delete
+                this.syncEventChanges();
+                this.pendingEvent = null;
+                this.pendingEvents = [];
+            } else if (!data.event_suggested) {
+                // Clear pending event if no new event was suggested
+                this.pendingEvent = null;
+                this.pendingEvents = [];
+            }
+        }
+    }
+
+    /**
+     * Send a chat message to the streaming endpoint, showing tokens as they arrive.
+     * Resolves with the same body the blocking /api/chat endpoint returns.
+     */
+    streamChatMessage(messageText, thinkingMessage) {
+        const body = JSON.stringify({
+            user_id: this.userEmail || 'default',
+            message: messageText,
+            pending_event: this.pendingEvent, // Include any pending event for confirmation
+            pending_events: this.pendingEvents
+        });
+        const options = {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body
+        };
+        
+        return fetch(`${this.chatApiUrl}/stream`, options).then(response => {
+            if (response.status === 429) {
+                // Server is at capacity; its body says to try again shortly
+                return response.json();
+            }
+            if (!response.ok || !response.body) {
+                // Fall back to the blocking endpoint
+                return fetch(this.chatApiUrl, options).then(fallback => fallback.json());
+            }
+            
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let streamedText = '';
+            
+            const read = () => reader.read().then(({ done, value }) => {
+                if (done) {
+                    throw new Error('Chat stream ended without a result');
+                }
+                buffer += decoder.decode(value, { stream: true });
+                
+                // Server-Sent Events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                    const block = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    const eventMatch = block.match(/^event: (.*)$/m);
+                    const dataMatch = block.match(/^data: (.*)$/m);
+                    if (!eventMatch || !dataMatch) continue;
+                    
+                    const payload = JSON.parse(dataMatch[1]);
+                    if (eventMatch[1] === 'token') {
+                        streamedText += payload.text;
+                        thinkingMessage.text = streamedText;
+                        this.scheduleRenderMessages();
+                    } else if (eventMatch[1] === 'done') {
+                        reader.cancel();
+                        return payload;
+                    } else if (eventMatch[1] === 'error') {
+                        throw new Error(payload.error);
+                    }
+                }
+                return read();
+            });
+            return read();
+        });
+    }
+
+    /**
+     * Re-render messages at most once per animation frame
+     */
+    scheduleRenderMessages() {
+        if (this.renderMessagesPending) return;
+        this.renderMessagesPending = true;
+        requestAnimationFrame(() => {
+            this.renderMessagesPending = false;
+            this.renderMessages();
+        });
+    }
+
     /**
      * Get a simple fallback response for basic calendar questions
      */
@@ -1080,43 +1170,13 @@ class Calendar {
             // Add confirmation buttons for event suggestions
             if (!message.sent && message.eventSuggestion && message.eventData) {
                 const eventData = message.eventData;
+                const suggestions = message.eventSuggestions && message.eventSuggestions.length
+                    ? message.eventSuggestions : [eventData];
                 
-                // Create event summary
-                const eventSummary = document.createElement('div');
-                eventSummary.className = 'event-suggestion';
-                
-                // Format date
-                const eventDate = new Date(eventData.date);
-                const formattedDate = eventDate.toLocaleDateString('en-US', {
-                    weekday: 'long',
-                    month: 'long',
-                    day: 'numeric',
-                    year: 'numeric'
+                suggestions.forEach(suggestion => {
+                    messageElement.appendChild(this.createEventSummary(suggestion));
                 });
                 
-                // Check for all-day event (handle both property names)
-                const isAllDay = eventData.is_all_day || eventData.allDay || false;
-                
-                // Time information
-                let timeInfo = 'All day';
-                if (!isAllDay && eventData.startTime) {
-                    timeInfo = eventData.startTime;
-                    if (eventData.endTime) {
-                        timeInfo += ` - ${eventData.endTime}`;
-                    }
-                }
-                
-                // Build summary
-                eventSummary.innerHTML = `
-                    <div class="event-suggestion-title">${eventData.title}</div>
-                    <div class="event-suggestion-details">
-                        <div class="event-date">${formattedDate}</div>
-                        <div class="event-time">${timeInfo}</div>
-                        ${eventData.notes ? `<div class="event-notes">${eventData.notes}</div>` : ''}
-                    </div>
-                `;
-                messageElement.appendChild(eventSummary);
-                
                 // Create confirmation buttons
                 const confirmationButtons = document.createElement('div');
                 confirmationButtons.className = 'event-confirmation-buttons';
@@ -1134,7 +1194,8 @@ class Calendar {
                     // In online mode, add confirm/decline buttons
                     const confirmButton = document.createElement('button');
                     confirmButton.className = 'confirm-event';
-                    confirmButton.textContent = 'Yes, add this event';
+                    confirmButton.textContent = suggestions.length > 1
+                        ? `Yes, add these ${suggestions.length} events` : 'Yes, add this event';
                     confirmButton.addEventListener('click', () => {
                         this.messageInput.value = 'Yes';
                         this.sendMessage();
@@ -1162,6 +1223,46 @@ class Calendar {
         this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
     }
 
+    /**
+     * Build the summary card for one suggested event
+     */
+    createEventSummary(eventData) {
+        const eventSummary = document.createElement('div');
+        eventSummary.className = 'event-suggestion';
+        
+        // Format date
+        const eventDate = new Date(eventData.date);
+        const formattedDate = eventDate.toLocaleDateString('en-US', {
+            weekday: 'long',
+            month: 'long',
+            day: 'numeric',
+            year: 'numeric'
+        });
+        
+        // Check for all-day event (handle both property names)
+        const isAllDay = eventData.is_all_day || eventData.allDay || false;
+        
+        // Time information
+        let timeInfo = 'All day';
+        if (!isAllDay && eventData.startTime) {
+            timeInfo = eventData.startTime;
+            if (eventData.endTime) {
+                timeInfo += ` - ${eventData.endTime}`;
+            }
+        }
+        
+        // Build summary
+        eventSummary.innerHTML = `
+            <div class="event-suggestion-title">${eventData.title}</div>
+            <div class="event-suggestion-details">
+                <div class="event-date">${formattedDate}</div>
+                <div class="event-time">${timeInfo}</div>
+                ${eventData.notes ? `<div class="event-notes">${eventData.notes}</div>` : ''}
+            </div>
+        `;
+        return eventSummary;
+    }
+
     /**
      * Toggle chat visibility
      */
@@ -1419,37 +1520,88 @@ class Calendar {
     }
 
     /**
-     * Fetch the latest events from the server and update the calendar
+     * Get the first and last dates (YYYY-MM-DD) shown by the current view
+     */
+    getVisibleRange() {
+        let start;
+        let days;
+        if (this.currentView === 'month') {
+            // The month grid starts on the Sunday before the 1st and shows 35 days
+            start = new Date(this.date.getFullYear(), this.date.getMonth(), 1);
+            start.setDate(start.getDate() - start.getDay());
+            days = 35;
+        } else if (this.currentView === 'week') {
+            start = new Date(this.date);
+            start.setDate(this.date.getDate() - this.date.getDay());
+            days = 7;
+        } else {
+            start = new Date(this.date);
+            days = 1;
+        }
+        const end = new Date(start);
+        end.setDate(start.getDate() + days - 1);
+        const format = d => `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
+        return { start: format(start), end: format(end) };
+    }
+
+    /**
+     * Normalize event properties from server format to client format
+     */
+    normalizeServerEvent(event) {
+        const normalizedEvent = {
+            ...event,
+            // Handle property name discrepancies
+            allDay: event.allDay || event.is_all_day || false,
+            // Make sure id is always numeric 
+            id: typeof event.id === 'number' ? event.id : parseInt(event.id) || Date.now(),
+            // Ensure date is properly formatted
+            date: event.date
+        };
+        
+        // If no color is specified, add a default color
+        if (!normalizedEvent.color) {
+            normalizedEvent.color = '#4285f4';
+        }
+        
+        return normalizedEvent;
+    }
+
+    /**
+     * Fetch the events for the visible date range from the server and update the calendar
      */
     fetchAndUpdateEvents() {
-        const url = new URL(this.chatApiUrl.replace('/chat', '/events'));
-        const params = { user_id: this.userEmail || 'default' };
-        url.search = new URLSearchParams(params).toString();
+        const { start, end } = this.getVisibleRange();
+        const baseUrl = this.chatApiUrl.replace('/chat', '/events');
+        const fetched = [];
+        let version = null;
+        
+        // Follow the server's pagination cursor until the range is complete
+        const fetchPage = (cursor) => {
+            const url = new URL(baseUrl);
+            const params = { user_id: this.userEmail || 'default', start, end, limit: 500 };
+            if (cursor) params.cursor = cursor;
+            url.search = new URLSearchParams(params).toString();
+            return fetch(url).then(response => {
+                const nextCursor = response.headers.get('X-Next-Cursor');
+                if (version === null) {
+                    version = response.headers.get('X-Calendar-Version');
+                }
+                return response.json().then(events => {
+                    if (!Array.isArray(events)) return null;
+                    fetched.push(...events);
+                    return nextCursor ? fetchPage(nextCursor) : fetched;
+                });
+            });
+        };
         
-        fetch(url)
-            .then(response => response.json())
+        fetchPage(null)
             .then(events => {
-                if (Array.isArray(events)) {
-                    // Normalize event properties from server format to client format
-                    this.events = events.map(event => {
-                        // Create a normalized event object
-                        const normalizedEvent = {
-                            ...event,
-                            // Handle property name discrepancies
-                            allDay: event.allDay || event.is_all_day || false,
-                            // Make sure id is always numeric 
-                            id: typeof event.id === 'number' ? event.id : parseInt(event.id) || Date.now(),
-                            // Ensure date is properly formatted
-                            date: event.date
-                        };
-                        
-                        // If no color is specified, add a default color
-                        if (!normalizedEvent.color) {
-                            normalizedEvent.color = '#4285f4';
-                        }
-                        
-                        return normalizedEvent;
-                    });
+                if (events) {
+                    // Replace the events inside the fetched range, keep the rest
+                    this.events = this.events
+                        .filter(event => event.date < start || event.date > end)
+                        .concat(events.map(event => this.normalizeServerEvent(event)));
+                    this.eventsVersion = version !== null ? parseInt(version) : null;
                     
                     // Save to localStorage
                     this.saveUserEvents();
@@ -1464,6 +1616,61 @@ class Calendar {
             });
     }
 
+    /**
+     * Pull only the events changed on the server since the last sync
+     */
+    syncEventChanges() {
+        if (this.eventsVersion === null) {
+            this.fetchAndUpdateEvents();
+            return;
+        }
+        
+        const url = new URL(this.chatApiUrl.replace('/chat', '/events'));
+        const params = { user_id: this.userEmail || 'default', since: this.eventsVersion };
+        url.search = new URLSearchParams(params).toString();
+        
+        // An unchanged calendar answers 304 without a body
+        fetch(url, { cache: 'no-store', headers: { 'If-None-Match': `"${this.eventsVersion}"` } })
+            .then(response => (response.status === 304 ? null : response.json()))
+            .then(changes => {
+                if (!changes) return;
+                if (changes.reset) {
+                    // Our version is no longer tracked by the server; start over
+                    this.eventsVersion = null;
+                    this.fetchAndUpdateEvents();
+                    return;
+                }
+                
+                const changed = [...changes.created, ...changes.updated];
+                if (changed.some(event => event.rrule)) {
+                    // Recurring series are expanded by the server; reload the visible range
+                    this.fetchAndUpdateEvents();
+                    return;
+                }
+                const replacedIds = new Set([...changes.deleted, ...changed.map(event => event.id)]);
+                this.events = this.events
+                    .filter(event => !replacedIds.has(event.id))
+                    .concat(changed.map(event => this.normalizeServerEvent(event)));
+                this.eventsVersion = changes.version;
+                
+                this.saveUserEvents();
+                this.render();
+                console.log('Calendar synced to server version', changes.version);
+            })
+            .catch(error => {
+                console.error('Error syncing events from server:', error);
+            });
+    }
+
+    /**
+     * Refresh events from the server when the visible range changes
+     */
+    syncVisibleRange() {
+        if (this.isChatbotReady && !this.useFallbackChat) {
+            this.fetchAndUpdateEvents();
+        }
+    }
+
     /**
      * Load events for the current user
      */
@@ -0,0 +1,116 @@
+"""Bounded, fair admission of LLM calls
+
+Only `capacity` model calls run at once, matching what the Ollama backend
+can serve in parallel. Further calls wait in per-user queues that are
+served round-robin, so one user sending a burst cannot starve everyone
+else. When too many calls are already waiting, or a call waits too long,
+QueueFull is raised with a suggested Retry-After so the HTTP layer can
+answer 429 instead of letting latency pile up.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+import config
+
+# Weight of the newest call in the running average of call durations
+DURATION_SMOOTHING = 0.2
+
+
+class QueueFull(Exception):
+    """No slot is available; retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"LLM queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """Semaphore-like limit on concurrent calls with per-user round-robin waiting"""
+
+    def __init__(self, capacity, max_waiting, wait_timeout):
+        self.capacity = max(1, capacity)
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        # user_id -> waiting tickets, in the order users will be served
+        self._waiting = OrderedDict()
+        self._waiting_count = 0
+        self._average_duration = 5.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def acquire(self, user_id):
+        """Wait for a slot; raises QueueFull if the queue is full or the wait times out"""
+        with self._lock:
+            if self._active < self.capacity and not self._waiting_count:
+                self._active += 1
+                self.admitted += 1
+                return
+            if self._waiting_count >= self.max_waiting:
+                self.rejected += 1
+                raise QueueFull(self._retry_after())
+            ticket = threading.Event()
+            self._waiting.setdefault(user_id, deque()).append(ticket)
+            self._waiting_count += 1
+        if ticket.wait(self.wait_timeout):
+            return
+        with self._lock:
+            if ticket.is_set():
+                # Granted just as the wait timed out
+                return
+            tickets = self._waiting[user_id]
+            tickets.remove(ticket)
+            if not tickets:
+                del self._waiting[user_id]
+            self._waiting_count -= 1
+            self.timed_out += 1
+            raise QueueFull(self._retry_after())
+
+    def release(self, duration=None):
+        """Free a slot, handing it straight to the next user in turn"""
+        with self._lock:
+            if duration is not None:
+                self._average_duration += DURATION_SMOOTHING * (duration - self._average_duration)
+            if not self._waiting:
+                self._active -= 1
+                return
+            user_id, tickets = next(iter(self._waiting.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                # This user goes to the back of the rotation
+                self._waiting.move_to_end(user_id)
+            else:
+                del self._waiting[user_id]
+            self._waiting_count -= 1
+            self.admitted += 1
+            ticket.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "active": self._active,
+                "waiting": self._waiting_count,
+                "waiting_users": len(self._waiting),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "average_seconds": round(self._average_duration, 3),
+            }
+
+    def _retry_after(self):
+        # Time for the calls ahead of a new arrival to drain
+        rounds = (self._waiting_count + self._active) / self.capacity
+        return max(1, math.ceil(rounds * self._average_duration))
+
+
+def create_admission_queue():
+    return AdmissionQueue(
+        capacity=config.LLM_CONCURRENCY,
+        max_waiting=config.LLM_QUEUE_MAX,
+        wait_timeout=config.LLM_QUEUE_TIMEOUT,
+    )
@@ -0,0 +1,227 @@
+"""Interval index over a user's events for conflict checks and free-slot search
+
+An index covers one date window. Timed events (recurring occurrences
+included) are kept sorted by start time, alongside the merged busy
+intervals they form, so conflict checks and the search for the next free
+slot are binary searches rather than scans of the calendar. All-day events
+do not block time. Indexes are cached per user and calendar version, so any
+calendar change invalidates them automatically.
+"""
+import datetime
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+# Minutes after midnight bounding each time-of-day preference
+PREFERENCES = {
+    "morning": (8 * 60, 12 * 60),
+    "afternoon": (12 * 60, 17 * 60),
+    "evening": (17 * 60, 21 * 60),
+    "any": (8 * 60, 20 * 60),
+}
+
+# Events without a usable end time are assumed to take this long
+DEFAULT_EVENT_MINUTES = 30
+SLOT_STEP_MINUTES = 15
+# Longest range searched for free slots
+MAX_SEARCH_DAYS = 90
+CACHE_SIZE = 128
+
+SCHEDULING_PHRASES = ["when should", "when can", "when could", "find time", "find a time",
+                      "free time", "free slot", "available", "availability", "fit in"]
+
+
+def window_minutes(preference):
+    """Length of a preference's daily window, the longest slot it can hold"""
+    window_start, window_end = PREFERENCES[preference]
+    return window_end - window_start
+
+
+def _parse_time(date, value):
+    hours, minutes = value.split(":")[:2]
+    return datetime.datetime.combine(date, datetime.time(int(hours), int(minutes)))
+
+
+def event_interval(event):
+    """(start, end) datetimes of a timed event, or None for all-day or malformed events"""
+    if event.get("is_all_day") or event.get("allDay") or not event.get("startTime"):
+        return None
+    try:
+        date = datetime.date.fromisoformat(event["date"])
+        start = _parse_time(date, event["startTime"])
+        end = _parse_time(date, event["endTime"]) if event.get("endTime") else start
+    except (KeyError, ValueError):
+        return None
+    if end < start:
+        # Ends after midnight
+        end += datetime.timedelta(days=1)
+    if end == start:
+        end = start + datetime.timedelta(minutes=DEFAULT_EVENT_MINUTES)
+    return start, end
+
+
+def _round_up(moment, step_minutes):
+    minutes = moment.hour * 60 + moment.minute
+    remainder = minutes % step_minutes
+    moment = moment.replace(second=0, microsecond=0)
+    if remainder:
+        moment += datetime.timedelta(minutes=step_minutes - remainder)
+    return moment
+
+
+class IntervalIndex:
+    """Sorted timed events plus the merged busy intervals they form"""
+
+    def __init__(self, events):
+        intervals = []
+        for event in events:
+            interval = event_interval(event)
+            if interval:
+                intervals.append((interval[0], interval[1], event))
+        intervals.sort(key=lambda item: (item[0], item[1]))
+        self._intervals = intervals
+        self._starts = [start for start, _, _ in intervals]
+        self._max_length = max((end - start for start, end, _ in intervals), default=datetime.timedelta(0))
+
+        busy_starts, busy_ends = [], []
+        for start, end, _ in intervals:
+            if busy_ends and start <= busy_ends[-1]:
+                busy_ends[-1] = max(busy_ends[-1], end)
+            else:
+                busy_starts.append(start)
+                busy_ends.append(end)
+        self._busy_starts = busy_starts
+        self._busy_ends = busy_ends
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def is_free(self, start, end):
+        """True if no timed event overlaps [start, end)"""
+        k = bisect_right(self._busy_ends, start)
+        return k == len(self._busy_starts) or self._busy_starts[k] >= end
+
+    def conflicts(self, start, end):
+        """Events overlapping [start, end), in start order"""
+        found = []
+        # Only events starting within max_length before `start` can still be running
+        j = bisect_left(self._starts, end) - 1
+        while j >= 0 and self._starts[j] + self._max_length > start:
+            event_start, event_end, event = self._intervals[j]
+            if event_end > start:
+                found.append(event)
+            j -= 1
+        found.reverse()
+        return found
+
+    def free_slots(self, start, end, duration_minutes, count, preference="any"):
+        """First `count` free slots of `duration_minutes` between start and end
+
+        Slots begin on SLOT_STEP_MINUTES boundaries and lie inside the daily
+        window of the time-of-day preference.
+        """
+        window_start, window_end = PREFERENCES.get(preference, PREFERENCES["any"])
+        if duration_minutes > window_end - window_start:
+            # Would never fit, however many days were walked
+            return []
+        duration = datetime.timedelta(minutes=duration_minutes)
+        busy_starts, busy_ends = self._busy_starts, self._busy_ends
+        k = bisect_right(busy_ends, start)
+        cursor = start
+        slots = []
+        while len(slots) < count:
+            cursor = _round_up(cursor, SLOT_STEP_MINUTES)
+            midnight = datetime.datetime.combine(cursor.date(), datetime.time())
+            day_start = midnight + datetime.timedelta(minutes=window_start)
+            day_end = midnight + datetime.timedelta(minutes=window_end)
+            if cursor < day_start:
+                cursor = day_start
+            if cursor + duration > day_end:
+                cursor = day_start + datetime.timedelta(days=1)
+                if cursor >= end:
+                    break
+                continue
+            if cursor + duration > end:
+                break
+            while k < len(busy_starts) and busy_ends[k] <= cursor:
+                k += 1
+            if k < len(busy_starts) and busy_starts[k] < cursor + duration:
+                # Jump past the busy interval in the way
+                cursor = busy_ends[k]
+                continue
+            slots.append((cursor, cursor + duration))
+            cursor += duration
+        return slots
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_index(store, user_id, start_date, end_date):
+    """Index of a user's events between two dates (inclusive), cached per calendar version"""
+    key = (user_id, start_date, end_date, store.current_version(user_id))
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None:
+            _cache.move_to_end(key)
+            return index
+    events, _ = store.list_events(user_id, start=start_date, end=end_date)
+    index = IntervalIndex(events)
+    with _cache_lock:
+        _cache[key] = index
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+def find_free_slots(store, user_id, start, end, duration_minutes=60, count=3, preference="any"):
+    """Free slots between two datetimes, as event-shaped dicts"""
+    first_day = (start.date() - datetime.timedelta(days=1)).isoformat()
+    index = get_index(store, user_id, first_day, end.date().isoformat())
+    return [
+        {"date": slot_start.date().isoformat(),
+         "startTime": slot_start.strftime("%H:%M"),
+         "endTime": slot_end.strftime("%H:%M")}
+        for slot_start, slot_end in index.free_slots(start, end, duration_minutes, count, preference)
+    ]
+
+
+def find_conflicts(store, user_id, event):
+    """Events overlapping a proposed timed event"""
+    interval = event_interval(event)
+    if interval is None:
+        return []
+    # Start a day early to catch events running past midnight into this one
+    first_day = (interval[0].date() - datetime.timedelta(days=1)).isoformat()
+    index = get_index(store, user_id, first_day, interval[1].date().isoformat())
+    return index.conflicts(*interval)
+
+
+def parse_slot_request(message):
+    """Guess (duration_minutes, preference) from a scheduling question"""
+    text = message.lower()
+    duration = 60
+    match = re.search(r"(\d+(?:\.\d+)?)\s*(hours?|hrs?|h\b|minutes?|mins?)", text)
+    if match:
+        amount = float(match.group(1))
+        duration = int(amount * 60) if match.group(2).startswith("h") else int(amount)
+    elif "half an hour" in text or "half hour" in text:
+        duration = 30
+    preference = next((name for name in ("morning", "afternoon", "evening") if name in text), "any")
+    return min(max(SLOT_STEP_MINUTES, duration), window_minutes(preference)), preference
+
+
+def candidate_slots_context(store, user_id, message, now, days=7, count=5):
+    """Precomputed free slots for the prompt when the user asks when to do something"""
+    text = message.lower()
+    if not any(phrase in text for phrase in SCHEDULING_PHRASES):
+        return ""
+    duration, preference = parse_slot_request(message)
+    slots = find_free_slots(store, user_id, now, now + datetime.timedelta(days=days),
+                            duration, count, preference)
+    if not slots:
+        return f"No free {duration}-minute slots in the next {days} days.\n"
+    listed = ", ".join(f"{s['date']} {s['startTime']}-{s['endTime']}" for s in slots)
+    return f"Free {duration}-minute slots ({preference}): {listed}\n"
@@ -0,0 +1 @@
+"""Benchmark harness for the calendar server, runnable without a live Ollama"""
@@ -0,0 +1,52 @@
+"""Deterministic synthetic calendars for benchmarks
+
+Events are spread around today so the date-window queries and the chat
+context always find some: roughly six per day, over at least a month and
+at most ten years. About one in twenty is a weekly series and one in ten an
+all-day event, like a real calendar.
+"""
+import datetime
+import random
+
+TITLES = ["Standup", "1:1", "Design review", "Lunch", "Gym", "Dentist", "Team sync",
+          "Customer call", "Focus time", "Dinner", "Planning", "Interview", "Retro"]
+EVENTS_PER_DAY = 6
+MIN_SPAN_DAYS = 30
+MAX_SPAN_DAYS = 3650
+INSERT_CHUNK = 5000
+
+
+def generate_events(count, seed=0, today=None):
+    """`count` event dicts in the shape the server stores, without ids"""
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    span = min(MAX_SPAN_DAYS, max(MIN_SPAN_DAYS, count // EVENTS_PER_DAY))
+    first_day = today - datetime.timedelta(days=span // 2)
+    events = []
+    for _ in range(count):
+        date = first_day + datetime.timedelta(days=rng.randrange(span))
+        title = rng.choice(TITLES)
+        event = {"title": title, "date": date.isoformat(), "notes": "", "color": "#4285f4"}
+        kind = rng.random()
+        if kind < 0.1:
+            event.update(is_all_day=True, allDay=True)
+        else:
+            start = rng.randrange(7 * 4, 20 * 4) * 15
+            end = start + rng.choice((15, 30, 45, 60, 90))
+            event.update(is_all_day=False, allDay=False,
+                         startTime=f"{start // 60:02d}:{start % 60:02d}",
+                         endTime=f"{end // 60:02d}:{end % 60:02d}")
+        if 0.1 <= kind < 0.15:
+            event["rrule"] = {"freq": "weekly", "byday": [date.weekday()], "count": rng.randrange(4, 53)}
+        events.append(event)
+    return events
+
+
+def seed_calendar(store, user_id, count, seed=0, today=None):
+    """Replace a user's calendar with `count` synthetic events; returns the stored events"""
+    store.replace_all(user_id, [])
+    events = generate_events(count, seed, today)
+    stored = []
+    for start in range(0, len(events), INSERT_CHUNK):
+        stored.extend(store.insert_events(user_id, events[start:start + INSERT_CHUNK]))
+    return stored
@@ -0,0 +1,79 @@
+"""Compare two bench.run reports
+
+    python -m bench.compare before.json after.json [--threshold 10]
+
+Prints the change in latency percentiles, throughput and bytes written for
+every (calendar size, scenario) present in both. With --threshold, exits
+with status 1 when any p95 or p99 got slower by more than that percentage,
+so it can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+# (label, getter)
+COLUMNS = [
+    ("p50 ms", lambda result: result["latency_ms"]["p50"]),
+    ("p95 ms", lambda result: result["latency_ms"]["p95"]),
+    ("p99 ms", lambda result: result["latency_ms"]["p99"]),
+    ("req/s", lambda result: result["throughput_rps"]),
+    ("B written/op", lambda result: result["bytes_written_per_op"]),
+    ("prefill tokens/call", lambda result: result.get("prefill_tokens_per_call")),
+]
+GATED = ("p95 ms", "p99 ms")
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report["meta"], {(result["calendar_size"], result["scenario"]): result
+                            for result in report["results"]}
+
+
+def change(before, after):
+    """Percentage change, or None when it cannot be computed"""
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before * 100
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float,
+                        help="fail if p95 or p99 latency grows by more than this many percent")
+    args = parser.parse_args(argv)
+
+    before_meta, before = load(args.before)
+    after_meta, after = load(args.after)
+    print(f"before: {before_meta.get('commit') or args.before}")
+    print(f"after:  {after_meta.get('commit') or args.after}")
+
+    regressions = []
+    for key in sorted(before.keys() & after.keys()):
+        size, scenario = key
+        cells = []
+        for label, value in COLUMNS:
+            old, new = value(before[key]), value(after[key])
+            delta = change(old, new)
+            cells.append(f"{label} {old} -> {new}" + (f" ({delta:+.1f}%)" if delta is not None else ""))
+            if (args.threshold is not None and label in GATED and delta is not None
+                    and delta > args.threshold):
+                regressions.append(f"{scenario} @ {size} events: {label} {delta:+.1f}%")
+        print(f"{scenario} @ {size} events")
+        for cell in cells:
+            print(f"    {cell}")
+
+    only = sorted(before.keys() ^ after.keys())
+    if only:
+        print("Not in both reports: " + ", ".join(f"{scenario} @ {size}" for size, scenario in only))
+    if regressions:
+        print(f"Latency regressions above {args.threshold}%:")
+        for regression in regressions:
+            print(f"    {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Stand-in for the Ollama HTTP API with a fixed latency and generation speed
+
+Answers /api/generate the way Ollama does (newline-delimited JSON chunks
+when streaming, one JSON object otherwise) with replies shaped like the
+ones llama3 gives to the system prompt:
+
+    "... every Monday ..."       -> [ADD_EVENT] with a recurrence in the notes
+    "... Monday through Friday"  -> [ADD_EVENT] for a date range
+    anything else                -> one [SUGGEST_EVENT] for tomorrow afternoon
+
+The first token arrives after `latency` seconds, plus the uncached part of
+the prompt over `prefill_tokens_per_second` when that is set. Like Ollama,
+each of `slots` parallel slots remembers its last prompt, and a new prompt
+only pays for what follows the longest prefix it shares with one of them.
+Tokens of about four characters are then sent at `tokens_per_second`.
+Run it on its own to point a real server at:
+
+    python -m bench.fake_ollama --port 11434 --latency 0.5 --tokens-per-second 30
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CURRENT_DATE = re.compile(r"Current date: (\d{4}-\d{2}-\d{2})")
+# Characters per streamed token, matching context.estimate_tokens
+TOKEN_CHARS = 4
+
+
+def _next_weekday(today, weekday):
+    return today + datetime.timedelta(days=(weekday - today.weekday()) % 7 or 7)
+
+
+def reply_for(prompt):
+    """Model output for a rendered chat prompt, based on its last line"""
+    lines = prompt.rstrip().splitlines()
+    message = lines[-1].lower() if lines else ""
+    dates = CURRENT_DATE.findall(prompt)
+    today = datetime.date.fromisoformat(dates[-1]) if dates else datetime.date.today()
+    monday = _next_weekday(today, 0)
+    if "every" in message:
+        return ("Done, I've set up the recurring workout.\n"
+                f"[ADD_EVENT]Workout|{monday}|07:00|08:00|Repeat every Monday and Thursday for 8 weeks[/ADD_EVENT]")
+    if " through " in message:
+        friday = monday + datetime.timedelta(days=4)
+        return ("I've blocked out the conference week.\n"
+                f"[ADD_EVENT]Conference|{monday} to {friday}|09:00|17:00|Offsite[/ADD_EVENT]")
+    tomorrow = today + datetime.timedelta(days=1)
+    return ("You're free tomorrow afternoon. Want me to add it?\n"
+            f"[SUGGEST_EVENT]Planning session|{tomorrow}|14:00|15:00|[/SUGGEST_EVENT]")
+
+
+def tokenize(text):
+    return [text[i:i + TOKEN_CHARS] for i in range(0, len(text), TOKEN_CHARS)]
+
+
+class FakeOllama:
+    """Threaded fake Ollama server; `start()` returns its base URL"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, tokens_per_second=40.0,
+                 prefill_tokens_per_second=0.0, model="llama3", slots=2):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.model = model
+        self.slots = max(1, slots)
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.prefill_tokens = 0
+        # Last prompt of each slot, most recently used last
+        self._cached_prompts = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def generate(self, body):
+        """Yield the response chunks for one /api/generate body, sleeping as the model would"""
+        prompt = body.get("prompt", "")
+        prompt_tokens = (len(prompt) + TOKEN_CHARS - 1) // TOKEN_CHARS
+        with self._lock:
+            prefill_tokens = (len(prompt) - self._reuse_slot(prompt) + TOKEN_CHARS - 1) // TOKEN_CHARS
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.prefill_tokens += prefill_tokens
+        tokens = tokenize(reply_for(prompt))
+        num_predict = (body.get("options") or {}).get("num_predict")
+        if num_predict and num_predict > 0:
+            tokens = tokens[:num_predict]
+
+        started = time.perf_counter()
+        prefill = self.latency
+        if self.prefill_tokens_per_second > 0:
+            prefill += prefill_tokens / self.prefill_tokens_per_second
+        time.sleep(prefill)
+        first_token = time.perf_counter()
+        for index, token in enumerate(tokens):
+            if self.tokens_per_second > 0:
+                delay = first_token + index / self.tokens_per_second - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield self._chunk(token)
+        finished = time.perf_counter()
+        yield self._chunk("", done=True, prompt_eval_count=prefill_tokens, eval_count=len(tokens),
+                          total_duration=int((finished - started) * 1e9),
+                          prompt_eval_duration=int((first_token - started) * 1e9),
+                          eval_duration=int((finished - first_token) * 1e9))
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "prompt_tokens": self.prompt_tokens,
+                    "prefill_tokens": self.prefill_tokens}
+
+    def _reuse_slot(self, prompt):
+        """Take the slot sharing the longest prefix with `prompt`; returns that prefix's length"""
+        best, best_length = None, 0
+        for index, cached in enumerate(self._cached_prompts):
+            length = len(os.path.commonprefix([cached, prompt]))
+            if best is None or length > best_length:
+                best, best_length = index, length
+        if best_length or len(self._cached_prompts) >= self.slots:
+            # With no shared prefix this is the least recently used slot
+            del self._cached_prompts[best]
+        self._cached_prompts.append(prompt)
+        return best_length
+
+    def _chunk(self, text, done=False, **stats):
+        chunk = {
+            "model": self.model,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "response": text,
+            "done": done,
+        }
+        if done:
+            chunk.update(done_reason="stop", load_duration=0, **stats)
+        return chunk
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": f"{self.server.fake.model}:latest",
+                                         "model": f"{self.server.fake.model}:latest"}]})
+        elif self.path == "/":
+            self._send_body(b"Ollama is running", "text/plain")
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json({"error": "invalid JSON"}, 400)
+            return
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, 404)
+            return
+        chunks = self.server.fake.generate(body)
+        if body.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in chunks:
+                data = json.dumps(chunk).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        else:
+            chunks = list(chunks)
+            final = chunks[-1]
+            final["response"] = "".join(chunk["response"] for chunk in chunks)
+            self._send_json(final)
+
+    def _send_json(self, data, status=200):
+        self._send_body(json.dumps(data).encode(), "application/json", status)
+
+    def _send_body(self, data, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0, help="generation speed, 0 for no delay")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="prompt processing speed added to the latency, 0 to ignore prompt length")
+    parser.add_argument("--slots", type=int, default=2, help="parallel slots, each caching its last prompt")
+    parser.add_argument("--model", default="llama3")
+    args = parser.parse_args()
+    fake = FakeOllama(args.host, args.port, args.latency, args.tokens_per_second,
+                      args.prefill_tokens_per_second, args.model, args.slots)
+    print(f"Fake Ollama listening on {fake.url}")
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
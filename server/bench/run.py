@@ -0,0 +1,367 @@
+"""Load scenarios for the calendar server against a fake Ollama
+
+For each calendar size, a user is seeded with synthetic events and every
+scenario is run through the real HTTP stack (the Flask app on a local
+werkzeug server, called with httpx). The report is JSON with one entry per
+(size, scenario): p50/p95/p99 latency, throughput, resident memory and the
+bytes this process wrote to disk per operation, plus the commit and settings
+it was measured with, so two runs can be put side by side with bench.compare:
+
+    cd server
+    python -m bench.run --sizes 10,1000,100000 --output before.json
+    git checkout my-branch
+    python -m bench.run --sizes 10,1000,100000 --output after.json
+    python -m bench.compare before.json after.json
+
+Server settings come from the usual environment variables; the calendar and
+memory databases go to a temporary directory unless CALENDAR_DB is set. RSS
+and bytes written cover the whole benchmark process, which also runs the
+client and the fake model. Bytes written are read from /proc/self/io and are
+null on platforms without it.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+from bench.calendars import generate_events, seed_calendar  # noqa: E402
+from bench.fake_ollama import FakeOllama  # noqa: E402
+
+DEFAULT_SIZES = "10,1000,10000"
+
+
+class BenchContext:
+    """What the scenarios need: an HTTP client, the store and the seeded user"""
+
+    def __init__(self, client, store, user_id, events, seed):
+        self.client = client
+        self.store = store
+        self.user_id = user_id
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.today = datetime.date.today()
+        # Plain events, not series, for the update scenario
+        self.update_ids = [event["id"] for event in events if "rrule" not in event]
+        self.rng.shuffle(self.update_ids)
+        self.delete_ids = []
+
+
+def chat_body(ctx, message):
+    return {"user_id": ctx.user_id, "message": message}
+
+
+# Each scenario is (setup(ctx, count) or None, operation(ctx, i) -> HTTP status).
+# Chat messages are numbered so none is answered from the response cache, and
+# worded so the fast path leaves them to the model.
+
+def chat_suggest(ctx, i):
+    message = f"When could I fit in a planning session with team {i}?"
+    return ctx.client.post("/api/chat", json=chat_body(ctx, message)).status_code
+
+
+def chat_stream(ctx, i):
+    message = f"When could I fit in a review with team {i}?"
+    with ctx.client.stream("POST", "/api/chat/stream", json=chat_body(ctx, message)) as response:
+        for _ in response.iter_bytes():
+            pass
+        return response.status_code
+
+
+def chat_recurring(ctx, i):
+    message = f"Set up workout {i} every Monday and Thursday for 8 weeks"
+    return ctx.client.post("/api/chat", json=chat_body(ctx, message)).status_code
+
+
+def chat_date_range(ctx, i):
+    message = f"Block out conference {i} Monday through Friday next week"
+    return ctx.client.post("/api/chat", json=chat_body(ctx, message)).status_code
+
+
+def events_week(ctx, i):
+    start = ctx.today + datetime.timedelta(days=ctx.rng.randrange(-30, 30))
+    end = start + datetime.timedelta(days=6)
+    params = {"user_id": ctx.user_id, "start": start.isoformat(), "end": end.isoformat()}
+    return ctx.client.get("/api/events", params=params).status_code
+
+
+def events_page(ctx, i):
+    params = {"user_id": ctx.user_id, "limit": 1000}
+    return ctx.client.get("/api/events", params=params).status_code
+
+
+def event_update(ctx, i):
+    event_id = ctx.update_ids[i % len(ctx.update_ids)]
+    body = {"title": f"Renamed {i}", "notes": "bench"}
+    return ctx.client.put(f"/api/events/{event_id}", params={"user_id": ctx.user_id}, json=body).status_code
+
+
+def prepare_deletes(ctx, count):
+    # Delete events added for the purpose, so the calendar keeps its size
+    added = ctx.store.insert_events(ctx.user_id, generate_events(count, ctx.seed + 1, ctx.today))
+    ctx.delete_ids = [event["id"] for event in added]
+
+
+def event_delete(ctx, i):
+    event_id = ctx.delete_ids[i]
+    return ctx.client.delete(f"/api/events/{event_id}", params={"user_id": ctx.user_id}).status_code
+
+
+# In run order: reads first, then writes, then the chat paths that add events
+SCENARIOS = {
+    "events_week": (None, events_week),
+    "events_page": (None, events_page),
+    "event_update": (None, event_update),
+    "event_delete": (prepare_deletes, event_delete),
+    "chat": (None, chat_suggest),
+    "chat_stream": (None, chat_stream),
+    "chat_recurring": (None, chat_recurring),
+    "chat_date_range": (None, chat_date_range),
+}
+
+
+def percentile(sorted_values, fraction):
+    """Linearly interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def bytes_written():
+    """Bytes this process has caused to be written to storage, or None if unknown"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name == "write_bytes":
+                    return int(value)
+    except OSError:
+        pass
+    return None
+
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def database_bytes(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ("", "-wal", "-shm")
+               if os.path.exists(path + suffix))
+
+
+def run_scenario(ctx, name, count, concurrency, warmup, fake=None):
+    setup, operation = SCENARIOS[name]
+    if setup:
+        setup(ctx, warmup + count)
+    for i in range(warmup):
+        operation(ctx, i)
+
+    def timed_operation(i):
+        started = time.perf_counter()
+        try:
+            status = operation(ctx, i)
+        except Exception as e:
+            status = type(e).__name__
+        return time.perf_counter() - started, status
+
+    written_before = bytes_written()
+    model_before = fake.stats() if fake else None
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed_operation, range(warmup, warmup + count)))
+    wall = time.perf_counter() - started
+    written_after = bytes_written()
+    model_after = fake.stats() if fake else None
+
+    latencies = sorted(elapsed for elapsed, _ in outcomes)
+    errors = Counter(str(status) for _, status in outcomes
+                     if not isinstance(status, int) or status >= 400)
+    result = {
+        "scenario": name,
+        "requests": count,
+        "concurrency": concurrency,
+        "errors": dict(errors),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        },
+        "throughput_rps": round(count / wall, 3),
+        "rss_bytes": current_rss(),
+        "peak_rss_bytes": peak_rss(),
+        "bytes_written_per_op": (round((written_after - written_before) / count, 1)
+                                 if written_before is not None else None),
+    }
+    if fake and model_after["requests"] > model_before["requests"]:
+        # Prompt size and the part the fake model could not serve from a cached prefix
+        calls = model_after["requests"] - model_before["requests"]
+        result["model_calls"] = calls
+        result["prompt_tokens_per_call"] = round((model_after["prompt_tokens"] - model_before["prompt_tokens"]) / calls, 1)
+        result["prefill_tokens_per_call"] = round((model_after["prefill_tokens"] - model_before["prefill_tokens"]) / calls, 1)
+    return result
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def start_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the calendar server against a fake Ollama")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"comma-separated calendar sizes in events (default {DEFAULT_SIZES})")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated scenarios to run (default: all)")
+    parser.add_argument("--requests", type=int, default=50, help="measured operations per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured operations before each scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="operations in flight at once")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0, help="fake model generation speed")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="fake model prompt processing speed, 0 to ignore prompt length")
+    parser.add_argument("--model-slots", type=int, default=2,
+                        help="fake model parallel slots, each caching the prefix of its last prompt")
+    parser.add_argument("--ollama-host", help="benchmark against this Ollama instead of the fake one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",") if size]
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="calendar-bench-")
+    fake = None
+    if args.ollama_host:
+        os.environ["OLLAMA_HOST"] = args.ollama_host
+    else:
+        fake = FakeOllama(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                          prefill_tokens_per_second=args.prefill_tokens_per_second, slots=args.model_slots)
+        os.environ["OLLAMA_HOST"] = fake.start()
+    os.environ.setdefault("CALENDAR_DB", os.path.join(workdir, "calendar.db"))
+    os.environ.setdefault("LEGACY_CALENDAR_DIR", workdir)
+    os.environ.setdefault("OLLAMA_WARMUP", "0")
+
+    # The server reads its configuration at import time
+    import httpx
+    import chat_server
+    import config
+    from storage import get_store
+
+    chat_server.initialize()
+    server = start_server(chat_server.app)
+    store = get_store()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    results = []
+    try:
+        with httpx.Client(base_url=base_url, timeout=config.OLLAMA_TIMEOUT + config.LLM_QUEUE_TIMEOUT,
+                          limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            for size in args.sizes:
+                user_id = f"bench-{size}"
+                started = time.perf_counter()
+                events = seed_calendar(store, user_id, size, args.seed)
+                seed_seconds = time.perf_counter() - started
+                print(f"Seeded {size} events in {seed_seconds:.2f}s", file=sys.stderr)
+                ctx = BenchContext(client, store, user_id, events, args.seed)
+                for name in args.scenarios:
+                    result = run_scenario(ctx, name, args.requests, args.concurrency, args.warmup, fake)
+                    result.update(calendar_size=size, seed_seconds=round(seed_seconds, 3),
+                                  database_bytes=database_bytes(config.CALENDAR_DB))
+                    results.append(result)
+                    latency = result["latency_ms"]
+                    print(f"  {name:<16} p50 {latency['p50']:>9.1f}ms  p95 {latency['p95']:>9.1f}ms  "
+                          f"p99 {latency['p99']:>9.1f}ms  {result['throughput_rps']:>8.1f}/s"
+                          + (f"  errors {result['errors']}" if result["errors"] else ""), file=sys.stderr)
+    finally:
+        server.shutdown()
+        if fake:
+            fake.stop()
+
+    report = {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "fake_llm": None if fake is None else {
+                "latency": args.latency,
+                "tokens_per_second": args.tokens_per_second,
+                "prefill_tokens_per_second": args.prefill_tokens_per_second,
+                "slots": args.model_slots,
+            },
+            "ollama_host": args.ollama_host,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "config": {
+                "LLM_CONCURRENCY": config.LLM_CONCURRENCY,
+                "MEMORY_BACKEND": config.MEMORY_BACKEND,
+                "RESPONSE_CACHE_SIZE": config.RESPONSE_CACHE_SIZE,
+                "CONTEXT_TOKEN_BUDGET": config.CONTEXT_TOKEN_BUDGET,
+            },
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
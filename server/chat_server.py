@@ -1,18 +1,30 @@
-from flask import Flask, request, jsonify
+import startup
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import json
-import os
 import datetime
-from datetime import timedelta
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.memory import ConversationBufferMemory
+import os
+import time
+import config
+from admission import QueueFull, create_admission_queue
+from availability import (MAX_SEARCH_DAYS, PREFERENCES, candidate_slots_context, find_conflicts, find_free_slots,
+                          window_minutes)
+from commands import CommandStreamParser, parse_event_commands
+from context import build_calendar_context, estimate_tokens
+import fastpath
+from ics import export_ics, import_ics, read_lines
+from llm import ModelRuntime
+from memory import create_memory_manager
+import metrics
+from metrics import timed
+from prompt_budget import PrefillTracker, PromptBudget
+from recurrence import parse_recurrence
+from scheduler import create_reminder_scheduler
+from response_cache import create_response_cache, make_key
+from storage import BatchError, EventNotFound, VersionConflict, get_store
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
-# Calendar data store
-CALENDAR_FILE = "calendar_events.json"
+CORS(app, expose_headers=["X-Next-Cursor", "X-Calendar-Version", "ETag", "Retry-After", "Server-Timing"])  # Enable CORS for all routes
 
 # Define the system prompt template
 system_template = """
@@ -25,6 +37,7 @@ Event & Task Entry
 - For all-day events, omit the times:
   [SUGGEST_EVENT]Mom's Birthday|2025-05-15||[/SUGGEST_EVENT]
 - Only ask for essential missing information (title, date, or time). Be extremely brief.
+- For requests covering several events (e.g. "block my mornings next week"), give one [SUGGEST_EVENT] per event in a single reply.
 - When the user confirms with "yes", "sure", or "confirm", respond with [ADD_EVENT] using the same format.
 - Do not include explanations, greetings, or extra conversation. Focus strictly on the calendar task.
 
@@ -43,6 +56,7 @@ When Suggesting a Time
   - Preferred time of day (morning, afternoon, evening)?
   - Any known schedule conflicts?
 - Based on availability and urgency, suggest the most appropriate time.
+- When free slots are listed with the request, pick one of them; they already account for existing events.
 - Format the suggestion using [SUGGEST_EVENT].
 - Ask only if truly necessary. Be concise.
 
@@ -71,33 +85,27 @@ Formatting Rules
 - Do not use emojis, small talk, or filler text unless included in the event title or notes.
 """
 
-# Create a global dictionary to store conversation memories for each user
-conversation_memories = {}
+# Long-lived model and prompt chain shared by every chat request, built on first use
+llm_runtime = ModelRuntime(system_template)
+# System prompt and history form a stable prefix; the per-call turn goes last
+budget = PromptBudget(system_template, config.OLLAMA_NUM_CTX, config.PROMPT_RESPONSE_TOKENS)
+prefill_tracker = PrefillTracker(config.MEMORY_MAX_SESSIONS)
 
-def load_calendar_events(user_id="default"):
-    """Load calendar events for a specific user"""
-    filename = f"{user_id}_{CALENDAR_FILE}"
-    if os.path.exists(filename):
-        try:
-            with open(filename, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print(f"Error reading calendar file for user {user_id}. Creating new calendar.")
-            return []
-    return []
-
-def save_calendar_events(events, user_id="default"):
-    """Save calendar events for a specific user"""
-    filename = f"{user_id}_{CALENDAR_FILE}"
-    with open(filename, 'w') as f:
-        json.dump(events, f, indent=2)
-
-def add_event(title, date, start_time, end_time=None, notes=None, is_all_day=False, user_id="default"):
-    """Add a new event to the calendar"""
-    events = load_calendar_events(user_id)
-    
+# Bounded per-user conversation memory with idle eviction
+memory_manager = create_memory_manager()
+
+# Raw model responses for repeated requests, keyed on the calendar version
+response_cache = create_response_cache()
+
+# Limits concurrent model calls and shares the waiting ones fairly between users
+llm_queue = create_admission_queue()
+
+# Fires event reminders to the configured sinks; started by initialize()
+reminder_scheduler = None
+
+def build_event(title, date, start_time, end_time=None, notes=None, is_all_day=False):
+    """Event dict for a single new event"""
     new_event = {
-        "id": len(events) + 1,
         "title": title,
         "date": date,
         "is_all_day": is_all_day,
@@ -111,396 +119,700 @@ def add_event(title, date, start_time, end_time=None, notes=None, is_all_day=Fal
     
     # Add default color
     new_event["color"] = "#4285f4"
-    
-    events.append(new_event)
-    save_calendar_events(events, user_id)
     return new_event
 
-def update_event(event_id, updates, user_id="default"):
+def update_event(event_id, updates, user_id="default", expected_version=None):
     """Update an existing event"""
-    events = load_calendar_events(user_id)
-    for event in events:
-        if event["id"] == event_id:
-            event.update(updates)
-            save_calendar_events(events, user_id)
-            return event
-    return None
+    return get_store().update_event(user_id, event_id, updates, expected_version)
 
-def delete_event(event_id, user_id="default"):
+def delete_event(event_id, user_id="default", expected_version=None):
     """Delete an event"""
-    events = load_calendar_events(user_id)
-    events = [e for e in events if e["id"] != event_id]
-    save_calendar_events(events, user_id)
-    return True
-
-def add_recurring_events(base_event, recurrence_pattern, user_id="default"):
-    """Add recurring events based on pattern"""
-    events = []
-    base_date = datetime.datetime.strptime(base_event["date"], "%Y-%m-%d")
-    
-    if "weekly" in recurrence_pattern.lower():
-        # Add events for each week
-        weeks = 1
-        if "for" in recurrence_pattern.lower():
-            try:
-                weeks = int(recurrence_pattern.lower().split("for")[1].split("week")[0].strip())
-            except:
-                weeks = 1
-        
-        for week in range(weeks):
-            new_date = base_date + timedelta(weeks=week)
-            new_event = base_event.copy()
-            new_event["date"] = new_date.strftime("%Y-%m-%d")
-            new_event["id"] = len(load_calendar_events(user_id)) + len(events) + 1
-            events.append(new_event)
-    
-    return events
+    return get_store().delete_event(user_id, event_id, expected_version)
 
-def add_date_range_events(title, start_date, end_date, start_time=None, end_time=None, notes=None, user_id="default"):
-    """Add events for a date range"""
-    events = []
-    current_date = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.datetime.strptime(end_date, "%Y-%m-%d")
+def build_recurring_series(base_event, recurrence_pattern):
+    """Series for a pattern like "every Monday for 4 weeks"
+
+    The series is stored once and its occurrences are expanded on read.
+    Patterns that do not describe a recurrence give a single event.
+    """
+    base_date = datetime.datetime.strptime(base_event["date"], "%Y-%m-%d").date()
+    series = {key: value for key, value in base_event.items() if key not in ("id", "recurrence")}
     
+    rule = parse_recurrence(recurrence_pattern, base_date)
+    if rule:
+        series["rrule"] = rule
+    return series
+
+def build_date_range_series(title, start_date, end_date, start_time=None, end_time=None, notes=None):
+    """Daily series covering a date range"""
     # Set default work hours if not specified
     if "work" in title.lower():
         start_time = start_time or "09:00"
         end_time = end_time or "17:00"
     
-    while current_date <= end:
-        # Skip weekends if this is a work schedule
-        if "work" in title.lower() and current_date.weekday() >= 5:
-            current_date += timedelta(days=1)
-            continue
-        
-        # Get existing events for this user
-        events_list = load_calendar_events(user_id)
-        
-        new_event = {
-            "id": len(events_list) + len(events) + 1,
-            "title": title,
-            "date": current_date.strftime("%Y-%m-%d"),
-            "is_all_day": not (start_time and end_time),
-            "allDay": not (start_time and end_time),
-            "color": "#4285f4",
-            "notes": notes or ""
-        }
-        
-        if start_time:
-            new_event["startTime"] = start_time
-        if end_time:
-            new_event["endTime"] = end_time
-        
-        events.append(new_event)
-        current_date += timedelta(days=1)
+    rule = {"freq": "daily", "until": end_date}
+    # Skip weekends if this is a work schedule
+    if "work" in title.lower():
+        rule["byday"] = [0, 1, 2, 3, 4]
     
-    # Save all events
-    current_events = load_calendar_events(user_id)
-    current_events.extend(events)
-    save_calendar_events(current_events, user_id)
+    series = {
+        "title": title,
+        "date": start_date,
+        "is_all_day": not (start_time and end_time),
+        "allDay": not (start_time and end_time),
+        "color": "#4285f4",
+        "notes": notes or "",
+        "rrule": rule
+    }
     
-    return events
+    if start_time:
+        series["startTime"] = start_time
+    if end_time:
+        series["endTime"] = end_time
+    return series
+
+def get_or_create_memory(user_id):
+    """Get or create a conversation memory for a user"""
+    return memory_manager.get(user_id)
 
-def parse_event_command(response_text):
-    """Parse event commands from the LLM response"""
-    event_data = None
-    clean_response = response_text
-    event_command = None
+CONFIRM_REPLIES = ["yes", "y", "sure", "confirm", "ok", "okay", "yeah", "yep", "please do", "go ahead"]
+DECLINE_REPLIES = ["no", "n", "nope", "cancel", "don't", "do not"]
+
+def check_pending_event(pending_event):
+    """Raise ValueError unless a client-sent suggestion is one pending_operation can apply"""
+    if not isinstance(pending_event, dict):
+        raise ValueError("Each pending event must be an object")
+    operation = pending_event.get("operation")
+    if not operation:
+        if not isinstance(pending_event.get("title"), str) or not isinstance(pending_event.get("date"), str):
+            raise ValueError("A pending event needs a title and a date")
+        return
+    if (not isinstance(operation, dict) or operation.get("op") not in ("update", "delete")
+            or not isinstance(operation.get("id"), int)
+            or not isinstance(operation.get("date") or "", str)
+            or (operation["op"] == "update" and not isinstance(operation.get("updates"), dict))):
+        raise ValueError("A pending event's operation must be an update or delete of an event id")
+
+def pending_operation(pending_event):
+    """Batch operation applied when the user confirms a pending suggestion
+
+    Plain suggestions add a new event; fast-path deletes and moves carry
+    their own operation.
+    """
+    if pending_event.get("operation"):
+        return pending_event["operation"]
+    return {"op": "create", "event": build_event(
+        title=pending_event["title"],
+        date=pending_event["date"],
+        start_time=pending_event.get("startTime"),
+        end_time=pending_event.get("endTime"),
+        notes=pending_event.get("notes", ""),
+        is_all_day=pending_event.get("is_all_day", pending_event.get("allDay", False))
+    )}
+
+def handle_confirmation(message, pending_events, memory, user_id):
+    """Answer a yes/no reply to pending suggestions directly; returns None for other messages"""
+    if not pending_events:
+        return None
     
-    # Check for SUGGEST_EVENT command
-    if "[SUGGEST_EVENT]" in response_text:
+    if message.lower() in CONFIRM_REPLIES:
+        # Apply every pending suggestion in one write instead of asking the AI to do it
+        operations = [pending_operation(pending_event) for pending_event in pending_events]
         try:
-            # Extract the event data between the command markers
-            event_data = response_text.split("[SUGGEST_EVENT]")[1].split("[/SUGGEST_EVENT]")[0].strip()
-            # Remove the command markers from the response
-            clean_response = response_text.replace(f"[SUGGEST_EVENT]{event_data}[/SUGGEST_EVENT]", "").strip()
-            event_command = "suggest"
-            
-            # Parse the event data
-            parts = event_data.split("|")
-            
-            # Handle date ranges and recurring patterns
-            date_str = parts[1].strip()
-            start_date = None
-            end_date = None
-            recurrence = None
-            
-            # Check for date range (e.g., "2024-03-18 to 2024-03-22")
-            if " to " in date_str:
-                start_date_str, end_date_str = date_str.split(" to ")
-                start_date = normalize_date(start_date_str)
-                end_date = normalize_date(end_date_str)
-            else:
-                start_date = normalize_date(date_str)
-                # For work schedules that mention "next week", automatically set end date to Friday
-                if "next week" in date_str.lower() and "work" in parts[0].lower():
-                    start_date_obj = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-                    # Calculate the following Friday
-                    days_to_friday = 4 - start_date_obj.weekday()  # Friday is 4
-                    if days_to_friday < 0:
-                        days_to_friday += 7
-                    end_date = (start_date_obj + timedelta(days=days_to_friday)).strftime("%Y-%m-%d")
-            
-            # Check for recurring pattern in notes
-            if len(parts) > 4 and parts[4]:
-                notes = parts[4].strip()
-                if "repeat" in notes.lower() or "every" in notes.lower() or "weekly" in notes.lower():
-                    recurrence = notes
-            
-            is_all_day = len(parts) <= 3 or not parts[2].strip()
-            
-            # For work schedules, set default times if not specified
-            if "work" in parts[0].lower() and is_all_day:
-                is_all_day = False
-                parts.extend(["09:00", "17:00"] if len(parts) <= 3 else [])
-            
-            event = {
-                "title": parts[0].strip(),
-                "date": start_date,
-                "is_all_day": is_all_day,
-                "allDay": is_all_day,
-                "color": "#4285f4"
+            results = get_store().apply_batch(user_id, operations)
+        except EventNotFound:
+            response = "That event has changed since it was suggested; nothing was changed."
+        except BatchError as e:
+            response = f"I couldn't save that suggestion ({e.reason}); nothing was changed."
+        else:
+            response = None
+        if response:
+            memory.add_user_message(message)
+            memory.add_ai_message(response)
+            return {
+                "response": response,
+                "event_added": False,
+                "event_suggested": False,
+                "event_data": None,
+                "event_suggestions": [],
+                "add_result": None,
+                "add_results": []
             }
-            
-            if len(parts) > 2 and parts[2].strip():
-                event["startTime"] = parts[2].strip()
-            if len(parts) > 3 and parts[3].strip():
-                event["endTime"] = parts[3].strip()
-            if len(parts) > 4:
-                event["notes"] = parts[4].strip()
-            
-            # Add additional metadata for date ranges and recurrence
-            if end_date:
-                event["end_date"] = end_date
-            if recurrence:
-                event["recurrence"] = recurrence
-            
-            return event, clean_response, event_command
+        added = [result for operation, result in zip(operations, results) if operation["op"] == "create"]
+        updated = [result for operation, result in zip(operations, results) if operation["op"] == "update"]
+        deleted = [pending_event for operation, pending_event in zip(operations, pending_events)
+                   if operation["op"] == "delete"]
+        
+        # Store the message in the AI's context too
+        done = [f"added {event['title']} on {event['date']}" for event in added]
+        done += [f"moved {event['title']} to {event['date']}" for event in updated]
+        done += [f"deleted {event['title']} on {event['date']}" for event in deleted]
+        memory.add_user_message(message)
+        if updated or deleted:
+            memory.add_ai_message(f"I've updated your calendar: {', '.join(done)}.")
+            response = f"Done: {', '.join(done)}."
+        else:
+            listed = ", ".join(f"{event['title']} on {event['date']}" for event in added)
+            memory.add_ai_message(f"I've added {'the event' if len(added) == 1 else 'these events'} to your calendar: {listed}.")
+            response = "Event added to calendar." if len(added) == 1 else f"{len(added)} events added to calendar."
+        return {
+            "response": response,
+            "event_added": bool(added),
+            "event_suggested": False,
+            "event_updated": bool(updated),
+            "event_deleted": bool(deleted),
+            "event_data": None,
+            "event_suggestions": [],
+            "add_result": added[0] if added else None,
+            "add_results": added
+        }
+    
+    if message.lower() in DECLINE_REPLIES:
+        # Store the message in the AI's context
+        memory.add_user_message(message)
+        memory.add_ai_message("I've cancelled the event creation.")
+        
+        return {
+            "response": "Event cancelled.",
+            "event_added": False,
+            "event_suggested": False,
+            "event_data": None,
+            "event_suggestions": [],
+            "add_result": None,
+            "add_results": []
+        }
+    
+    return None
+
+def handle_fast_path(message, memory, user_id):
+    """Answer simple add/delete/move commands without the LLM; returns None otherwise"""
+    result = fastpath.try_fast_path(get_store(), user_id, message)
+    if result:
+        memory.add_user_message(message)
+        memory.add_ai_message(result["response"])
+    return result
+
+def response_cache_key(message, memory, user_id, pending_events=None):
+    """Cache key for a chat request; changes whenever the calendar or conversation does"""
+    return make_key(
+        user_id,
+        message,
+        memory.history,
+        datetime.date.today().isoformat(),
+        get_store().current_version(user_id),
+        pending_events,
+        config.RESPONSE_CACHE_HISTORY_MESSAGES,
+    )
+
+def cache_response(cache_key, response, commands):
+    # Responses that added events are never replayed
+    if all(command != "add" for command, _ in commands):
+        try:
+            response_cache.put(cache_key, response)
         except Exception as e:
-            print(f"Error parsing suggest event command: {e}")
-            return None, response_text, None
+            # The answer is still good; only its reuse is lost
+            print(f"Error caching response: {e}")
+
+def build_turn_sections(message, user_id, pending_event=None):
+    """The parts of the prompt that change every call: date, calendar context, free slots and message
+
+    They make up the final human turn, after the system prompt and history,
+    so everything before them stays a byte-identical prefix across turns.
+    """
+    # Add current date context to help with relative date references
+    today = datetime.datetime.now()
+    current_date_context = f"Current date: {today.strftime('%Y-%m-%d')} ({today.strftime('%A')})\n"
     
-    # Check for ADD_EVENT command (similar logic as SUGGEST_EVENT)
-    if "[ADD_EVENT]" in response_text:
-        # ... (same logic as SUGGEST_EVENT, just change the command name)
-        return None, response_text, None
+    # Only the events around the dates in play, within a fixed token budget
+    store = get_store()
+    context = build_calendar_context(store, user_id, message, pending_event, today=today.date())
     
-    return None, clean_response, None
+    # Free slots computed server-side, so the model does not have to work out availability
+    slots_context = candidate_slots_context(store, user_id, message, today)
+    
+    return [
+        ("date", current_date_context),
+        ("calendar", context.text),
+        ("slots", slots_context),
+        ("message", f"\n{message}"),
+    ]
+
+def build_prompt(message, user_id, memory, pending_event=None):
+    """History and current turn fitted into the model's context window, as a PromptPlan"""
+    return budget.fit(memory.history, build_turn_sections(message, user_id, pending_event))
 
-def normalize_date(date_str):
-    """Ensure date is current or future, not in the past"""
+def event_for_command(event_data):
+    """What to store for an [ADD_EVENT] command: a single event or a series"""
+    # Handle date ranges and recurring events
+    if "end_date" in event_data:
+        return build_date_range_series(
+            title=event_data["title"],
+            start_date=event_data["date"],
+            end_date=event_data["end_date"],
+            start_time=event_data.get("startTime", "09:00"),  # Default to 9 AM for work events
+            end_time=event_data.get("endTime", "17:00"),     # Default to 5 PM for work events
+            notes=event_data.get("notes", "")
+        )
+    if "recurrence" in event_data:
+        return build_recurring_series(event_data, event_data["recurrence"])
+    return build_event(
+        title=event_data["title"],
+        date=event_data["date"],
+        start_time=event_data.get("startTime"),
+        end_time=event_data.get("endTime"),
+        notes=event_data.get("notes", ""),
+        is_all_day=event_data["is_all_day"]
+    )
+
+def apply_event_commands(commands, user_id):
+    """Store the events of every [ADD_EVENT] command in one write; returns what each added
+
+    Series (date ranges and recurrences) are reported as a one-element list,
+    single events as the event itself.
+    """
+    adds = [event_data for command, event_data in commands if command == "add"]
+    if not adds:
+        return []
+    stored = get_store().insert_events(user_id, [event_for_command(event_data) for event_data in adds])
+    return [
+        [event] if ("end_date" in event_data or "recurrence" in event_data) else event
+        for event_data, event in zip(adds, stored)
+    ]
+
+def chat_result(clean_response, commands, add_results):
+    """Build the /api/chat response body
+
+    event_data and add_result describe the first command, as before; every
+    suggestion is listed in event_suggestions.
+    """
+    suggestions = [event_data for command, event_data in commands if command == "suggest"]
+    first_command, first_event = commands[0] if commands else (None, None)
+    return {
+        "response": clean_response,
+        "event_added": bool(add_results),
+        "event_suggested": bool(suggestions),
+        "event_data": suggestions[0] if suggestions else first_event,
+        "event_suggestions": suggestions,
+        "add_result": add_results[0] if add_results else None,
+        "add_results": add_results
+    }
+
+def read_chat_request():
+    """Extract (user_id, message, pending_events) from a chat request body
+
+    Clients send either `pending_events` (every open suggestion) or the
+    older single `pending_event`. Raises ValueError for a body or pending
+    events that handle_confirmation could not apply.
+    """
+    data = request.json
+    if not isinstance(data, dict):
+        raise ValueError("The body must be a JSON object")
+    pending_events = data.get('pending_events') or []
+    if not pending_events and data.get('pending_event'):
+        pending_events = [data['pending_event']]
+    if not isinstance(pending_events, list):
+        raise ValueError("pending_events must be a list")
+    for pending_event in pending_events:
+        check_pending_event(pending_event)
+    return data.get('user_id', 'default'), data.get('message', ''), pending_events
+
+def record_prompt_metrics(user_id, plan):
+    """Sizes that drive model latency: prompt tokens per section, the part that must be
+    prefilled, history length and calendar size"""
+    reused, prefilled = prefill_tracker.observe(user_id, plan)
+    metrics.PROMPT_TOKENS.observe(reused + prefilled)
+    metrics.PREFILL_TOKENS.inc(reused, kind="reused")
+    metrics.PREFILL_TOKENS.inc(prefilled, kind="prefilled")
+    for section, tokens in plan.sections.items():
+        metrics.PROMPT_SECTION_TOKENS.observe(tokens, section=section)
+    metrics.MEMORY_MESSAGES.observe(len(plan.history))
+    metrics.CALENDAR_EVENTS.observe(get_store().count_events(user_id))
+
+def invoke_model(user_id, plan):
+    """Run the chain once a model slot is free; raises QueueFull under overload"""
+    with timed("queue"):
+        llm_queue.acquire(user_id)
+    started = time.monotonic()
     try:
-        # Handle "next week" references
-        if "next week" in date_str.lower():
-            current_date = datetime.datetime.now()
-            # Calculate days until next Monday
-            days_until_monday = (7 - current_date.weekday()) % 7
-            if days_until_monday == 0:  # If today is Monday
-                days_until_monday = 7   # Go to next Monday
-            next_monday = current_date + timedelta(days=days_until_monday)
-            return next_monday.strftime("%Y-%m-%d")
-        
-        # Parse the date string
-        date_parts = date_str.split('-')
-        
-        # Handle YYYY-MM-DD format
-        if len(date_parts) == 3 and len(date_parts[0]) == 4:
-            year, month, day = map(int, date_parts)
-            input_date = datetime.date(year, month, day)
-            
-            # If date is in the past, adjust to current year or next occurrence
-            current_date = datetime.datetime.now().date()
-            
-            if input_date < current_date:
-                # Try with current year first
-                current_year = current_date.year
-                try:
-                    adjusted_date = datetime.date(current_year, month, day)
-                    # If still in the past, use next year
-                    if adjusted_date < current_date:
-                        adjusted_date = datetime.date(current_year + 1, month, day)
-                    return adjusted_date.isoformat()
-                except ValueError:
-                    # Handle Feb 29 and similar edge cases
-                    return current_date.isoformat()
-            
-            return date_str
-        else:
-            # For non-standard formats, return as is but log warning
-            print(f"Warning: Non-standard date format: {date_str}")
-            return date_str
-            
+        with timed("llm"):
+            response = llm_runtime.chain().invoke({"history": plan.history, "input": plan.input})
     except Exception as e:
-        print(f"Error normalizing date {date_str}: {e}")
-        # If parsing fails, return current date as fallback
-        return datetime.datetime.now().date().isoformat()
-
-def get_or_create_memory(user_id):
-    """Get or create a conversation memory for a user"""
-    if user_id not in conversation_memories:
-        conversation_memories[user_id] = ConversationBufferMemory(return_messages=True)
-    return conversation_memories[user_id]
+        metrics.OLLAMA_ERRORS.inc(error=type(e).__name__)
+        raise
+    finally:
+        llm_queue.release(time.monotonic() - started)
+    metrics.RESPONSE_TOKENS.observe(estimate_tokens(response))
+    return response
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    data = request.json
-    
-    user_id = data.get('user_id', 'default')
-    message = data.get('message', '')
-    pending_event = data.get('pending_event', None)
+    try:
+        user_id, message, pending_events = read_chat_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     if not message:
         return jsonify({"error": "No message provided"}), 400
     
     try:
-        # Initialize Ollama model
-        model = OllamaLLM(model="llama3")
-        
         # Get or create user memory
-        memory = get_or_create_memory(user_id)
-        
-        # Create prompt template with memory
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_template),
-            MessagesPlaceholder(variable_name="history"),
-            ("human", "{input}")
-        ])
-        
-        # Create conversation chain
-        chain = prompt | model
-        
-        # Get current calendar events to provide context
-        events = load_calendar_events(user_id)
-        events_context = f"Current calendar events: {json.dumps(events)}\n" if events else "No events in calendar.\n"
-        
-        # Add current date context to help with relative date references
-        today = datetime.datetime.now()
-        current_date_context = f"Current date: {today.strftime('%Y-%m-%d')} ({today.strftime('%A')})\n"
-        
-        # Check if the user is confirming a pending event
-        confirmation_input = ""
-        event_added = False
-        add_result = None
+        with timed("memory_load"):
+            memory = get_or_create_memory(user_id)
         
         # Directly handle confirmations for better user experience
-        if pending_event and message.lower() in ["yes", "y", "sure", "confirm", "ok", "okay", "yeah", "yep", "please do", "go ahead"]:
-            # Directly add the event instead of asking the AI to do it
-            add_result = add_event(
-                title=pending_event["title"],
-                date=pending_event["date"],
-                start_time=pending_event.get("startTime"),
-                end_time=pending_event.get("endTime"),
-                notes=pending_event.get("notes", ""),
-                is_all_day=pending_event.get("is_all_day", pending_event.get("allDay", False)),
-                user_id=user_id
-            )
-            event_added = True
-            confirmation_input = "\nEvent added to calendar."
-            
-            # Store the message in the AI's context too
-            memory.chat_memory.add_user_message(message)
-            memory.chat_memory.add_ai_message(f"I've added the event to your calendar: {pending_event['title']} on {pending_event['date']}.")
-            
-            return jsonify({
-                "response": "Event added to calendar.",
-                "event_added": True,
-                "event_suggested": False,
-                "event_data": None,
-                "add_result": add_result
-            })
-        elif pending_event and message.lower() in ["no", "n", "nope", "cancel", "don't", "do not"]:
-            # User declined
-            confirmation_input = f"\nUser declined to add the event: {json.dumps(pending_event)}."
-            # Store the message in the AI's context
-            memory.chat_memory.add_user_message(message)
-            memory.chat_memory.add_ai_message("I've cancelled the event creation.")
-            
-            return jsonify({
-                "response": "Event cancelled.",
-                "event_added": False,
-                "event_suggested": False,
-                "event_data": None,
-                "add_result": None
-            })
-        
-        # Combine user input with calendar context and any confirmation context
-        augmented_input = f"{current_date_context}{events_context}\n{message}{confirmation_input}"
+        with timed("confirmation"):
+            confirmation = handle_confirmation(message, pending_events, memory, user_id)
+        if confirmation:
+            metrics.CHAT_REQUESTS.inc(answered_by="confirmation")
+            return jsonify(confirmation)
         
-        # Get conversation history
-        history = memory.chat_memory.messages
+        # Simple commands are parsed by rules, skipping the model round trip
+        with timed("fast_path"):
+            fast_result = handle_fast_path(message, memory, user_id)
+        if fast_result:
+            metrics.CHAT_REQUESTS.inc(answered_by="fast_path")
+            return jsonify(fast_result)
         
-        # Run the chain with user input and history
-        response = chain.invoke({
-            "history": history,
-            "input": augmented_input
-        })
-        
-        # Parse any event commands in the response
-        event_data, clean_response, event_command = parse_event_command(response)
+        # Reuse the answer to an identical request against the same calendar
+        with timed("cache"):
+            cache_key = response_cache_key(message, memory, user_id, pending_events)
+            response = response_cache.get(cache_key)
+        if response is None:
+            with timed("context"):
+                plan = build_prompt(message, user_id, memory, pending_events[0] if pending_events else None)
+            record_prompt_metrics(user_id, plan)
+            response = invoke_model(user_id, plan)
+            metrics.CHAT_REQUESTS.inc(answered_by="model")
+        else:
+            metrics.CHAT_REQUESTS.inc(answered_by="cache")
         
-        # Process based on command type
-        if event_command == "add" and event_data:
-            # Handle date ranges and recurring events
-            if "end_date" in event_data:
-                # Add events for date range
-                events = add_date_range_events(
-                    title=event_data["title"],
-                    start_date=event_data["date"],
-                    end_date=event_data["end_date"],
-                    start_time=event_data.get("startTime", "09:00"),  # Default to 9 AM for work events
-                    end_time=event_data.get("endTime", "17:00"),     # Default to 5 PM for work events
-                    notes=event_data.get("notes", ""),
-                    user_id=user_id
-                )
-                add_result = events
-                event_added = True
-            elif "recurrence" in event_data:
-                # Add recurring events
-                events = add_recurring_events(event_data, event_data["recurrence"], user_id)
-                add_result = events
-                event_added = True
-            else:
-                # Add single event
-                add_result = add_event(
-                    title=event_data["title"],
-                    date=event_data["date"],
-                    start_time=event_data.get("startTime"),
-                    end_time=event_data.get("endTime"),
-                    notes=event_data.get("notes", ""),
-                    is_all_day=event_data["is_all_day"],
-                    user_id=user_id
-                )
-                event_added = True
+        # Parse every event command in the response; all additions go in one write
+        with timed("parse"):
+            commands, clean_response = parse_event_commands(response)
+        with timed("store"):
+            add_results = apply_event_commands(commands, user_id)
+            cache_response(cache_key, response, commands)
         
         # Store conversation
-        memory.chat_memory.add_user_message(message)
-        memory.chat_memory.add_ai_message(clean_response)
+        with timed("memory_save"):
+            memory.add_user_message(message)
+            memory.add_ai_message(clean_response)
         
+        return jsonify(chat_result(clean_response, commands, add_results))
+    
+    except QueueFull as e:
+        metrics.CHAT_REQUESTS.inc(answered_by="busy")
+        return busy_response(e)
+    except Exception as e:
+        metrics.CHAT_REQUESTS.inc(answered_by="error")
         return jsonify({
-            "response": clean_response,
-            "event_added": event_command == "add" and event_data is not None,
-            "event_suggested": event_command == "suggest" and event_data is not None,
-            "event_data": event_data,
-            "add_result": add_result
-        })
+            "error": str(e),
+            "response": "Error processing request. Try again."
+        }), 500
+
+def busy_response(e):
+    """429 telling the client when the model is likely to have room again"""
+    response = jsonify({
+        "error": str(e),
+        "response": "The assistant is busy. Try again in a few seconds."
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def sse(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming variant of /api/chat that forwards tokens as they are generated
+
+    Emits `token` events with response text, `event_suggested` as soon as a
+    suggestion block closes, one `event_added` once the response is complete
+    and its additions have been stored in a single write, and a final `done`
+    event carrying the same body /api/chat would return.
+    """
+    try:
+        user_id, message, pending_events = read_chat_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+    
+    try:
+        with timed("memory_load"):
+            memory = get_or_create_memory(user_id)
+        with timed("confirmation"):
+            early_result = handle_confirmation(message, pending_events, memory, user_id)
+        answered_by = "confirmation"
+        if early_result is None:
+            with timed("fast_path"):
+                early_result = handle_fast_path(message, memory, user_id)
+            answered_by = "fast_path"
+        cache_key = cached = plan = None
+        if early_result is None:
+            with timed("cache"):
+                cache_key = response_cache_key(message, memory, user_id, pending_events)
+                cached = response_cache.get(cache_key)
+            answered_by = "cache"
+        # Take a model slot before the response starts, so overload is still a plain 429
+        holds_slot = early_result is None and cached is None
+        if holds_slot:
+            with timed("context"):
+                plan = build_prompt(message, user_id, memory, pending_events[0] if pending_events else None)
+            record_prompt_metrics(user_id, plan)
+            with timed("queue"):
+                llm_queue.acquire(user_id)
+            slot_taken = time.monotonic()
+            answered_by = "model"
+        metrics.CHAT_REQUESTS.inc(answered_by=answered_by)
+    except QueueFull as e:
+        metrics.CHAT_REQUESTS.inc(answered_by="busy")
+        return busy_response(e)
     except Exception as e:
+        metrics.CHAT_REQUESTS.inc(answered_by="error")
         return jsonify({
             "error": str(e),
             "response": "Error processing request. Try again."
         }), 500
+    
+    def generate():
+        if early_result:
+            yield sse("done", early_result)
+            return
+        model_done = False
+        try:
+            parser = CommandStreamParser()
+            commands = []
+            if cached is not None:
+                chunks = [cached]
+            else:
+                chunks = llm_runtime.chain().stream({"history": plan.history, "input": plan.input})
+            raw_chunks = []
+            started = time.perf_counter()
+            for chunk in chunks:
+                if not raw_chunks and cached is None:
+                    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm_first_token")
+                raw_chunks.append(chunk)
+                for item in parser.feed(chunk):
+                    if item[0] == "text":
+                        yield sse("token", {"text": item[1]})
+                    else:
+                        _, command, event_data, _ = item
+                        commands.append((command, event_data))
+                        if command == "suggest":
+                            yield sse("event_suggested", {"event_data": event_data})
+            model_done = True
+            for _, text in parser.close():
+                yield sse("token", {"text": text})
+            if cached is None:
+                metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm")
+                metrics.RESPONSE_TOKENS.observe(estimate_tokens("".join(raw_chunks)))
+            
+            # Additions are stored together once the whole response is in
+            add_results = apply_event_commands(commands, user_id)
+            if add_results:
+                added = [event_data for command, event_data in commands if command == "add"]
+                yield sse("event_added", {"event_data": added[0], "add_result": add_results[0],
+                                          "add_results": add_results})
+            cache_response(cache_key, "".join(raw_chunks), commands)
+            
+            # Store conversation
+            memory.add_user_message(message)
+            memory.add_ai_message(parser.clean_text)
+            
+            yield sse("done", chat_result(parser.clean_text, commands, add_results))
+        except Exception as e:
+            if holds_slot and not model_done:
+                metrics.OLLAMA_ERRORS.inc(error=type(e).__name__)
+            yield sse("error", {
+                "error": str(e),
+                "response": "Error processing request. Try again."
+            })
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable proxy buffering so tokens arrive immediately
+    })
+    if holds_slot:
+        # Runs when the stream finishes or the client goes away
+        response.call_on_close(lambda: llm_queue.release(time.monotonic() - slot_taken))
+    return response
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count and time every request; streamed responses are timed until their headers are sent"""
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=endpoint)
+    metrics.REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    if config.SERVER_TIMING and g.get("stage_timings"):
+        response.headers['Server-Timing'] = metrics.server_timing_header(g.stage_timings)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    return jsonify({"memory": memory_manager.stats(), "fastpath": fastpath.stats.snapshot(),
+                    "response_cache": response_cache.stats(),
+                    "llm_queue": llm_queue.stats(), "prompt": prefill_tracker.stats(),
+                    "startup": startup.report.as_dict(),
+                    "reminders": reminder_scheduler.stats() if reminder_scheduler else None})
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness probe: the process is up and serving requests"""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness probe: 200 once the model is loaded and Ollama answers, 503 until then"""
+    ready, reason = llm_runtime.readiness()
+    return jsonify({"ready": ready, "reason": reason, "startup": startup.report.as_dict()}), 200 if ready else 503
+
+@app.route('/api/availability', methods=['GET'])
+def get_availability():
+    """Find the first free slots of a given length between two dates"""
+    user_id = request.args.get('user_id', 'default')
+    try:
+        start = parse_date_param('start')
+        end = parse_date_param('end')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    duration = request.args.get('duration', 60, type=int)
+    count = request.args.get('count', 3, type=int)
+    preference = request.args.get('preference', 'any')
+    if not 0 < count <= 50 or preference not in PREFERENCES:
+        return jsonify({"error": "Invalid count or preference"}), 400
+    if not 0 < duration <= window_minutes(preference):
+        return jsonify({"error": f"duration must be between 1 and {window_minutes(preference)} minutes for {preference}"}), 400
+    
+    # Never offer slots in the past
+    now = datetime.datetime.now()
+    start_time = max(now, datetime.datetime.fromisoformat(start)) if start else now
+    try:
+        end_time = (datetime.datetime.fromisoformat(end) + datetime.timedelta(days=1)) if end else start_time + datetime.timedelta(days=7)
+    except OverflowError:
+        return jsonify({"error": "Date out of range"}), 400
+    if end_time - start_time > datetime.timedelta(days=MAX_SEARCH_DAYS):
+        return jsonify({"error": f"Search at most {MAX_SEARCH_DAYS} days at a time"}), 400
+    
+    slots = find_free_slots(get_store(), user_id, start_time, end_time, duration, count, preference)
+    return jsonify({"slots": slots})
+
+@app.route('/api/availability/conflicts', methods=['GET'])
+def get_conflicts():
+    """List the events overlapping a proposed time"""
+    user_id = request.args.get('user_id', 'default')
+    try:
+        date = parse_date_param('date')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    start_time = request.args.get('startTime')
+    if not date or not start_time:
+        return jsonify({"error": "date and startTime are required"}), 400
+    proposed = {"date": date, "startTime": start_time, "endTime": request.args.get('endTime')}
+    return jsonify({"conflicts": find_conflicts(get_store(), user_id, proposed)})
+
+def with_version_headers(response, version):
+    """Tag an events response with the calendar version it reflects"""
+    response.set_etag(str(version))
+    response.headers['X-Calendar-Version'] = str(version)
+    # Let clients cache the body but always revalidate it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def parse_date_param(name):
+    """Read an optional YYYY-MM-DD query parameter"""
+    value = request.args.get(name)
+    if value:
+        datetime.datetime.strptime(value, "%Y-%m-%d")
+    return value
+
+def parse_if_match():
+    """Calendar version from an If-Match header, or None to write unconditionally"""
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    tags = request.if_match.as_set()
+    if len(tags) != 1:
+        raise ValueError("If-Match must name a single calendar version")
+    try:
+        return int(tags.pop())
+    except ValueError:
+        raise ValueError("If-Match must be a calendar version from ETag") from None
+
+@app.errorhandler(VersionConflict)
+def version_conflict(e):
+    """A conditional write lost the race; the client should refetch and retry"""
+    response = jsonify({"error": "Calendar changed since the version in If-Match", "version": e.current})
+    response.status_code = 412
+    return with_version_headers(response, e.current)
 
 @app.route('/api/events', methods=['GET'])
 def get_events():
     user_id = request.args.get('user_id', 'default')
-    events = load_calendar_events(user_id)
-    return jsonify(events)
+    store = get_store()
+    
+    # An unchanged calendar is answered from the cached version alone
+    version = store.current_version(user_id)
+    if request.if_none_match.contains(str(version)):
+        return with_version_headers(app.response_class(status=304), version)
+    
+    since = request.args.get('since', type=int)
+    if since is not None:
+        return with_version_headers(jsonify(store.changes_since(user_id, since)), version)
+    
+    try:
+        start = parse_date_param('start')
+        end = parse_date_param('end')
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit <= 0:
+            raise ValueError("limit must be positive")
+        if limit:
+            limit = min(limit, config.EVENTS_PAGE_MAX)
+        elif start or end:
+            # Series expand without bound inside a range, so ranges are always paged
+            limit = config.EVENTS_PAGE_MAX
+        events, next_cursor = store.list_events(
+            user_id, start=start, end=end, limit=limit, cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    response = jsonify(events)
+    # The body stays a plain array; the next page is advertised in a header
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return with_version_headers(response, version)
 
 @app.route('/api/events/<int:event_id>', methods=['PUT'])
 def update_event_endpoint(event_id):
     user_id = request.args.get('user_id', 'default')
     updates = request.json
-    result = update_event(event_id, updates, user_id)
+    if not isinstance(updates, dict):
+        return jsonify({"error": "The body must be an object of updates"}), 400
+    try:
+        occurrence_date = parse_date_param('date')
+        expected_version = parse_if_match()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if occurrence_date:
+            # Change a single occurrence of a recurring series
+            result = get_store().detach_occurrence(user_id, event_id, occurrence_date, updates, expected_version)
+        else:
+            result = update_event(event_id, updates, user_id, expected_version)
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
     if result:
         return jsonify(result)
     return jsonify({"error": "Event not found"}), 404
@@ -508,9 +820,84 @@ def update_event_endpoint(event_id):
 @app.route('/api/events/<int:event_id>', methods=['DELETE'])
 def delete_event_endpoint(event_id):
     user_id = request.args.get('user_id', 'default')
-    if delete_event(event_id, user_id):
+    try:
+        occurrence_date = parse_date_param('date')
+        expected_version = parse_if_match()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if occurrence_date:
+        # Remove a single occurrence of a recurring series
+        deleted = get_store().exclude_occurrence(user_id, event_id, occurrence_date, expected_version)
+    else:
+        deleted = delete_event(event_id, user_id, expected_version)
+    if deleted:
         return jsonify({"success": True})
     return jsonify({"error": "Event not found"}), 404
 
+@app.route('/api/events/batch', methods=['POST'])
+def batch_events_endpoint():
+    """Apply a list of creates, updates and deletes atomically in one write"""
+    user_id = request.args.get('user_id', 'default')
+    operations = (request.json or {}).get('operations')
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return jsonify({"error": "operations must be a list of objects"}), 400
+    if len(operations) > config.EVENTS_BATCH_MAX:
+        return jsonify({"error": f"At most {config.EVENTS_BATCH_MAX} operations per batch"}), 400
+    try:
+        expected_version = parse_if_match()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    store = get_store()
+    try:
+        results = store.apply_batch(user_id, operations, expected_version)
+    except BatchError as e:
+        return jsonify({"error": str(e), "index": e.index}), 400
+    return jsonify({"results": results, "version": store.current_version(user_id)})
+
+@app.route('/api/events/import', methods=['POST'])
+def import_events_endpoint():
+    """Import an iCalendar file, sent as the request body or as a multipart upload"""
+    user_id = request.args.get('user_id', 'default')
+    stream = request.stream
+    if request.mimetype == "multipart/form-data":
+        upload = next(iter(request.files.values()), None)
+        if upload is None:
+            return jsonify({"error": "No file uploaded"}), 400
+        stream = upload.stream
+    store = get_store()
+    summary = import_ics(store, user_id, read_lines(stream), config.IMPORT_BATCH_SIZE)
+    summary["version"] = store.current_version(user_id)
+    return jsonify(summary)
+
+@app.route('/api/events/export', methods=['GET'])
+def export_events_endpoint():
+    """Stream a user's calendar as an iCalendar file"""
+    user_id = request.args.get('user_id', 'default')
+    response = Response(export_ics(get_store().iter_events(user_id)), mimetype="text/calendar")
+    response.headers["Content-Disposition"] = 'attachment; filename="calendar.ics"'
+    return response
+
+def initialize():
+    """Prepare the server before it takes requests"""
+    global reminder_scheduler
+    # Open the store up front so legacy JSON calendars are migrated before serving
+    with startup.report.phase("store_open"):
+        store = get_store()
+    reminder_scheduler = create_reminder_scheduler(store)
+    if reminder_scheduler:
+        # Builds its timers from storage on its own thread
+        reminder_scheduler.start()
+    if config.LLM_PRELOAD:
+        # Import the LLM stack off the request path; /readyz reports when it is done
+        llm_runtime.preload(warm=config.OLLAMA_WARMUP)
+
+startup.report.record("app_import", time.perf_counter() - startup.IMPORT_STARTED)
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    # Development server; use wsgi.py with gunicorn in production.
+    # The reloader runs this file in a watcher process and again in the child
+    # that serves requests (WERKZEUG_RUN_MAIN set); only the child starts the
+    # preload, the warm-up and the reminder scheduler
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        initialize()
+    app.run(debug=True, port=5000, threaded=True) 
\ No newline at end of file
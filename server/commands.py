@@ -0,0 +1,206 @@
+"""Parsing of [SUGGEST_EVENT] and [ADD_EVENT] commands in LLM responses"""
+import datetime
+from datetime import timedelta
+
+# Opening tag -> (command name, closing tag)
+COMMAND_TAGS = {
+    "[SUGGEST_EVENT]": ("suggest", "[/SUGGEST_EVENT]"),
+    "[ADD_EVENT]": ("add", "[/ADD_EVENT]"),
+}
+
+def parse_event_fields(event_data):
+    """Parse the title|date|start_time|end_time|notes payload of a command block"""
+    parts = event_data.split("|")
+    
+    # Handle date ranges and recurring patterns
+    date_str = parts[1].strip()
+    start_date = None
+    end_date = None
+    recurrence = None
+    
+    # Check for date range (e.g., "2024-03-18 to 2024-03-22")
+    if " to " in date_str:
+        start_date_str, end_date_str = date_str.split(" to ")
+        start_date = normalize_date(start_date_str)
+        end_date = normalize_date(end_date_str)
+    else:
+        start_date = normalize_date(date_str)
+        # For work schedules that mention "next week", automatically set end date to Friday
+        if "next week" in date_str.lower() and "work" in parts[0].lower():
+            start_date_obj = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+            # Calculate the following Friday
+            days_to_friday = 4 - start_date_obj.weekday()  # Friday is 4
+            if days_to_friday < 0:
+                days_to_friday += 7
+            end_date = (start_date_obj + timedelta(days=days_to_friday)).strftime("%Y-%m-%d")
+    
+    # Check for recurring pattern in notes
+    if len(parts) > 4 and parts[4]:
+        notes = parts[4].strip()
+        if "repeat" in notes.lower() or "every" in notes.lower() or "weekly" in notes.lower():
+            recurrence = notes
+    
+    is_all_day = len(parts) <= 3 or not parts[2].strip()
+    
+    # For work schedules, set default times if not specified
+    if "work" in parts[0].lower() and is_all_day:
+        is_all_day = False
+        parts.extend(["09:00", "17:00"] if len(parts) <= 3 else [])
+    
+    event = {
+        "title": parts[0].strip(),
+        "date": start_date,
+        "is_all_day": is_all_day,
+        "allDay": is_all_day,
+        "color": "#4285f4"
+    }
+    
+    if len(parts) > 2 and parts[2].strip():
+        event["startTime"] = parts[2].strip()
+    if len(parts) > 3 and parts[3].strip():
+        event["endTime"] = parts[3].strip()
+    if len(parts) > 4:
+        event["notes"] = parts[4].strip()
+    
+    # Add additional metadata for date ranges and recurrence
+    if end_date:
+        event["end_date"] = end_date
+    if recurrence:
+        event["recurrence"] = recurrence
+    
+    return event
+
+def parse_event_commands(response_text):
+    """Parse every event command in the LLM response, in order
+
+    Returns ([(command, event), ...], clean_response). Malformed blocks are
+    left in the response text.
+    """
+    parser = CommandStreamParser()
+    commands = []
+    for item in parser.feed(response_text) + parser.close():
+        if item[0] == "command":
+            commands.append((item[1], item[2]))
+    return commands, parser.clean_text
+
+class CommandStreamParser:
+    """Split streamed LLM output into plain text and completed command blocks
+
+    Chunks are fed as they arrive. Text outside command blocks is released as
+    soon as it cannot be the start of an opening tag, and each block is
+    parsed the moment its closing tag arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.open_tag = None
+        self.text = []
+
+    def feed(self, chunk):
+        """Consume a chunk; returns a list of ("text", str) and ("command", name, event, raw) items"""
+        self.buffer += chunk
+        items = []
+        while self.buffer:
+            if self.open_tag is None:
+                positions = [(self.buffer.find(tag), tag) for tag in COMMAND_TAGS if tag in self.buffer]
+                if not positions:
+                    # Hold back a trailing fragment that may grow into an opening tag
+                    keep = self._partial_tag_length()
+                    self._emit_text(items, self.buffer[:len(self.buffer) - keep])
+                    self.buffer = self.buffer[len(self.buffer) - keep:]
+                    break
+                index, tag = min(positions)
+                self._emit_text(items, self.buffer[:index])
+                self.buffer = self.buffer[index + len(tag):]
+                self.open_tag = tag
+            else:
+                command, close_tag = COMMAND_TAGS[self.open_tag]
+                index = self.buffer.find(close_tag)
+                if index < 0:
+                    break
+                raw = self.buffer[:index].strip()
+                self.buffer = self.buffer[index + len(close_tag):]
+                open_tag, self.open_tag = self.open_tag, None
+                try:
+                    event = parse_event_fields(raw)
+                except Exception as e:
+                    # Keep a malformed block as text
+                    print(f"Error parsing {command} event command: {e}")
+                    self._emit_text(items, f"{open_tag}{raw}{close_tag}")
+                    continue
+                items.append(("command", command, event, raw))
+        return items
+
+    def close(self):
+        """Flush what is left at the end of the stream; unterminated blocks become text"""
+        items = []
+        leftover = (self.open_tag or "") + self.buffer
+        self.buffer = ""
+        self.open_tag = None
+        self._emit_text(items, leftover)
+        return items
+
+    @property
+    def clean_text(self):
+        """All text emitted so far, with command blocks removed"""
+        return "".join(self.text).strip()
+
+    def _emit_text(self, items, text):
+        if text:
+            self.text.append(text)
+            items.append(("text", text))
+
+    def _partial_tag_length(self):
+        for length in range(min(len(self.buffer), max(map(len, COMMAND_TAGS))), 0, -1):
+            suffix = self.buffer[-length:]
+            if any(tag.startswith(suffix) for tag in COMMAND_TAGS):
+                return length
+        return 0
+
+def normalize_date(date_str):
+    """Ensure date is current or future, not in the past"""
+    try:
+        # Handle "next week" references
+        if "next week" in date_str.lower():
+            current_date = datetime.datetime.now()
+            # Calculate days until next Monday
+            days_until_monday = (7 - current_date.weekday()) % 7
+            if days_until_monday == 0:  # If today is Monday
+                days_until_monday = 7   # Go to next Monday
+            next_monday = current_date + timedelta(days=days_until_monday)
+            return next_monday.strftime("%Y-%m-%d")
+        
+        # Parse the date string
+        date_parts = date_str.split('-')
+        
+        # Handle YYYY-MM-DD format
+        if len(date_parts) == 3 and len(date_parts[0]) == 4:
+            year, month, day = map(int, date_parts)
+            input_date = datetime.date(year, month, day)
+            
+            # If date is in the past, adjust to current year or next occurrence
+            current_date = datetime.datetime.now().date()
+            
+            if input_date < current_date:
+                # Try with current year first
+                current_year = current_date.year
+                try:
+                    adjusted_date = datetime.date(current_year, month, day)
+                    # If still in the past, use next year
+                    if adjusted_date < current_date:
+                        adjusted_date = datetime.date(current_year + 1, month, day)
+                    return adjusted_date.isoformat()
+                except ValueError:
+                    # Handle Feb 29 and similar edge cases
+                    return current_date.isoformat()
+            
+            return date_str
+        else:
+            # For non-standard formats, return as is but log warning
+            print(f"Warning: Non-standard date format: {date_str}")
+            return date_str
+            
+    except Exception as e:
+        print(f"Error normalizing date {date_str}: {e}")
+        # If parsing fails, return current date as fallback
+        return datetime.datetime.now().date().isoformat()
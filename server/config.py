@@ -0,0 +1,97 @@
+"""Runtime configuration for the calendar server, read from environment variables"""
+import os
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        print(f"Warning: invalid integer for {name}, using {default}")
+        return default
+
+
+# Production server (gunicorn.conf.py)
+BIND = os.environ.get("BIND", "0.0.0.0:5000")
+WEB_WORKERS = _env_int("WEB_WORKERS", 1)
+WEB_THREADS = _env_int("WEB_THREADS", 16)
+
+# Calendar storage
+CALENDAR_DB = os.environ.get("CALENDAR_DB", "calendar.db")
+LEGACY_CALENDAR_DIR = os.environ.get("LEGACY_CALENDAR_DIR", ".")
+
+# Largest page GET /api/events will return in one response
+EVENTS_PAGE_MAX = _env_int("EVENTS_PAGE_MAX", 1000)
+# Most operations POST /api/events/batch accepts in one request
+EVENTS_BATCH_MAX = _env_int("EVENTS_BATCH_MAX", 1000)
+# Events written per transaction by POST /api/events/import
+IMPORT_BATCH_SIZE = _env_int("IMPORT_BATCH_SIZE", 1000)
+
+# Ollama backend
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3")
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+# Connections kept open to Ollama and shared by all requests
+OLLAMA_POOL_SIZE = _env_int("OLLAMA_POOL_SIZE", 8)
+OLLAMA_TIMEOUT = _env_int("OLLAMA_TIMEOUT", 120)
+# How long Ollama keeps the model loaded after a request ("30m", "-1" = forever)
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+if OLLAMA_KEEP_ALIVE.lstrip("-").isdigit():
+    OLLAMA_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE)
+# Context window requested from Ollama; keep it fixed, since a change reloads the model
+OLLAMA_NUM_CTX = _env_int("OLLAMA_NUM_CTX", 8192)
+# Import the LLM stack in the background at startup instead of on the first chat call
+LLM_PRELOAD = os.environ.get("LLM_PRELOAD", "1") != "0"
+# Load the model in the background at startup, after the preload
+OLLAMA_WARMUP = os.environ.get("OLLAMA_WARMUP", "1") != "0"
+
+# Calendar context added to chat prompts
+CONTEXT_TOKEN_BUDGET = _env_int("CONTEXT_TOKEN_BUDGET", 1500)
+CONTEXT_UPCOMING_DAYS = _env_int("CONTEXT_UPCOMING_DAYS", 14)
+# Part of OLLAMA_NUM_CTX kept free for the reply when fitting a prompt
+PROMPT_RESPONSE_TOKENS = _env_int("PROMPT_RESPONSE_TOKENS", 512)
+
+# Conversation memory
+MEMORY_MAX_SESSIONS = _env_int("MEMORY_MAX_SESSIONS", 1000)
+MEMORY_TTL_SECONDS = _env_int("MEMORY_TTL_SECONDS", 3600)
+MEMORY_MAX_MESSAGES = _env_int("MEMORY_MAX_MESSAGES", 20)
+MEMORY_MAX_TOKENS = _env_int("MEMORY_MAX_TOKENS", 1000)
+# Messages dropped at once when the window overflows, keeping the prompt prefix stable in between
+MEMORY_TRIM_CHUNK = _env_int("MEMORY_TRIM_CHUNK", 6)
+# Fold trimmed turns into a short summary instead of forgetting them
+MEMORY_SUMMARIZE = os.environ.get("MEMORY_SUMMARIZE", "1") != "0"
+# Directory where evicted sessions are saved; empty disables spilling
+MEMORY_SPILL_DIR = os.environ.get("MEMORY_SPILL_DIR", "")
+# "memory" keeps sessions in this process; "sqlite" shares them between worker
+# processes through MEMORY_DB. Defaults to "sqlite" when running several workers.
+MEMORY_BACKEND = os.environ.get("MEMORY_BACKEND", "sqlite" if WEB_WORKERS > 1 else "memory")
+MEMORY_DB = os.environ.get("MEMORY_DB", CALENDAR_DB)
+
+# How far ahead open-ended recurring series are expanded when a query has no end date
+RECURRENCE_HORIZON_DAYS = _env_int("RECURRENCE_HORIZON_DAYS", 366)
+
+# Cache of LLM responses for repeated requests; a size of 0 disables it
+RESPONSE_CACHE_SIZE = _env_int("RESPONSE_CACHE_SIZE", 256)
+RESPONSE_CACHE_TTL_SECONDS = _env_int("RESPONSE_CACHE_TTL_SECONDS", 600)
+# Recent messages that are part of the cache key
+RESPONSE_CACHE_HISTORY_MESSAGES = _env_int("RESPONSE_CACHE_HISTORY_MESSAGES", 4)
+# SQLite file that keeps cached responses across restarts; empty disables it
+RESPONSE_CACHE_DB = os.environ.get("RESPONSE_CACHE_DB", "")
+RESPONSE_CACHE_DISK_MAX = _env_int("RESPONSE_CACHE_DISK_MAX", 10000)
+
+# Model calls allowed to run at once; match Ollama's OLLAMA_NUM_PARALLEL
+LLM_CONCURRENCY = _env_int("LLM_CONCURRENCY", 2)
+# Calls allowed to wait for a slot before new ones get 429
+LLM_QUEUE_MAX = _env_int("LLM_QUEUE_MAX", 32)
+# Seconds a call may wait for a slot
+LLM_QUEUE_TIMEOUT = _env_int("LLM_QUEUE_TIMEOUT", 30)
+
+# Reminders are sent to a JSON-lines file and/or POSTed to a webhook; with neither set
+# the reminder scheduler does not run
+REMINDER_LOG = os.environ.get("REMINDER_LOG", "")
+REMINDER_WEBHOOK_URL = os.environ.get("REMINDER_WEBHOOK_URL", "")
+# Minutes before the start of an event, unless the event sets reminderMinutes
+REMINDER_LEAD_MINUTES = _env_int("REMINDER_LEAD_MINUTES", 10)
+# Time of day (HH:MM) at which all-day events are announced
+REMINDER_ALL_DAY_TIME = os.environ.get("REMINDER_ALL_DAY_TIME", "09:00")
+
+# Add a Server-Timing header with per-stage durations to chat responses
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") != "0"
@@ -0,0 +1,156 @@
+"""Bounded, time-relevant calendar context for chat prompts
+
+Instead of dumping the whole calendar into every prompt, pick the events the
+model is most likely to need, in priority order:
+
+1. events on the pending suggestion's date, flagging overlaps
+2. events on dates mentioned in the message
+3. events in the next few days
+
+Events are written one per line and added until the token budget is spent.
+"""
+import datetime
+import re
+from collections import namedtuple
+
+import config
+
+CalendarContext = namedtuple("CalendarContext", ["text", "included", "dropped"])
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+MONTH_DAY = re.compile(r"\b(" + "|".join(MONTHS) + r")[a-z]*\.?\s+(\d{1,2})(?:st|nd|rd|th)?\b")
+DAY_MONTH = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?(" + "|".join(MONTHS) + r")[a-z]*\b")
+
+
+def estimate_tokens(text):
+    """Rough token count; llama-family tokenizers average about four characters per token"""
+    return (len(text) + 3) // 4
+
+
+def format_event(event, marker=""):
+    """Render one event as a compact line: `#id date time title | notes`"""
+    if event.get("is_all_day") or event.get("allDay") or not event.get("startTime"):
+        when = "all-day"
+    else:
+        when = f"{event['startTime']}-{event.get('endTime') or event['startTime']}"
+    line = f"#{event.get('id')} {event.get('date')} {when} {event.get('title', '')}"
+    if event.get("notes"):
+        line += f" | {event['notes']}"
+    return line + marker
+
+
+def _future_date(today, month, day):
+    """Resolve a month/day to this year or next, never the past (like normalize_date)"""
+    try:
+        date = datetime.date(today.year, month, day)
+        if date < today:
+            date = datetime.date(today.year + 1, month, day)
+        return date
+    except ValueError:
+        return None
+
+
+def mentioned_date_ranges(message, today):
+    """Return (start, end) date ranges referred to in a message"""
+    text = message.lower()
+    ranges = []
+
+    def add(start, end=None):
+        if start:
+            ranges.append((start, end or start))
+
+    if "today" in text or "tonight" in text:
+        add(today)
+    if "tomorrow" in text:
+        add(today + datetime.timedelta(days=1))
+    if "next week" in text:
+        monday = today + datetime.timedelta(days=7 - today.weekday())
+        add(monday, monday + datetime.timedelta(days=6))
+    if "weekend" in text:
+        saturday = today + datetime.timedelta(days=(5 - today.weekday()) % 7)
+        add(saturday, saturday + datetime.timedelta(days=1))
+    for index, name in enumerate(WEEKDAYS):
+        if re.search(rf"\b{name}\b", text):
+            # The next upcoming occurrence, today included
+            add(today + datetime.timedelta(days=(index - today.weekday()) % 7))
+    for year, month, day in ISO_DATE.findall(text):
+        try:
+            add(datetime.date(int(year), int(month), int(day)))
+        except ValueError:
+            pass
+    for month, day in MONTH_DAY.findall(text):
+        add(_future_date(today, MONTHS.index(month) + 1, int(day)))
+    for day, month in DAY_MONTH.findall(text):
+        add(_future_date(today, MONTHS.index(month) + 1, int(day)))
+    return ranges
+
+
+def _overlaps(event, pending):
+    if not (event.get("startTime") and pending.get("startTime")):
+        # All-day entries share the day with everything else
+        return True
+    pending_end = pending.get("endTime") or pending["startTime"]
+    event_end = event.get("endTime") or event["startTime"]
+    return event["startTime"] < pending_end and pending["startTime"] < event_end
+
+
+def build_calendar_context(store, user_id, message, pending_event=None, today=None,
+                           budget=None, upcoming_days=None):
+    """Select a bounded, time-relevant subset of a user's calendar for the prompt"""
+    today = today or datetime.date.today()
+    budget = config.CONTEXT_TOKEN_BUDGET if budget is None else budget
+    upcoming_days = config.CONTEXT_UPCOMING_DAYS if upcoming_days is None else upcoming_days
+
+    total = store.count_events(user_id)
+    if not total:
+        return CalendarContext("No events in calendar.\n", 0, 0)
+
+    # No window can contribute more lines than the budget could hold anyway
+    fetch_limit = max(1, budget // 8)
+    windows = []
+    if pending_event and pending_event.get("date"):
+        windows.append((pending_event["date"], pending_event["date"], pending_event))
+    for start, end in mentioned_date_ranges(message, today):
+        windows.append((start.isoformat(), end.isoformat(), None))
+    windows.append((today.isoformat(), (today + datetime.timedelta(days=upcoming_days)).isoformat(), None))
+
+    header = "Calendar events (id date time title | notes):\n"
+    used = estimate_tokens(header)
+    # Keyed on (id, date): every occurrence of a series carries the series id
+    selected = {}
+    skipped = set()
+    # Whether a window held more events than were fetched, making `dropped` a lower bound
+    more = False
+    for start, end, pending in windows:
+        events, next_cursor = store.list_events(user_id, start=start, end=end, limit=fetch_limit)
+        more = more or next_cursor is not None
+        for event in events:
+            key = (event["id"], event.get("date"))
+            if key in selected or key in skipped:
+                continue
+            if skipped:
+                # Out of budget: only count what is left out
+                skipped.add(key)
+                continue
+            marker = " [CONFLICT with pending event]" if pending and _overlaps(event, pending) else ""
+            line = format_event(event, marker)
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                skipped.add(key)
+                continue
+            used += cost
+            selected[key] = (event.get("date") or "", event.get("startTime") or "", event["id"], line)
+
+    lines = [line for *_, line in sorted(selected.values())]
+    dropped = len(skipped)
+    text = header + "".join(line + "\n" for line in lines)
+    if not lines:
+        text = "No events in the relevant dates.\n"
+    if dropped:
+        text += f"({dropped}{'+' if more else ''} other events not shown)\n"
+    elif more:
+        text += "(later events not shown)\n"
+    return CalendarContext(text, len(lines), dropped)
@@ -0,0 +1,358 @@
+"""Rule-based handling of simple chat commands without calling the LLM
+
+Covers the most common one-line requests:
+
+    add dentist tomorrow at 3pm
+    delete lunch on Friday
+    move standup to 10
+
+A command is only handled here when it parses unambiguously: one date, a
+clear time, and for delete/move exactly one matching event. Anything else
+returns None and goes to the LLM as before. Nothing is changed here: every
+command comes back as a suggestion, and deletes and moves carry the batch
+"operation" that chat_server applies once the user confirms. Dates resolve the same way the
+prompt asks the model to: weekdays mean the next upcoming one and explicit
+dates are passed through normalize_date.
+"""
+import datetime
+import re
+import threading
+
+from commands import normalize_date
+from context import MONTHS, WEEKDAYS
+
+# How far ahead delete/move look for the event when no date is given
+SEARCH_DAYS = 30
+DEFAULT_DURATION_MINUTES = 60
+MAX_TITLE_LENGTH = 60
+
+ADD_COMMAND = re.compile(r"^(?:please\s+)?(?:add|schedule|create|book|put)\s+(?P<rest>.+)$")
+DELETE_COMMAND = re.compile(r"^(?:please\s+)?(?:delete|remove|cancel)\s+(?P<rest>.+)$")
+MOVE_COMMAND = re.compile(r"^(?:please\s+)?(?:move|reschedule|push|shift)\s+(?P<rest>.+?)\s+to\s+(?P<target>[^,]+)$")
+
+DATE_PHRASE = re.compile(
+    r"\b(?:on\s+)?(?:"
+    r"(?P<relative>today|tonight|tomorrow|next week)"
+    r"|(?:this\s+)?(?P<weekday>" + "|".join(WEEKDAYS) + r")"
+    r"|(?P<iso>\d{4}-\d{2}-\d{2})"
+    r"|(?P<month>" + "|".join(MONTHS) + r")[a-z]*\.?\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?"
+    r")\b"
+)
+TIME_RANGE = re.compile(r"\bfrom\s+(?P<start>[\d:apm\s]+?)\s*(?:to|-|until)\s*(?P<end>\d{1,2}(?::\d{2})?\s*(?:am|pm)?)\b")
+TIME_PHRASE = re.compile(
+    r"\b(?:at\s+)?(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<meridiem>am|pm)\b"
+    r"|\bat\s+(?P<bare_hour>\d{1,2})(?::(?P<bare_minute>\d{2}))?\b"
+    r"|\b(?:at\s+)?(?P<named>noon|midnight)\b"
+    r"|\b(?P<clock_hour>\d{1,2}):(?P<clock_minute>\d{2})\b"
+)
+DURATION_PHRASE = re.compile(r"\bfor\s+(?P<amount>\d+(?:\.\d+)?)\s*(?P<unit>hours?|hrs?|minutes?|mins?)\b")
+FILLER = re.compile(r"\b(?:to|on|in|into)\s+(?:my|the)\s+calendar\b|\b(?:an?|my|the)\s+(?=\w)")
+
+# Phrases the rules deliberately leave to the LLM
+AMBIGUOUS = re.compile(r"\b(?:every|each|daily|weekly|until|next\s+(?:" + "|".join(WEEKDAYS) + r")|or|and then)\b|\?")
+
+
+class FastPathStats:
+    """Counts of messages answered by the rules versus sent to the LLM"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = 0
+
+    def record(self, intent):
+        with self._lock:
+            if intent:
+                self.hits[intent] = self.hits.get(intent, 0) + 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            hits = sum(self.hits.values())
+            total = hits + self.misses
+            return {
+                "hits": hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "hits_by_intent": dict(self.hits),
+            }
+
+
+stats = FastPathStats()
+
+
+def _hour_24(hour, minute, meridiem):
+    if meridiem == "pm" and hour != 12:
+        hour += 12
+    elif meridiem == "am" and hour == 12:
+        hour = 0
+    elif meridiem is None and 1 <= hour <= 6:
+        # A bare "at 3" almost always means the afternoon
+        hour += 12
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+def parse_time(text):
+    """Return (HH:MM, match) for the first clear time in the text, or (None, None)"""
+    match = TIME_PHRASE.search(text)
+    if not match:
+        return None, None
+    if match.group("named"):
+        return ("12:00" if match.group("named") == "noon" else "00:00"), match
+    if match.group("hour"):
+        return _hour_24(int(match.group("hour")), int(match.group("minute") or 0), match.group("meridiem")), match
+    if match.group("bare_hour"):
+        return _hour_24(int(match.group("bare_hour")), int(match.group("bare_minute") or 0), None), match
+    return _hour_24(int(match.group("clock_hour")), int(match.group("clock_minute")), ""), match
+
+
+def parse_date(text, today):
+    """Return (YYYY-MM-DD, match) for the single date in the text
+
+    Returns (None, None) when there is no date, and (False, None) when there
+    are several or the weekday is today's (this week's or next week's?).
+    """
+    matches = list(DATE_PHRASE.finditer(text))
+    if not matches:
+        return None, None
+    if len(matches) > 1:
+        return False, None
+    match = matches[0]
+    if match.group("relative") in ("today", "tonight"):
+        return today.isoformat(), match
+    if match.group("relative") == "tomorrow":
+        return (today + datetime.timedelta(days=1)).isoformat(), match
+    if match.group("relative") == "next week":
+        return normalize_date("next week"), match
+    if match.group("weekday"):
+        days_ahead = (WEEKDAYS.index(match.group("weekday")) - today.weekday()) % 7
+        if days_ahead == 0:
+            return False, None
+        return (today + datetime.timedelta(days=days_ahead)).isoformat(), match
+    if match.group("iso"):
+        return normalize_date(match.group("iso")), match
+    month = MONTHS.index(match.group("month")) + 1
+    try:
+        date = datetime.date(today.year, month, int(match.group("day")))
+    except ValueError:
+        return False, None
+    # Same rule as normalize_date: never a date in the past
+    return normalize_date(date.isoformat()), match
+
+
+def _remove(text, match):
+    return text[:match.start()] + " " + text[match.end():] if match else text
+
+
+def _add_minutes(time_str, minutes):
+    moment = datetime.datetime.strptime(time_str, "%H:%M") + datetime.timedelta(minutes=minutes)
+    return moment.strftime("%H:%M")
+
+
+def _minutes_between(start, end):
+    delta = datetime.datetime.strptime(end, "%H:%M") - datetime.datetime.strptime(start, "%H:%M")
+    return int(delta.total_seconds() // 60) % (24 * 60)
+
+
+def _clean_title(text, original=None):
+    """Title left over once the command words are removed
+
+    Parsing works on lowercased text; with `original`, each word is given
+    back the capitalization the user typed.
+    """
+    title = FILLER.sub(" ", text)
+    title = re.sub(r"\b(?:at|on|for|from)\s*$", "", title.strip())
+    title = " ".join(title.split()).strip(" ,.-")
+    if not title or len(title) > MAX_TITLE_LENGTH or any(ch.isdigit() for ch in title):
+        return None
+    if original:
+        cased = {}
+        for word in original.split():
+            # Inner words keep their punctuation, the title's ends lose it
+            cased.setdefault(word.lower(), word)
+            cased.setdefault(word.lower().strip(" ,.-"), word.strip(" ,.-"))
+        title = " ".join(cased.get(word, word) for word in title.split())
+    return title[0].upper() + title[1:]
+
+
+def parse_add(text, today, original=None):
+    """Parse "add <title> <date> at <time> [for <duration>]" into event data
+
+    `text` is the lowercased command; the title keeps the case of `original`.
+    """
+    match = ADD_COMMAND.match(text)
+    if not match:
+        return None
+    rest = match.group("rest")
+
+    date, date_match = parse_date(rest, today)
+    if not date:
+        return None
+    rest = _remove(rest, date_match)
+
+    end_time = None
+    range_match = TIME_RANGE.search(rest)
+    if range_match:
+        start_time, _ = parse_time("at " + range_match.group("start"))
+        end_time, _ = parse_time("at " + range_match.group("end"))
+        if not (start_time and end_time):
+            return None
+        rest = _remove(rest, range_match)
+    else:
+        start_time, time_match = parse_time(rest)
+        rest = _remove(rest, time_match)
+
+    duration_match = DURATION_PHRASE.search(rest)
+    if duration_match:
+        amount = float(duration_match.group("amount"))
+        minutes = int(amount * 60) if duration_match.group("unit").startswith("h") else int(amount)
+        rest = _remove(rest, duration_match)
+    else:
+        minutes = DEFAULT_DURATION_MINUTES
+
+    title = _clean_title(rest, original)
+    if not title:
+        return None
+
+    is_all_day = start_time is None
+    event = {
+        "title": title,
+        "date": date,
+        "is_all_day": is_all_day,
+        "allDay": is_all_day,
+        "color": "#4285f4"
+    }
+    if start_time:
+        event["startTime"] = start_time
+        event["endTime"] = end_time or _add_minutes(start_time, minutes)
+    return event
+
+
+def find_single_event(store, user_id, text, today):
+    """Find the one upcoming event a delete/move command refers to, or None
+
+    A recurring series matches as its next occurrence in the window, so
+    "move standup to 10" finds the next standup rather than giving up.
+    """
+    date, date_match = parse_date(text, today)
+    if date is False:
+        return None
+    words = _clean_title(_remove(text, date_match))
+    if not words:
+        return None
+    start = date or today.isoformat()
+    end = date or (today + datetime.timedelta(days=SEARCH_DAYS)).isoformat()
+    events, _ = store.list_events(user_id, start=start, end=end, limit=500)
+    query = set(words.lower().split())
+    matches = []
+    series_seen = set()
+    for event in events:
+        if not query <= set(event.get("title", "").lower().split()):
+            continue
+        if event.get("recurring"):
+            # A series stands for its next occurrence; events come in date order
+            if event["series_id"] in series_seen:
+                continue
+            series_seen.add(event["series_id"])
+        matches.append(event)
+    return matches[0] if len(matches) == 1 else None
+
+
+def _suggestion(text, event_data):
+    # Same shape as chat_result()
+    return {
+        "response": text,
+        "event_added": False,
+        "event_suggested": True,
+        "event_data": event_data,
+        "event_suggestions": [event_data],
+        "add_result": None,
+        "add_results": []
+    }
+
+
+def _when(event):
+    if event.get("startTime"):
+        return f"{event['date']} at {event['startTime']}"
+    return event["date"]
+
+
+def _describe(event):
+    return f"{event['title']} on {_when(event)}"
+
+
+def try_fast_path(store, user_id, message, today=None):
+    """Answer a simple command without the LLM; returns a chat response body or None"""
+    today = today or datetime.date.today()
+    original = " ".join(message.split()).rstrip(".!")
+    # Rules match the lowercased text; titles are taken from the original
+    text = original.lower()
+    result = None
+    intent = None
+    if not AMBIGUOUS.search(text):
+        if ADD_COMMAND.match(text):
+            intent, result = "add", _fast_add(text, today, original)
+        elif MOVE_COMMAND.match(text):
+            intent, result = "move", _fast_move(store, user_id, text, today)
+        elif DELETE_COMMAND.match(text):
+            intent, result = "delete", _fast_delete(store, user_id, text, today)
+    stats.record(intent if result else None)
+    return result
+
+
+def _fast_add(text, today, original):
+    event = parse_add(text, today, original)
+    if event is None:
+        return None
+    return _suggestion(f"Add {_describe(event)}?", event)
+
+
+def _fast_delete(store, user_id, text, today):
+    event = find_single_event(store, user_id, DELETE_COMMAND.match(text).group("rest"), today)
+    if event is None:
+        return None
+    if event.get("recurring"):
+        # Only this occurrence, not the whole series
+        operation = {"op": "delete", "id": event["series_id"], "date": event["date"]}
+        text = f"Delete {_describe(event)}? The rest of the series stays."
+    else:
+        operation = {"op": "delete", "id": event["id"]}
+        text = f"Delete {_describe(event)}?"
+    return _suggestion(text, dict(event, operation=operation))
+
+
+def _fast_move(store, user_id, text, today):
+    match = MOVE_COMMAND.match(text)
+    event = find_single_event(store, user_id, match.group("rest"), today)
+    if event is None:
+        return None
+    target = match.group("target")
+    if re.fullmatch(r"\d{1,2}(?::\d{2})?", target.strip()):
+        # "move standup to 10" names a bare hour
+        target = "at " + target
+    new_date, date_match = parse_date(target, today)
+    if new_date is False:
+        return None
+    new_time, time_match = parse_time(_remove(target, date_match))
+    if not (new_date or new_time) or _remove(_remove(target, date_match), time_match).strip():
+        # Something in the target we did not understand
+        return None
+
+    updates = {"date": new_date or event["date"]}
+    if new_time:
+        if event.get("startTime") and event.get("endTime"):
+            duration = _minutes_between(event["startTime"], event["endTime"])
+        else:
+            duration = DEFAULT_DURATION_MINUTES
+        updates.update(startTime=new_time, endTime=_add_minutes(new_time, duration),
+                       is_all_day=False, allDay=False)
+    if event.get("recurring"):
+        # Split this occurrence off the series
+        operation = {"op": "update", "id": event["series_id"], "date": event["date"], "updates": updates}
+    else:
+        operation = {"op": "update", "id": event["id"], "updates": updates}
+    moved = dict(event, **updates)
+    return _suggestion(f"Move {_describe(event)} to {_when(moved)}?", dict(moved, operation=operation))
@@ -0,0 +1,14 @@
+"""Gunicorn settings for the calendar server, read from the same environment as config.py"""
+# Imported under another name: gunicorn treats a module-level `config` as a setting
+import config as server_config
+
+bind = server_config.BIND
+# Threads serve many requests at once; chat requests mostly wait on Ollama
+worker_class = "gthread"
+threads = server_config.WEB_THREADS
+# With more than one worker, conversation memory moves to SQLite so every
+# worker sees the same sessions; LLM_CONCURRENCY then applies per worker
+workers = server_config.WEB_WORKERS
+# Long enough for a queued chat request plus its generation
+timeout = server_config.LLM_QUEUE_TIMEOUT + server_config.OLLAMA_TIMEOUT + 30
+graceful_timeout = 30
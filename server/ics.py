@@ -0,0 +1,405 @@
+"""iCalendar (.ics) import and export
+
+Import reads the file one line at a time: content lines are unfolded and
+parsed as they arrive, each VEVENT becomes an event dict as soon as it
+closes, and events are written in batches of `batch_size`, so memory stays
+flat however large the file is. Daily and weekly RRULEs map onto the
+store's series rule (see recurrence.py); other rules keep their first
+occurrence only and are counted in the summary.
+
+Times with a TZID are kept as wall-clock times, like every other time the
+server stores; UTC times are converted to the server's local time.
+
+Export is a generator of text chunks, so the response streams straight from
+the database without building the whole file.
+"""
+import datetime
+import re
+
+# Weekday codes in the order recurrence.py numbers them (Monday is 0)
+WEEKDAY_CODES = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+SUPPORTED_FREQS = {"DAILY": "daily", "WEEKLY": "weekly"}
+# RRULE parts that the store's rule can represent
+SUPPORTED_RULE_PARTS = {"FREQ", "INTERVAL", "BYDAY", "COUNT", "UNTIL", "WKST"}
+# Errors listed in an import summary; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+# Bytes of text gathered before an export chunk is yielded
+EXPORT_CHUNK_SIZE = 64 * 1024
+# Bytes read from an upload at a time
+READ_CHUNK_SIZE = 64 * 1024
+# Content lines are folded at 75 octets (RFC 5545 3.1)
+FOLD_OCTETS = 75
+
+DURATION = re.compile(r"^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+DEFAULT_COLOR = "#4285f4"
+
+
+def read_lines(stream, chunk_size=READ_CHUNK_SIZE):
+    """Yield the lines of a binary stream, reading it in blocks
+
+    Much faster than iterating a WSGI input stream, which reads line by line.
+    """
+    pending = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def unfold(lines):
+    """Yield logical content lines from physical ones, joining folded continuations"""
+    current = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t"):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_content_line(line):
+    """Split `NAME;PARAM=value:VALUE` into (name, params, value)"""
+    # The value starts at the first colon outside a quoted parameter value
+    index = line.find(":")
+    if '"' in line[:index]:
+        quoted = False
+        for index, char in enumerate(line):
+            if char == '"':
+                quoted = not quoted
+            elif char == ":" and not quoted:
+                break
+        else:
+            index = -1
+    if index < 0:
+        raise ValueError(f"not a content line: {line[:40]!r}")
+    head, value = line[:index], line[index + 1:]
+    name, *raw_params = head.split(";")
+    params = {}
+    for param in raw_params:
+        key, _, param_value = param.partition("=")
+        params[key.upper()] = param_value.strip('"')
+    return name.upper(), params, value
+
+
+def unescape_text(value):
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def escape_text(value):
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def iter_vevents(lines):
+    """Yield the properties of each VEVENT as a list of (name, params, value)
+
+    Components nested in an event (VALARM) and everything outside events
+    (VTIMEZONE, VTODO, ...) are skipped.
+    """
+    properties = None
+    depth = 0
+    for line in unfold(lines):
+        try:
+            name, params, value = parse_content_line(line)
+        except ValueError:
+            continue
+        if name == "BEGIN":
+            if properties is not None:
+                depth += 1
+            elif value.upper() == "VEVENT":
+                properties = []
+        elif name == "END":
+            if properties is None:
+                continue
+            if depth:
+                depth -= 1
+            elif value.upper() == "VEVENT":
+                yield properties
+                properties = None
+        elif properties is not None and not depth:
+            properties.append((name, params, value))
+
+
+def parse_date_time(value, params):
+    """(date, "HH:MM" or None) for a DATE or DATE-TIME value"""
+    value = value.strip()
+    if params.get("VALUE", "").upper() == "DATE" or len(value) == 8:
+        return datetime.datetime.strptime(value[:8], "%Y%m%d").date(), None
+    moment = datetime.datetime.strptime(value.rstrip("Zz")[:15], "%Y%m%dT%H%M%S")
+    if value[-1:] in ("Z", "z"):
+        moment = moment.replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+    return moment.date(), moment.strftime("%H:%M")
+
+
+def parse_duration(value):
+    match = DURATION.match(value.strip())
+    if not match:
+        raise ValueError(f"invalid DURATION {value!r}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = datetime.timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                                  minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == "-" else duration
+
+
+def parse_rrule(value, dtstart):
+    """The store's rule for an RRULE value, or None if it cannot be represented"""
+    parts = dict(part.partition("=")[::2] for part in value.upper().split(";") if part)
+    freq = SUPPORTED_FREQS.get(parts.get("FREQ"))
+    if freq is None or set(parts) - SUPPORTED_RULE_PARTS:
+        return None
+    rule = {"freq": freq}
+    if int(parts.get("INTERVAL") or 1) > 1:
+        rule["interval"] = int(parts["INTERVAL"])
+    if parts.get("BYDAY"):
+        codes = parts["BYDAY"].split(",")
+        if any(code not in WEEKDAY_CODES for code in codes):
+            # Ordinal days such as 1MO only make sense for monthly rules
+            return None
+        rule["byday"] = sorted({WEEKDAY_CODES.index(code) for code in codes})
+    if parts.get("COUNT"):
+        rule["count"] = int(parts["COUNT"])
+    if parts.get("UNTIL"):
+        until, _ = parse_date_time(parts["UNTIL"], {})
+        rule["until"] = max(until, dtstart).isoformat()
+    return rule
+
+
+def to_event(properties):
+    """Event dict for one VEVENT, plus the (uid, date) of the occurrence it replaces, if any
+
+    Raises ValueError for events that cannot be imported. The event carries
+    "unsupported_rule" when its RRULE could not be mapped.
+    """
+    props = {}
+    exdates = []
+    for name, params, value in properties:
+        if name == "EXDATE":
+            exdates.extend(parse_date_time(part, params)[0].isoformat() for part in value.split(",") if part)
+        else:
+            props.setdefault(name, (params, value))
+    if "DTSTART" not in props:
+        raise ValueError("missing DTSTART")
+
+    start_date, start_time = parse_date_time(props["DTSTART"][1], props["DTSTART"][0])
+    end_date, end_time = start_date, start_time
+    if "DTEND" in props:
+        end_date, end_time = parse_date_time(props["DTEND"][1], props["DTEND"][0])
+    elif "DURATION" in props:
+        duration = parse_duration(props["DURATION"][1])
+        if start_time:
+            end = datetime.datetime.combine(start_date, datetime.time.fromisoformat(start_time)) + duration
+            end_date, end_time = end.date(), end.strftime("%H:%M")
+        else:
+            end_date = start_date + duration
+
+    is_all_day = start_time is None
+    event = {
+        "title": unescape_text(props.get("SUMMARY", ({}, ""))[1]).strip() or "Untitled",
+        "date": start_date.isoformat(),
+        "is_all_day": is_all_day,
+        "allDay": is_all_day,
+        "notes": unescape_text(props.get("DESCRIPTION", ({}, ""))[1]),
+        "color": DEFAULT_COLOR,
+    }
+    if not is_all_day:
+        event["startTime"] = start_time
+        # Events running past midnight end at the end of their first day
+        event["endTime"] = end_time if end_date == start_date and end_time and end_time >= start_time else "23:59"
+    uid = props.get("UID", ({}, ""))[1].strip()
+    if uid:
+        event["uid"] = uid
+
+    if "RRULE" in props:
+        rule = parse_rrule(props["RRULE"][1], start_date)
+        if rule is None:
+            event["unsupported_rule"] = True
+        else:
+            event["rrule"] = rule
+    elif is_all_day and end_date > start_date + datetime.timedelta(days=1):
+        # A multi-day all-day event is a daily series over its dates (DTEND is exclusive)
+        event["rrule"] = {"freq": "daily", "until": (end_date - datetime.timedelta(days=1)).isoformat()}
+    if "rrule" in event and exdates:
+        event["rrule"]["exdates"] = sorted(set(exdates))
+
+    replaces = None
+    if "RECURRENCE-ID" in props and uid:
+        replaced_date = parse_date_time(props["RECURRENCE-ID"][1], props["RECURRENCE-ID"][0])[0]
+        replaces = (uid, replaced_date.isoformat())
+        # Stored as a standalone event, so it needs a UID of its own
+        event["uid"] = f"{uid}-{replaced_date:%Y%m%d}"
+    return event, replaces
+
+
+def import_ics(store, user_id, lines, batch_size=1000):
+    """Import the events of an .ics stream in batches; returns a summary
+
+    Each batch is one write. Batches already written stay if a later line
+    fails. Modified occurrences (RECURRENCE-ID) are imported as standalone
+    events and removed from their series once the whole file is read.
+    """
+    summary = {"imported": 0, "series": 0, "skipped": 0, "unsupported_rules": 0,
+               "batches": 0, "errors": []}
+    batch = []
+    # UID -> id of imported series, for resolving modified occurrences
+    series_ids = {}
+    replaced = []
+
+    def flush():
+        for event in store.insert_events(user_id, batch):
+            if "rrule" in event and event.get("uid"):
+                series_ids[event["uid"]] = event["id"]
+        summary["imported"] += len(batch)
+        summary["batches"] += 1
+        batch.clear()
+
+    for index, properties in enumerate(iter_vevents(lines), start=1):
+        if any(name == "STATUS" and value.upper() == "CANCELLED" for name, _, value in properties):
+            summary["skipped"] += 1
+            continue
+        try:
+            event, replaces = to_event(properties)
+        except ValueError as e:
+            summary["skipped"] += 1
+            if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                summary["errors"].append(f"event {index}: {e}")
+            continue
+        if event.pop("unsupported_rule", False):
+            summary["unsupported_rules"] += 1
+        if "rrule" in event:
+            summary["series"] += 1
+        if replaces:
+            replaced.append(replaces)
+        batch.append(event)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    for uid, date in replaced:
+        if uid in series_ids:
+            store.exclude_occurrence(user_id, series_ids[uid], date)
+    return summary
+
+
+def _ics_date(value):
+    return value.replace("-", "")
+
+
+def _ics_date_time(date, time):
+    return f"{_ics_date(date)}T{time.replace(':', '')[:4]}00"
+
+
+def fold(line):
+    """Split a content line into chunks of at most 75 octets, without splitting characters"""
+    if len(line.encode("utf-8")) <= FOLD_OCTETS:
+        return line + "\r\n"
+    chunks, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        # Continuation lines start with a space, which counts towards the limit
+        if size + width > FOLD_OCTETS - (1 if chunks else 0):
+            chunks.append(current)
+            current, size = "", 0
+        current += char
+        size += width
+    chunks.append(current)
+    return "\r\n ".join(chunks) + "\r\n"
+
+
+def _clock(value):
+    """A stored HH:MM time, normalized; raises ValueError for anything else"""
+    return datetime.datetime.strptime(value, "%H:%M").strftime("%H:%M")
+
+
+def event_lines(event, stamp):
+    """Content lines of the VEVENT for one stored event
+
+    Raises KeyError, TypeError or ValueError for an event whose date, times
+    or rule cannot be written as iCalendar values.
+    """
+    all_day = event.get("is_all_day") or event.get("allDay") or not event.get("startTime")
+    date = datetime.date.fromisoformat(event["date"])
+    lines = ["BEGIN:VEVENT",
+             f"UID:{event.get('uid') or str(event.get('id')) + '@smart-calendar'}",
+             f"DTSTAMP:{stamp}"]
+    if all_day:
+        next_day = date + datetime.timedelta(days=1)
+        lines.append(f"DTSTART;VALUE=DATE:{_ics_date(event['date'])}")
+        lines.append(f"DTEND;VALUE=DATE:{_ics_date(next_day.isoformat())}")
+    else:
+        start = _clock(event["startTime"])
+        end = _clock(event["endTime"]) if event.get("endTime") else start
+        lines.append(f"DTSTART:{_ics_date_time(event['date'], start)}")
+        lines.append(f"DTEND:{_ics_date_time(event['date'], max(start, end))}")
+    lines.append(f"SUMMARY:{escape_text(event.get('title') or '')}")
+    if event.get("notes"):
+        lines.append(f"DESCRIPTION:{escape_text(event['notes'])}")
+
+    rule = event.get("rrule")
+    if rule:
+        parts = [f"FREQ={rule['freq'].upper()}"]
+        if rule.get("interval", 1) > 1:
+            parts.append(f"INTERVAL={rule['interval']}")
+        if rule.get("byday"):
+            parts.append("BYDAY=" + ",".join(WEEKDAY_CODES[day] for day in rule["byday"]))
+        if rule.get("count") is not None:
+            parts.append(f"COUNT={rule['count']}")
+        if rule.get("until"):
+            # UNTIL has the same value type as DTSTART
+            until = _ics_date(rule["until"]) if all_day else _ics_date_time(rule["until"], "23:59")
+            parts.append(f"UNTIL={until}")
+        lines.append("RRULE:" + ";".join(parts))
+        for date in rule.get("exdates") or []:
+            if all_day:
+                lines.append(f"EXDATE;VALUE=DATE:{_ics_date(date)}")
+            else:
+                lines.append(f"EXDATE:{_ics_date_time(date, start)}")
+    lines.append("END:VEVENT")
+    return lines
+
+
+def export_ics(events, name="Smart Calendar"):
+    """Yield an .ics file for an iterable of stored events in chunks of about EXPORT_CHUNK_SIZE
+
+    The response is already under way when an event turns out to be
+    unexportable (a legacy date like "Friday", say), so such events are
+    skipped, logged and counted in an X-SKIPPED-EVENTS line instead of
+    cutting the file short.
+    """
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    buffer = [fold(line) for line in [
+        "BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Smart Calendar//EN",
+        "CALSCALE:GREGORIAN", f"X-WR-CALNAME:{escape_text(name)}",
+    ]]
+    size = 0
+    skipped = 0
+    for event in events:
+        try:
+            lines = event_lines(event, stamp)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Export skipped event {event.get('id')}: {e}")
+            skipped += 1
+            continue
+        for line in lines:
+            text = fold(line)
+            buffer.append(text)
+            size += len(text)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if skipped:
+        buffer.append(fold(f"X-SKIPPED-EVENTS:{skipped}"))
+    buffer.append(fold("END:VCALENDAR"))
+    yield "".join(buffer)
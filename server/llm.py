@@ -0,0 +1,149 @@
+"""Long-lived Ollama client shared by all chat requests
+
+Importing LangChain and the Ollama client takes most of the process start
+time, so nothing from the LLM stack is imported when this module loads.
+ModelRuntime builds the chain on the first chat call, or earlier when
+preload() is started at boot; workers that only serve /api/events never
+pay for it.
+"""
+import threading
+import time
+
+import config
+import startup
+
+# Seconds between warm-up attempts while Ollama is unreachable, doubling up to the maximum
+WARM_UP_RETRY_SECONDS = 2
+WARM_UP_RETRY_MAX_SECONDS = 60
+# How long the readiness probe trusts its last check that Ollama answers
+REACHABLE_CHECK_SECONDS = 5
+
+
+def create_model():
+    """Build the Ollama model once, with a pooled keep-alive HTTP connection"""
+    import httpx
+    from langchain_ollama import OllamaLLM
+
+    limits = httpx.Limits(
+        max_connections=config.OLLAMA_POOL_SIZE,
+        max_keepalive_connections=config.OLLAMA_POOL_SIZE,
+    )
+    return OllamaLLM(
+        model=config.OLLAMA_MODEL,
+        base_url=config.OLLAMA_HOST,
+        keep_alive=config.OLLAMA_KEEP_ALIVE,
+        # The same window on every call, so Ollama keeps the loaded model and its cached prefix
+        num_ctx=config.OLLAMA_NUM_CTX,
+        client_kwargs={"limits": limits, "timeout": config.OLLAMA_TIMEOUT},
+    )
+
+
+def warm_up(model):
+    """Load the model into Ollama with a one-token generation"""
+    started = time.perf_counter()
+    try:
+        # options replaces every model option, so num_ctx must be repeated or the model reloads
+        model.invoke("hi", options={"num_ctx": model.num_ctx, "num_predict": 1})
+    except Exception as e:
+        print(f"Model warm-up failed: {e}")
+        return False
+    print(f"Model {model.model} warmed up in {time.perf_counter() - started:.2f}s")
+    return True
+
+
+class ModelRuntime:
+    """The model and prompt chain, built once on first use or by a background preload"""
+
+    def __init__(self, system_prompt):
+        self.system_prompt = system_prompt
+        self.model = None
+        self.warmed = False
+        self.preloading = False
+        self.error = None
+        self._chain = None
+        self._lock = threading.Lock()
+        self._reachable = (None, False)
+
+    @property
+    def loaded(self):
+        return self._chain is not None
+
+    def chain(self):
+        """The prompt | model chain, importing the LLM stack on the first call"""
+        if self._chain is None:
+            with self._lock:
+                if self._chain is None:
+                    self._chain = self._build()
+        return self._chain
+
+    def _build(self):
+        with startup.report.phase("llm_import"):
+            from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+            import langchain_ollama  # noqa: F401 -- timed here rather than in model_build
+        with startup.report.phase("model_build"):
+            self.model = create_model()
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", self.system_prompt),
+                MessagesPlaceholder(variable_name="history"),
+                ("human", "{input}")
+            ])
+            return prompt | self.model
+
+    def preload(self, warm=True):
+        """Build the chain, then warm the model up, on a background thread"""
+        self.preloading = True
+        thread = threading.Thread(target=self._preload, args=(warm,), name="model-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def _preload(self, warm):
+        try:
+            self.chain()
+        except Exception as e:
+            self.error = f"Loading the model client failed: {e}"
+            print(self.error)
+            return
+        if warm:
+            started = time.perf_counter()
+            delay = WARM_UP_RETRY_SECONDS
+            # Keep trying, so a worker started before Ollama still becomes ready
+            while not warm_up(self.model):
+                self.error = f"Model warm-up failed, retrying in {delay}s"
+                time.sleep(delay)
+                delay = min(delay * 2, WARM_UP_RETRY_MAX_SECONDS)
+            startup.report.record("warm_up", time.perf_counter() - started)
+            self._reachable = (time.monotonic(), True)
+            self.warmed = True
+            self.error = None
+        self.preloading = False
+        startup.report.mark_ready()
+
+    def readiness(self):
+        """(ready, reason) for the readiness probe
+
+        While a preload runs the worker is ready once the chain is built and,
+        with warm-up on, the model is loaded. Without a preload the chain is
+        built by the first chat call, so only Ollama answering is required.
+        """
+        if self.preloading and not self.loaded:
+            return False, self.error or "loading the model client"
+        if self.preloading and not self.warmed:
+            return False, self.error or "warming up the model"
+        if not self.reachable():
+            return False, f"Ollama not reachable at {config.OLLAMA_HOST}"
+        startup.report.mark_ready()
+        return True, "ready"
+
+    def reachable(self):
+        """Whether Ollama answers, checked at most every REACHABLE_CHECK_SECONDS"""
+        checked, ok = self._reachable
+        if checked is not None and time.monotonic() - checked < REACHABLE_CHECK_SECONDS:
+            return ok
+        import httpx
+
+        try:
+            ok = httpx.get(f"{config.OLLAMA_HOST}/api/tags", timeout=2).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        self._reachable = (time.monotonic(), ok)
+        return ok
@@ -0,0 +1,335 @@
+"""Bounded, evictable per-user conversation memory
+
+Each user's session keeps a window of recent messages under both a message
+count and a token budget. When the window overflows, a chunk of the oldest
+messages is dropped at once rather than one message per turn, so the history
+at the front of the prompt stays byte-identical for several turns and the
+model backend can reuse its cached prefix. Dropped messages can be folded
+into a short summary. Idle sessions are evicted in LRU order, either
+when they outlive the TTL or when too many are resident, and are optionally
+spilled to disk so a returning user gets their context back.
+
+With several worker processes, SQLiteMemoryManager keeps sessions in a
+SQLite table instead, so every worker sees the same conversation.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import config
+from context import estimate_tokens
+from state import atomic_write_json, file_lock
+
+# How often the shared store drops expired and excess sessions
+PRUNE_INTERVAL_SECONDS = 60
+
+SUMMARY_MAX_CHARS = 600
+
+
+def summarize_turns(summary, dropped):
+    """Fold dropped messages into the running summary without calling the LLM
+
+    Only the user's side is kept; the assistant's replies are mostly command
+    blocks that are already reflected in the calendar.
+    """
+    requests = [content for role, content in dropped if role == "human"]
+    if not requests:
+        return summary
+    summary = "; ".join(filter(None, [summary, *requests]))
+    if len(summary) > SUMMARY_MAX_CHARS:
+        summary = "..." + summary[-SUMMARY_MAX_CHARS:]
+    return summary
+
+
+class ConversationSession:
+    """Recent messages of one user's conversation plus a summary of older ones"""
+
+    def __init__(self, max_messages, max_tokens, summarize=None, messages=None, summary="", trim_chunk=0):
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.trim_chunk = trim_chunk
+        self.messages = [tuple(message) for message in messages or []]
+        self.summary = summary
+        self.last_used = time.monotonic()
+
+    @property
+    def history(self):
+        """Messages for the prompt's history placeholder"""
+        if self.summary:
+            return [("system", f"Earlier in this conversation the user asked: {self.summary}")] + self.messages
+        return list(self.messages)
+
+    def add_user_message(self, content):
+        self._add("human", content)
+
+    def add_ai_message(self, content):
+        self._add("ai", content)
+
+    def _add(self, role, content):
+        self.messages.append((role, content))
+        self._trim()
+
+    def _trim(self):
+        """Once over either limit, drop the oldest messages until trim_chunk below both"""
+        tokens = sum(estimate_tokens(content) for _, content in self.messages)
+        if len(self.messages) <= self.max_messages and tokens <= self.max_tokens:
+            return
+        max_messages = max(0, self.max_messages - self.trim_chunk)
+        max_tokens = self.max_tokens * max_messages // self.max_messages if self.max_messages else 0
+        # The newest user message is never dropped, so the window always has one to start with
+        newest = max((i for i, (role, _) in enumerate(self.messages) if role == "human"), default=0)
+        dropped = []
+        while newest > 0 and (len(self.messages) > max_messages or tokens > max_tokens
+                              or self.messages[0][0] != "human"):
+            # Keep whole exchanges: the window always starts with a user message
+            role, content = self.messages.pop(0)
+            tokens -= estimate_tokens(content)
+            dropped.append((role, content))
+            newest -= 1
+        if dropped and self.summarize:
+            self.summary = self.summarize(self.summary, dropped)
+        if self.messages and self.messages[0][0] == "human" and tokens > max_tokens:
+            # A single message over the budget is cut short rather than lost
+            role, content = self.messages[0]
+            allowed = max(0, max_tokens - (tokens - estimate_tokens(content))) * 4 - 3
+            self.messages[0] = (role, content[:max(0, allowed)] + "...")
+
+    def size_bytes(self):
+        return len(self.summary.encode()) + sum(len(content.encode()) for _, content in self.messages)
+
+    def to_dict(self):
+        return {"messages": self.messages, "summary": self.summary}
+
+
+class MemoryManager:
+    """LRU/TTL cache of conversation sessions with optional spill-to-disk"""
+
+    def __init__(self, max_sessions, ttl_seconds, max_messages, max_tokens,
+                 summarize=None, spill_dir=None, trim_chunk=0):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.trim_chunk = trim_chunk
+        self.spill_dir = spill_dir
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.restores = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def get(self, user_id):
+        """Return a user's session, restoring it from disk or creating it as needed"""
+        with self._lock:
+            self._evict_expired()
+            session = self._sessions.get(user_id)
+            if session is None:
+                session = self._restore(user_id) or self._new_session()
+                self._sessions[user_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._evict(*self._sessions.popitem(last=False))
+            else:
+                self._sessions.move_to_end(user_id)
+            session.last_used = time.monotonic()
+            return session
+
+    def stats(self):
+        with self._lock:
+            return {
+                "resident_sessions": len(self._sessions),
+                "resident_bytes": sum(s.size_bytes() for s in self._sessions.values()),
+                "evictions": self.evictions,
+                "restores": self.restores,
+            }
+
+    def _new_session(self, data=None):
+        data = data or {}
+        return ConversationSession(self.max_messages, self.max_tokens, self.summarize,
+                                   data.get("messages"), data.get("summary", ""), self.trim_chunk)
+
+    def _evict_expired(self):
+        # Sessions are kept in last-used order, so expired ones are at the front
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if session.last_used >= deadline:
+                break
+            del self._sessions[user_id]
+            self._evict(user_id, session)
+
+    def _evict(self, user_id, session):
+        self.evictions += 1
+        if self.spill_dir and (session.messages or session.summary):
+            path = self._spill_path(user_id)
+            with file_lock(path):
+                atomic_write_json(path, session.to_dict())
+
+    def _restore(self, user_id):
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(user_id)
+        if not os.path.exists(path):
+            return None
+        # Another worker may be restoring or spilling the same user
+        with file_lock(path):
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                return None
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Error restoring conversation for {user_id}: {e}")
+                return None
+            os.remove(path)
+        self.restores += 1
+        return self._new_session(data)
+
+    def _spill_path(self, user_id):
+        # User ids are email addresses; hash them into safe file names
+        digest = hashlib.sha256(user_id.encode()).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.json")
+
+
+class SharedConversationSession(ConversationSession):
+    """Session stored in SQLite; each new message is a read-modify-write of its row"""
+
+    def __init__(self, manager, user_id, data):
+        super().__init__(manager.max_messages, manager.max_tokens, manager.summarize,
+                         data.get("messages"), data.get("summary", ""), manager.trim_chunk)
+        self.manager = manager
+        self.user_id = user_id
+
+    def _add(self, role, content):
+        with self.manager.transaction() as conn:
+            # Start from the stored copy, which another worker may have extended
+            data = self.manager._load(conn, self.user_id)
+            self.messages = [tuple(message) for message in data.get("messages", [])]
+            self.summary = data.get("summary", "")
+            self.messages.append((role, content))
+            self._trim()
+            self.manager._save(conn, self.user_id, self)
+
+
+class SQLiteMemoryManager:
+    """Conversation sessions in a SQLite table shared by all worker processes
+
+    Same interface as MemoryManager. Sessions idle for longer than the TTL
+    are deleted, and beyond max_sessions the least recently used ones go
+    first.
+    """
+
+    def __init__(self, path, max_sessions, ttl_seconds, max_messages, max_tokens, summarize=None,
+                 trim_chunk=0):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.trim_chunk = trim_chunk
+        self._local = threading.local()
+        self._last_prune = 0.0
+        self.evictions = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "user_id TEXT PRIMARY KEY, messages TEXT NOT NULL, summary TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get(self, user_id):
+        """Return a user's session as currently stored"""
+        now = time.time()
+        if now - self._last_prune > PRUNE_INTERVAL_SECONDS:
+            self._last_prune = now
+            self._prune(now)
+        with self.transaction() as conn:
+            data = self._load(conn, user_id)
+            conn.execute("UPDATE conversations SET last_used = ? WHERE user_id = ?", (now, user_id))
+        return SharedConversationSession(self, user_id, data)
+
+    def stats(self):
+        count, size = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(messages) + LENGTH(summary)), 0) FROM conversations"
+        ).fetchone()
+        return {
+            "resident_sessions": count,
+            "resident_bytes": size,
+            "evictions": self.evictions,
+            "restores": 0,
+        }
+
+    def _load(self, conn, user_id):
+        row = conn.execute(
+            "SELECT messages, summary, last_used FROM conversations WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl_seconds:
+            return {}
+        return {"messages": json.loads(row[0]), "summary": row[1]}
+
+    def _save(self, conn, user_id, session):
+        conn.execute(
+            "INSERT OR REPLACE INTO conversations (user_id, messages, summary, last_used) VALUES (?, ?, ?, ?)",
+            (user_id, json.dumps(session.messages), session.summary, time.time()),
+        )
+
+    def _prune(self, now):
+        with self.transaction() as conn:
+            expired = conn.execute(
+                "DELETE FROM conversations WHERE last_used < ?", (now - self.ttl_seconds,)
+            ).rowcount
+            excess = conn.execute(
+                "DELETE FROM conversations WHERE user_id NOT IN "
+                "(SELECT user_id FROM conversations ORDER BY last_used DESC LIMIT ?)",
+                (self.max_sessions,),
+            ).rowcount
+        self.evictions += expired + excess
+
+
+def create_memory_manager():
+    summarize = summarize_turns if config.MEMORY_SUMMARIZE else None
+    if config.MEMORY_BACKEND == "sqlite":
+        return SQLiteMemoryManager(
+            path=config.MEMORY_DB,
+            max_sessions=config.MEMORY_MAX_SESSIONS,
+            ttl_seconds=config.MEMORY_TTL_SECONDS,
+            max_messages=config.MEMORY_MAX_MESSAGES,
+            max_tokens=config.MEMORY_MAX_TOKENS,
+            summarize=summarize,
+            trim_chunk=config.MEMORY_TRIM_CHUNK,
+        )
+    return MemoryManager(
+        max_sessions=config.MEMORY_MAX_SESSIONS,
+        ttl_seconds=config.MEMORY_TTL_SECONDS,
+        max_messages=config.MEMORY_MAX_MESSAGES,
+        max_tokens=config.MEMORY_MAX_TOKENS,
+        summarize=summarize,
+        spill_dir=config.MEMORY_SPILL_DIR or None,
+        trim_chunk=config.MEMORY_TRIM_CHUNK,
+    )
@@ -0,0 +1,143 @@
+"""Counters and histograms for the chat pipeline, exported in Prometheus text format
+
+Metrics are process-local and cost a lock and a few additions per
+observation, so they stay on in production. Stage timings recorded during a
+request are also kept on flask.g, from which chat_server builds the optional
+Server-Timing header.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+SIZE_BUCKETS = (0, 10, 100, 1000, 10000, 100000)
+MESSAGE_BUCKETS = (0, 2, 4, 8, 16, 32, 64)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_text(names, key + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "chat_stage_seconds", "Time spent in each stage of a chat request", LATENCY_BUCKETS, ["stage"])
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint", LATENCY_BUCKETS, ["endpoint"])
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by endpoint and status", ["endpoint", "status"])
+CHAT_REQUESTS = Counter(
+    "chat_requests_total", "Chat requests by how they were answered", ["answered_by"])
+PROMPT_TOKENS = Histogram(
+    "chat_prompt_tokens", "Estimated tokens in each prompt sent to the model", TOKEN_BUCKETS)
+PROMPT_SECTION_TOKENS = Histogram(
+    "chat_prompt_section_tokens", "Estimated tokens in each section of the prompt", TOKEN_BUCKETS, ["section"])
+PREFILL_TOKENS = Counter(
+    "chat_prefill_tokens_total",
+    "Estimated prompt tokens reused from the previous prompt's cached prefix or left to prefill", ["kind"])
+RESPONSE_TOKENS = Histogram(
+    "chat_response_tokens", "Estimated tokens in model responses", TOKEN_BUCKETS)
+CALENDAR_EVENTS = Histogram(
+    "chat_calendar_events", "Stored events in the calendar of each chat request sent to the model", SIZE_BUCKETS)
+MEMORY_MESSAGES = Histogram(
+    "chat_memory_messages", "Conversation history messages sent with each model call", MESSAGE_BUCKETS)
+OLLAMA_ERRORS = Counter(
+    "ollama_errors_total", "Failed model calls by exception type", ["error"])
+REMINDERS = Counter(
+    "reminders_total", "Reminders handed to each sink, by result", ["result"])
+REMINDER_DELAY_SECONDS = Histogram(
+    "reminder_delay_seconds", "How late reminders fired after their scheduled time", LATENCY_BUCKETS)
+
+ALL_METRICS = [STAGE_SECONDS, REQUEST_SECONDS, REQUESTS, CHAT_REQUESTS, PROMPT_TOKENS,
+               PROMPT_SECTION_TOKENS, PREFILL_TOKENS, RESPONSE_TOKENS, CALENDAR_EVENTS, MEMORY_MESSAGES, OLLAMA_ERRORS,
+               REMINDERS, REMINDER_DELAY_SECONDS]
+
+
+@contextmanager
+def timed(stage):
+    """Record how long the block takes as one chat stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if has_request_context():
+            timings = g.setdefault("stage_timings", [])
+            timings.append((stage, elapsed))
+
+
+def server_timing_header(timings):
+    """Server-Timing value for a list of (stage, seconds)"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,165 @@
+"""Token budget and prefix-stable layout of chat prompts
+
+A chat prompt is laid out from the most to the least stable part:
+
+    system   the static instructions, identical for every call
+    history  the conversation summary and recent messages; between turns it
+             only grows at the end, and memory.py drops old messages in
+             chunks rather than one per turn
+    turn     current date, calendar context, free slots and the message,
+             which change on every call
+
+Ollama keeps the KV cache of the previous prompt and only prefills the
+tokens after the longest common prefix, so with this order each turn pays
+for the newest exchange and the turn section instead of the whole prompt.
+
+PromptBudget counts tokens per section and, when a prompt would not fit in
+the model's context window, trims it deterministically: the oldest history
+messages first, in whole chunks, then lines from the end of the calendar
+context. PrefillTracker estimates how many prompt tokens each call can reuse
+from the previous prompt of the same user.
+"""
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+from context import estimate_tokens
+
+# Prefixes LangChain uses when it renders chat messages into the prompt text
+ROLE_PREFIXES = {"system": "System", "human": "Human", "ai": "AI"}
+
+# messages holds (rendered text, tokens) of every message in prompt order
+PromptPlan = namedtuple("PromptPlan", ["history", "input", "sections", "messages", "trimmed_messages"])
+
+
+def render_message(role, content):
+    """One message as it appears in the prompt text"""
+    return f"{ROLE_PREFIXES.get(role, role)}: {content}\n"
+
+
+def message_tokens(role, content):
+    return estimate_tokens(render_message(role, content))
+
+
+def _trim_lines(text, max_tokens):
+    """Drop whole lines from the end of a block until it fits"""
+    lines = text.splitlines(keepends=True)
+    while lines and estimate_tokens("".join(lines)) > max_tokens:
+        lines.pop()
+    return "".join(lines)
+
+
+class PromptBudget:
+    """Fits the history and turn sections of a prompt into the model's context window"""
+
+    def __init__(self, system_prompt, num_ctx, response_tokens, trim_chunk=2):
+        self.system_message = render_message("system", system_prompt)
+        self.system_tokens = estimate_tokens(self.system_message)
+        self.num_ctx = num_ctx
+        self.response_tokens = response_tokens
+        self.trim_chunk = max(1, trim_chunk)
+
+    @property
+    def prompt_limit(self):
+        return self.num_ctx - self.response_tokens
+
+    def fit(self, history, turn_sections):
+        """Lay out a prompt within the budget; returns a PromptPlan
+
+        history is the list of (role, content) from memory, which may start
+        with a summary message. turn_sections is an ordered list of
+        (name, text) whose texts joined make the human turn. Only the
+        "calendar" section may be shortened.
+        """
+        history = list(history)
+        head = [history.pop(0)] if history and history[0][0] == "system" else []
+        sections = {"system": self.system_tokens}
+        sections["summary"] = sum(message_tokens(role, content) for role, content in head)
+        sections["history"] = sum(message_tokens(role, content) for role, content in history)
+        for name, text in turn_sections:
+            sections[name] = estimate_tokens(text)
+
+        trimmed = 0
+        while history and sum(sections.values()) > self.prompt_limit:
+            # Whole chunks from the oldest end, so trimmed prompts still share a prefix
+            dropped = history[:self.trim_chunk]
+            del history[:self.trim_chunk]
+            trimmed += len(dropped)
+            sections["history"] -= sum(message_tokens(role, content) for role, content in dropped)
+
+        overflow = sum(sections.values()) - self.prompt_limit
+        if overflow > 0 and sections.get("calendar"):
+            turn_sections = [
+                (name, _trim_lines(text, max(0, sections[name] - overflow)) if name == "calendar" else text)
+                for name, text in turn_sections
+            ]
+            sections["calendar"] = estimate_tokens(dict(turn_sections)["calendar"])
+
+        history = head + history
+        chat_input = "".join(text for _, text in turn_sections)
+        messages = [(self.system_message, self.system_tokens)] + [
+            (render_message(role, content), message_tokens(role, content))
+            for role, content in history + [("human", chat_input)]
+        ]
+        return PromptPlan(history, chat_input, sections, messages, trimmed)
+
+
+class PrefillTracker:
+    """Estimates the prompt tokens the backend can serve from its cached prefix
+
+    For each user the digests of the last prompt's messages are kept; the
+    leading messages a new prompt shares with it are counted as reused. The
+    system prompt is shared by every user once any call has been made. This
+    is an upper bound: Ollama keeps one cached prompt per parallel slot, so
+    with many users interleaving some prefixes are evicted before reuse.
+    """
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._previous = OrderedDict()
+        self._lock = threading.Lock()
+        self._any_call = False
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.reused_tokens = 0
+        self.trimmed_calls = 0
+
+    def observe(self, user_id, plan):
+        """Record a prompt; returns (reused_tokens, prefilled_tokens)"""
+        digests = [(self._digest(message), tokens) for message, tokens in plan.messages]
+        total = sum(tokens for _, tokens in digests)
+        with self._lock:
+            previous = self._previous.pop(user_id, None)
+            reused = 0
+            if previous is not None:
+                for (digest, tokens), (old_digest, _) in zip(digests, previous):
+                    if digest != old_digest:
+                        break
+                    reused += tokens
+            elif self._any_call:
+                reused = digests[0][1]
+            self._previous[user_id] = digests
+            while len(self._previous) > self.max_users:
+                self._previous.popitem(last=False)
+            self._any_call = True
+            self.calls += 1
+            self.prompt_tokens += total
+            self.reused_tokens += reused
+            if plan.trimmed_messages:
+                self.trimmed_calls += 1
+        return reused, total - reused
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prompt_tokens - self.reused_tokens,
+                "reuse_rate": self.reused_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                "trimmed_calls": self.trimmed_calls,
+            }
+
+    @staticmethod
+    def _digest(message):
+        return hashlib.blake2b(message.encode(), digest_size=16).digest()
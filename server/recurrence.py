@@ -0,0 +1,182 @@
+"""Recurring event rules and lazy expansion of their occurrences
+
+A recurring series is stored once, as an event with an RRULE-like rule under
+its "rrule" key:
+
+    {"freq": "daily" | "weekly", "interval": 1, "byday": [0, 2, 4],
+     "count": 10, "until": "2025-06-30", "exdates": ["2025-06-02"]}
+
+byday holds weekday numbers (Monday is 0). Occurrences are computed only for
+the window a caller asks about, so a long or open-ended series costs one row
+of storage and work proportional to the window.
+"""
+import datetime
+import re
+from datetime import timedelta
+from itertools import islice
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# series_end of a series with neither COUNT nor UNTIL
+OPEN_ENDED = "9999-12-31"
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _pattern(rule, dtstart):
+    """Reduce a rule to (anchor, period_days, offsets): occurrences fall on anchor + k*period + offset"""
+    interval = max(1, int(rule.get("interval", 1)))
+    byday = sorted({day for day in rule.get("byday") or [] if 0 <= day <= 6})
+    if rule["freq"] == "daily" and not byday:
+        return dtstart, interval, [0]
+    if rule["freq"] == "daily":
+        # Daily restricted to some weekdays repeats week by week
+        interval = 1
+    elif not byday:
+        byday = [dtstart.weekday()]
+    anchor = dtstart - timedelta(days=dtstart.weekday())
+    return anchor, 7 * interval, byday
+
+
+def _skipped(anchor, offsets, dtstart):
+    """Slots in the first period that fall before the series starts"""
+    return sum(1 for offset in offsets if anchor + timedelta(days=offset) < dtstart)
+
+
+def occurrences(rule, dtstart, start=None, end=None):
+    """Yield the dates of a series within [start, end] in order
+
+    Jumps straight to the period containing `start`, so earlier occurrences
+    are never generated. With no `end` and no COUNT/UNTIL the generator is
+    infinite; callers must bound it.
+    """
+    anchor, period, offsets = _pattern(rule, dtstart)
+    until = _parse_date(rule["until"]) if rule.get("until") else None
+    count = rule.get("count")
+    exdates = set(rule.get("exdates") or [])
+    start = max(start or dtstart, dtstart)
+
+    period_index = max(0, (start - anchor).days // period)
+    # COUNT includes the occurrences before the window, so work out how many there were
+    seen = period_index * len(offsets) - _skipped(anchor, offsets, dtstart) if period_index else 0
+    # Open-ended series end with the calendar instead of overflowing it
+    last_day = (datetime.date.max - anchor).days
+    while True:
+        for offset in offsets:
+            days = period_index * period + offset
+            if days > last_day:
+                return
+            date = anchor + timedelta(days=days)
+            if date < dtstart:
+                continue
+            if count is not None and seen >= count:
+                return
+            seen += 1
+            if (until and date > until) or (end and date > end):
+                return
+            if date >= start and date.isoformat() not in exdates:
+                yield date
+        period_index += 1
+
+
+def last_date(rule, dtstart):
+    """Date of the final occurrence as YYYY-MM-DD, or OPEN_ENDED"""
+    last = _parse_date(rule["until"]) if rule.get("until") else None
+    if rule.get("count") is not None:
+        anchor, period, offsets = _pattern(rule, dtstart)
+        index = max(0, int(rule["count"]) - 1) + _skipped(anchor, offsets, dtstart)
+        days = (index // len(offsets)) * period + offsets[index % len(offsets)]
+        if days <= (datetime.date.max - anchor).days:
+            by_count = anchor + timedelta(days=days)
+            last = min(last, by_count) if last else by_count
+    return last.isoformat() if last else OPEN_ENDED
+
+
+def rule_error(event):
+    """Why a series event's rule cannot be expanded, or None if it can"""
+    rule = event.get("rrule")
+    if not isinstance(rule, dict):
+        return "rrule must be an object"
+    if rule.get("freq") not in ("daily", "weekly"):
+        return "rrule freq must be daily or weekly"
+    for key in ("interval", "count"):
+        if rule.get(key) is not None and (not isinstance(rule[key], int) or isinstance(rule[key], bool)):
+            return f"rrule {key} must be an integer"
+    if not all(isinstance(day, int) for day in rule.get("byday") or []):
+        return "rrule byday must hold weekday numbers"
+    if not isinstance(rule.get("exdates") or [], list):
+        return "rrule exdates must be a list"
+    try:
+        _parse_date(event.get("date"))
+        if rule.get("until"):
+            _parse_date(rule["until"])
+    except (TypeError, ValueError):
+        return "a recurring event needs dates as YYYY-MM-DD"
+    return None
+
+
+def series_end(event):
+    """Last date a stored event can occur on, or None for a single event"""
+    if not event.get("rrule"):
+        return None
+    return last_date(event["rrule"], _parse_date(event["date"]))
+
+
+def expand_event(event, start=None, end=None, limit=None):
+    """Yield occurrence dicts of a series event between start and end (YYYY-MM-DD strings)
+
+    Each occurrence is a copy of the series with its own date. It keeps the
+    series id, so updates and deletes by id apply to the whole series.
+    """
+    dates = occurrences(
+        event["rrule"],
+        _parse_date(event["date"]),
+        _parse_date(start) if start else None,
+        _parse_date(end) if end else None,
+    )
+    for date in islice(dates, limit):
+        occurrence = dict(event, date=date.isoformat(), series_id=event["id"], recurring=True)
+        occurrence.pop("rrule", None)
+        yield occurrence
+
+
+def parse_recurrence(pattern, dtstart=None):
+    """Turn phrases like "every Monday for 4 weeks" or "weekdays until 2025-06-30" into a rule
+
+    Returns None when the text does not describe a recurrence.
+    """
+    text = pattern.lower()
+    byday = [index for index, name in enumerate(WEEKDAYS) if re.search(rf"\b{name}s?\b", text)]
+    rule = None
+    if "weekday" in text or "work day" in text or "workday" in text:
+        rule = {"freq": "daily", "byday": [0, 1, 2, 3, 4]}
+    elif "daily" in text or "every day" in text:
+        rule = {"freq": "daily"}
+    elif "every other week" in text or "biweekly" in text or "fortnight" in text:
+        rule = {"freq": "weekly", "interval": 2}
+    elif "weekly" in text or "every week" in text or ("every" in text and byday):
+        rule = {"freq": "weekly"}
+    if rule is None:
+        return None
+    if rule["freq"] == "weekly" and byday:
+        rule["byday"] = byday
+
+    # Bounds: "for 4 weeks", "for 10 days", "5 times", "until 2025-06-30"
+    match = re.search(r"for\s+(\d+)\s+week", text)
+    if match:
+        per_week = len(rule.get("byday") or [None])
+        if rule["freq"] == "daily" and not rule.get("byday"):
+            per_week = 7
+        rule["count"] = int(match.group(1)) * per_week // rule.get("interval", 1)
+    match = re.search(r"for\s+(\d+)\s+day", text)
+    if match and rule["freq"] == "daily" and dtstart is not None:
+        rule["until"] = (dtstart + timedelta(days=int(match.group(1)) - 1)).isoformat()
+    match = re.search(r"(\d+)\s+times", text)
+    if match:
+        rule["count"] = int(match.group(1))
+    match = re.search(r"until\s+(\d{4}-\d{2}-\d{2})", text)
+    if match:
+        rule["until"] = match.group(1)
+    return rule
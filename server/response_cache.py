@@ -0,0 +1,179 @@
+"""Cache of raw LLM responses for repeated chat requests
+
+The key covers everything that can change the answer: the user, the
+normalized message, a digest of the recent conversation, any pending suggestion, the
+current date and the user's calendar version. Any calendar change bumps the
+version, so entries never outlive the calendar they were generated against;
+they simply stop being looked up and age out.
+
+Entries live in an in-memory LRU with a TTL, optionally backed by a SQLite
+file so they survive restarts.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+# Prune the disk tier every this many writes
+DISK_PRUNE_INTERVAL = 100
+
+
+def normalize_message(message):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r"\s+", " ", message.lower()).strip().rstrip(".!?")
+
+
+def history_digest(history, message, max_messages):
+    """Digest of the last few messages that could affect the answer
+
+    Trailing exchanges that asked the same thing are skipped, so asking
+    "what's on tomorrow" twice in a row maps to the same entry.
+    """
+    messages = list(history)
+    target = normalize_message(message)
+    while (len(messages) >= 2 and messages[-2][0] == "human"
+           and normalize_message(messages[-2][1]) == target):
+        del messages[-2:]
+    recent = messages[-max_messages:] if max_messages else []
+    return hashlib.sha256(json.dumps(recent).encode()).hexdigest()
+
+
+def make_key(user_id, message, history, date, version, pending_event=None, max_messages=4):
+    # Scoped to the user: calendars of different users can share a version number
+    parts = [
+        user_id,
+        normalize_message(message),
+        history_digest(history, message, max_messages),
+        date,
+        str(version),
+        json.dumps(pending_event, sort_keys=True) if pending_event else "",
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class ResponseCache:
+    """LRU/TTL cache of responses with an optional SQLite tier"""
+
+    def __init__(self, max_entries, ttl_seconds, disk_path=None, disk_max_entries=10000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if disk_path:
+            # Shared by every worker process, so WAL and a busy timeout like the other stores
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False, timeout=30)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute("PRAGMA synchronous=NORMAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._disk.commit()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """Cached response for a key, or None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, created = entry
+                if now - created <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+                self.expirations += 1
+            response = self._disk_get(key, now)
+            if response is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, response, now)
+            return response
+
+    def put(self, key, response):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._store(key, response, now)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created) VALUES (?, ?, ?)",
+                    (key, response, now),
+                )
+                self._disk_writes += 1
+                if self._disk_writes % DISK_PRUNE_INTERVAL == 0:
+                    self._disk_prune(now)
+                self._disk.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _store(self, key, response, now):
+        self._entries[key] = (response, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key, now):
+        if self._disk is None:
+            return None
+        row = self._disk.execute(
+            "SELECT response, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.ttl_seconds:
+            self._disk.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._disk.commit()
+            self.expirations += 1
+            return None
+        return row[0]
+
+    def _disk_prune(self, now):
+        self._disk.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        self._disk.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY created DESC LIMIT ?)",
+            (self.disk_max_entries,),
+        )
+
+
+def create_response_cache():
+    return ResponseCache(
+        max_entries=config.RESPONSE_CACHE_SIZE,
+        ttl_seconds=config.RESPONSE_CACHE_TTL_SECONDS,
+        disk_path=config.RESPONSE_CACHE_DB or None,
+        disk_max_entries=config.RESPONSE_CACHE_DISK_MAX,
+    )
@@ -0,0 +1,367 @@
+"""Reminders fired ahead of event start times, from one heap of timers across all users
+
+The scheduler keeps a single timer per event: one for each single event that
+has not started yet and one for the next occurrence of each recurring
+series. Timers sit in a binary heap ordered by fire time, so adding one
+costs O(log n) and the thread only ever looks at the top of the heap. A
+changed or deleted event marks its old entry stale instead of searching the
+heap for it; the heap is rebuilt once stale entries outnumber live ones.
+
+The heap is built from storage at boot with one paged scan and then kept
+current by the store's change listener. When a series' reminder fires, its
+timer rolls forward to the following occurrence, so a series never holds
+more than one timer however long it runs.
+
+Reminders fire REMINDER_LEAD_MINUTES before the start (or an event's own
+"reminderMinutes"; a negative value turns it off), and at
+REMINDER_ALL_DAY_TIME on the day of all-day events. Times are the server's
+local time, like the stored events.
+
+Only one process runs the scheduler: the one holding the lock on
+CALENDAR_DB + ".scheduler.lock"; the others retry the lock in case it
+exits. Writers may live in other processes (gunicorn workers, a
+development reloader, scripts), so besides its own process's listener the
+scheduler follows every calendar's change feed. The store's change
+sequence tells it whether anything beyond its own process's commits has
+happened; only then are the calendars scanned, and versions its own process
+committed are skipped there, so only foreign writes are read twice.
+"""
+import datetime
+import heapq
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import urllib.request
+
+import config
+import metrics
+import startup
+from recurrence import occurrences
+from state import try_hold_lock
+
+# Seconds between checks for writes made by other processes
+CHANGE_POLL_SECONDS = 2
+# Seconds between attempts to take over from the worker running the scheduler
+LEADER_RETRY_SECONDS = 30
+# Stale heap entries tolerated before the heap is rebuilt
+COMPACT_MIN_STALE = 1024
+
+
+def parse_time(value):
+    try:
+        return datetime.datetime.strptime(value, "%H:%M").time()
+    except (TypeError, ValueError):
+        return None
+
+
+class JsonlSink:
+    """Appends each reminder to a local file as one line of JSON"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, reminder):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(reminder, separators=(",", ":")) + "\n")
+
+
+class WebhookSink:
+    """POSTs each reminder as JSON to a URL, usually a service on the same host"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, reminder):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(reminder).encode(), method="POST",
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class ReminderScheduler:
+    """Heap of pending reminders for every user, fired by a background thread
+
+    Only the scheduler thread touches the heap; store listeners hand it the
+    ids of changed events, which it re-reads before rescheduling.
+    """
+
+    def __init__(self, store, sinks, lead_minutes=10, all_day_time="09:00", clock=time.time):
+        self.store = store
+        self.sinks = list(sinks)
+        self.lead_minutes = lead_minutes
+        self.all_day_time = parse_time(all_day_time) or datetime.time(9)
+        self.clock = clock
+        self.running = False
+        self.delivered = 0
+        self.failed = 0
+        # Entries are [fire_at, sequence, (user_id, event_id), occurrence date];
+        # the key is set to None when the entry goes stale
+        self._heap = []
+        self._timers = {}
+        self._stale = 0
+        self._sequence = itertools.count()
+        # user_id -> [changed ids, reset, committed versions], queued by the store listener
+        self._changes = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        # Change feed position per user
+        self._versions = {}
+        self._data_version = None
+        # Every change sequence number up to this one has been applied; the set
+        # holds this process's later commits, reported by the listener
+        self._sequence_seen = 0
+        self._own_sequences = set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        return {"running": self.running, "pending": len(self._timers), "stale": self._stale,
+                "delivered": self.delivered, "failed": self.failed}
+
+    def next_reminder(self, event, after):
+        """(fire_at timestamp, occurrence date) for the first occurrence starting after `after`
+
+        Returns None when the event has no reminder or no occurrence left.
+        """
+        lead = event.get("reminderMinutes", self.lead_minutes)
+        if not isinstance(lead, int) or lead < 0:
+            return None
+        start_time = None
+        if not (event.get("allDay") or event.get("is_all_day")):
+            start_time = parse_time(event.get("startTime"))
+        if start_time is None:
+            start_time, lead = self.all_day_time, 0
+        try:
+            dtstart = datetime.date.fromisoformat(event["date"])
+            if event.get("rrule"):
+                # Starts at after's day, so at most a day of occurrences is skipped
+                dates = occurrences(event["rrule"], dtstart, start=after.date())
+            else:
+                dates = [dtstart]
+            for date in dates:
+                start = datetime.datetime.combine(date, start_time)
+                if start > after:
+                    fire_at = start - datetime.timedelta(minutes=lead)
+                    return fire_at.timestamp(), date.isoformat()
+        except (KeyError, TypeError, ValueError):
+            pass
+        return None
+
+    def _on_change(self, user_id, event_ids, reset, version, sequence):
+        """Store listener: queue the change for the scheduler thread"""
+        with self._lock:
+            change = self._changes.setdefault(user_id, [set(), False, []])
+            if version is not None:
+                change[2].append(version)
+            if sequence is not None and sequence > self._sequence_seen:
+                self._own_sequences.add(sequence)
+            if reset:
+                change[0].clear()
+                change[1] = True
+            elif not change[1]:
+                change[0].update(event_ids)
+        self._wake.set()
+
+    def _run(self):
+        lock_path = f"{config.CALENDAR_DB}.scheduler"
+        while not try_hold_lock(lock_path):
+            if self._stopped.wait(LEADER_RETRY_SECONDS):
+                return
+        # Listen before the scan, so writes made during it are applied afterwards
+        self.store.add_listener(self._on_change)
+        with startup.report.phase("reminder_build"):
+            self._build()
+        self.running = True
+        print(f"Reminder scheduler started with {len(self._timers)} pending reminders")
+        next_poll = time.monotonic()
+        while not self._stopped.is_set():
+            self._apply_changes()
+            if time.monotonic() >= next_poll:
+                self._follow_changes()
+                next_poll = time.monotonic() + CHANGE_POLL_SECONDS
+            self._fire_due()
+            self._compact()
+            timeout = max(0.0, next_poll - time.monotonic())
+            if self._heap:
+                timeout = max(0.0, min(timeout, self._heap[0][0] - self.clock()))
+            self._wake.wait(timeout)
+            self._wake.clear()
+        self.running = False
+
+    def _build(self):
+        """Load every upcoming event from storage and heapify their timers in one go"""
+        self._watch = sqlite3.connect(self.store.path, isolation_level=None)
+        (self._data_version,) = self._watch.execute("PRAGMA data_version").fetchone()
+        # Read before the versions, so a write in between is caught by the next check
+        self._sequence_seen = self.store.change_sequence()
+        self._versions = self.store.calendar_versions()
+        after = datetime.datetime.fromtimestamp(self.clock())
+        for user_id, event in self.store.iter_upcoming(after.date().isoformat()):
+            upcoming = self.next_reminder(event, after)
+            if upcoming is not None:
+                key = (user_id, event["id"])
+                self._timers[key] = [upcoming[0], next(self._sequence), key, upcoming[1]]
+        self._heap = list(self._timers.values())
+        heapq.heapify(self._heap)
+
+    def _schedule(self, user_id, event, after):
+        """Replace an event's timer with one for its next occurrence starting after `after`"""
+        key = (user_id, event["id"])
+        self._cancel(key)
+        upcoming = self.next_reminder(event, after)
+        if upcoming is not None:
+            entry = [upcoming[0], next(self._sequence), key, upcoming[1]]
+            self._timers[key] = entry
+            heapq.heappush(self._heap, entry)
+
+    def _cancel(self, key):
+        entry = self._timers.pop(key, None)
+        if entry is not None:
+            entry[2] = None
+            self._stale += 1
+
+    def _reset_user(self, user_id, events):
+        """Reschedule a calendar that was replaced wholesale"""
+        for key in [key for key in self._timers if key[0] == user_id]:
+            self._cancel(key)
+        after = datetime.datetime.fromtimestamp(self.clock())
+        for event in events:
+            self._schedule(user_id, event, after)
+
+    def _apply_changes(self):
+        with self._lock:
+            changes, self._changes = self._changes, {}
+        after = datetime.datetime.fromtimestamp(self.clock())
+        for user_id, (event_ids, reset, versions) in changes.items():
+            # Advance the change feed past this process's own commits while they are
+            # consecutive; a gap is another process's write, left to _follow_changes
+            known = self._versions.get(user_id, 0)
+            for version in sorted(versions):
+                if version == known + 1:
+                    known = version
+            self._versions[user_id] = known
+            if reset:
+                self._reset_user(user_id, self.store.iter_events(user_id))
+                continue
+            for event_id in event_ids:
+                # Re-read, so the latest committed state wins whatever order listeners ran in
+                event = self.store.get_event(user_id, event_id)
+                if event is None:
+                    self._cancel((user_id, event_id))
+                else:
+                    self._schedule(user_id, event, after)
+
+    def _follow_changes(self):
+        """Apply writes other worker processes committed since the last check"""
+        (data_version,) = self._watch.execute("PRAGMA data_version").fetchone()
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        # data_version also moves on this process's own commits; skip the scan
+        # when the sequence shows nothing else was committed
+        sequence = self.store.change_sequence()
+        with self._lock:
+            while self._sequence_seen + 1 in self._own_sequences:
+                self._sequence_seen += 1
+                self._own_sequences.discard(self._sequence_seen)
+            if self._sequence_seen >= sequence:
+                return
+            self._sequence_seen = sequence
+            self._own_sequences = {seen for seen in self._own_sequences if seen > sequence}
+        after = datetime.datetime.fromtimestamp(self.clock())
+        for user_id, version in self.store.calendar_versions().items():
+            known = self._versions.get(user_id, 0)
+            if version == known:
+                continue
+            changes = self.store.changes_since(user_id, known)
+            self._versions[user_id] = changes["version"]
+            if changes["reset"]:
+                self._reset_user(user_id, changes["created"])
+                continue
+            for event in changes["created"] + changes["updated"]:
+                self._schedule(user_id, event, after)
+            for event_id in changes["deleted"]:
+                self._cancel((user_id, event_id))
+
+    def _fire_due(self):
+        now = self.clock()
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, _, key, date = heapq.heappop(self._heap)
+            if key is None:
+                self._stale -= 1
+                continue
+            del self._timers[key]
+            user_id, event_id = key
+            event = self.store.get_event(user_id, event_id)
+            if event is None:
+                continue
+            self._deliver(user_id, event, date, fire_at, now)
+            if event.get("rrule"):
+                # Roll the series forward; rules repeat at most once a day
+                end_of_day = datetime.datetime.combine(datetime.date.fromisoformat(date), datetime.time.max)
+                self._schedule(user_id, event, end_of_day)
+
+    def _deliver(self, user_id, event, date, fire_at, now):
+        reminder = {
+            "user_id": user_id,
+            "event_id": event["id"],
+            "title": event.get("title", ""),
+            "date": date,
+            "startTime": event.get("startTime"),
+            "endTime": event.get("endTime"),
+            "allDay": bool(event.get("allDay") or event.get("is_all_day")),
+            "notes": event.get("notes", ""),
+            "remind_at": datetime.datetime.fromtimestamp(fire_at).isoformat(timespec="seconds"),
+        }
+        if event.get("rrule"):
+            reminder["series_id"] = event["id"]
+        metrics.REMINDER_DELAY_SECONDS.observe(max(0.0, now - fire_at))
+        for sink in self.sinks:
+            try:
+                sink(reminder)
+            except Exception as e:
+                print(f"Reminder delivery to {sink.__class__.__name__} failed: {e}")
+                metrics.REMINDERS.inc(result="failed")
+                self.failed += 1
+            else:
+                metrics.REMINDERS.inc(result="delivered")
+                self.delivered += 1
+
+    def _compact(self):
+        """Drop stale entries once they outnumber the live timers"""
+        if self._stale > COMPACT_MIN_STALE and self._stale > len(self._timers):
+            self._heap = [entry for entry in self._heap if entry[2] is not None]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+
+def create_reminder_scheduler(store):
+    """Scheduler delivering to the configured sinks, or None when none is set"""
+    sinks = []
+    if config.REMINDER_LOG:
+        sinks.append(JsonlSink(config.REMINDER_LOG))
+    if config.REMINDER_WEBHOOK_URL:
+        sinks.append(WebhookSink(config.REMINDER_WEBHOOK_URL))
+    if not sinks:
+        return None
+    return ReminderScheduler(
+        store, sinks,
+        lead_minutes=config.REMINDER_LEAD_MINUTES,
+        all_day_time=config.REMINDER_ALL_DAY_TIME,
+    )
@@ -0,0 +1,53 @@
+"""Startup timings: how long a worker takes to import, open the store and get the model ready
+
+chat_server imports this module first, so IMPORT_STARTED is close to the
+moment the application started loading. Each phase is recorded once; the
+report is printed when the worker becomes ready and served by /readyz and
+/api/stats.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+IMPORT_STARTED = time.perf_counter()
+
+
+class StartupReport:
+    """Seconds spent in each startup phase, in the order they finished"""
+
+    def __init__(self, started):
+        self.started = started
+        self.ready_after = None
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase, seconds):
+        with self._lock:
+            self._phases.setdefault(phase, seconds)
+
+    @contextmanager
+    def phase(self, name):
+        """Record how long the block takes, unless it raises"""
+        started = time.perf_counter()
+        yield
+        self.record(name, time.perf_counter() - started)
+
+    def mark_ready(self):
+        """Note when the worker first became ready and print the report"""
+        with self._lock:
+            if self.ready_after is not None:
+                return
+            self.ready_after = time.perf_counter() - self.started
+            phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self._phases.items())
+        print(f"Startup: {phases}; ready after {self.ready_after:.2f}s")
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "phases": {name: round(seconds, 3) for name, seconds in self._phases.items()},
+                "ready_after": round(self.ready_after, 3) if self.ready_after is not None else None,
+                "uptime": round(time.perf_counter() - self.started, 3),
+            }
+
+
+report = StartupReport(IMPORT_STARTED)
@@ -0,0 +1,67 @@
+"""Helpers for state shared between worker processes on one host
+
+Files written by the server are replaced atomically (write to a temporary
+file, fsync, rename), so a reader in another process sees either the old or
+the new contents. Read-modify-write sequences take an advisory lock on a
+sidecar `.lock` file. On platforms without fcntl the lock is a no-op.
+"""
+import json
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Hold an advisory lock on `path` + ".lock" for the duration of the block"""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+_held_locks = {}
+
+
+def try_hold_lock(path):
+    """Take an exclusive lock on `path` + ".lock" for the rest of the process, without waiting
+
+    Returns True if this process holds it. The lock is released when the
+    process exits, so another process can take over by trying again.
+    """
+    if fcntl is None:
+        return True
+    if path in _held_locks:
+        return True
+    lock_file = open(f"{path}.lock", "a")
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _held_locks[path] = lock_file
+    return True
+
+
+def atomic_write_json(path, data):
+    """Replace `path` with `data` as JSON without readers ever seeing a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,696 @@
+"""SQLite-backed event storage for the calendar server
+
+Events are kept in a single WAL-mode database, one row per event, indexed by
+(user_id, id) and by (user_id, date). Mutations touch only the affected rows
+instead of rewriting the user's whole calendar.
+
+Recurring series are stored as a single row carrying a rule (see
+recurrence.py) and the last date they can occur on; range queries expand
+them lazily for the requested window only.
+
+Every mutation bumps the calendar's version counter and stamps the rows it
+touched with the new version; deletes leave a tombstone. Clients can then ask
+for everything that changed since a version they already hold. Listeners in
+this process (see add_listener) are told which event ids each committed
+transaction wrote or deleted.
+
+Each version bump also advances one database-wide change sequence, so a
+process can tell from a single row whether anyone else has written since it
+last looked.
+"""
+import base64
+import datetime
+import glob
+import heapq
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from itertools import islice
+
+import config
+from recurrence import expand_event, rule_error, series_end
+from state import file_lock
+
+LEGACY_SUFFIX = "_calendar_events.json"
+# Event times are stored as 24-hour HH:MM strings
+TIME_PATTERN = re.compile(r"([01]\d|2[0-3]):[0-5]\d")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendars (
+    user_id TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL DEFAULT 1,
+    version INTEGER NOT NULL DEFAULT 0,
+    feed_floor INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS events (
+    user_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    start_time TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    created_version INTEGER NOT NULL,
+    series_end TEXT,
+    PRIMARY KEY (user_id, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_by_date ON events (user_id, date, start_time, id);
+CREATE INDEX IF NOT EXISTS events_series ON events (user_id, series_end) WHERE series_end IS NOT NULL;
+CREATE INDEX IF NOT EXISTS events_by_version ON events (user_id, version);
+CREATE TABLE IF NOT EXISTS tombstones (
+    user_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (user_id, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tombstones_by_version ON tombstones (user_id, version);
+CREATE TABLE IF NOT EXISTS change_sequence (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    value INTEGER NOT NULL
+);
+"""
+
+
+class BatchError(ValueError):
+    """An operation in a batch could not be applied; nothing in the batch was written"""
+
+    def __init__(self, index, message):
+        super().__init__(f"Operation {index}: {message}")
+        self.index = index
+        self.reason = message
+
+
+class EventNotFound(BatchError):
+    """An update or delete in a batch named an event that does not exist"""
+
+
+class VersionConflict(Exception):
+    """The calendar changed since the version a client based its write on"""
+
+    def __init__(self, expected, current):
+        super().__init__(f"Calendar is at version {current}, not {expected}")
+        self.expected = expected
+        self.current = current
+
+
+def _is_date(value):
+    try:
+        return isinstance(value, str) and len(value) == 10 and bool(datetime.date.fromisoformat(value))
+    except ValueError:
+        return False
+
+
+def _check_event(index, event, fields=("date", "startTime", "endTime")):
+    """Raise BatchError for an event that could not be sorted, listed or expanded
+
+    Only `fields` are checked, so an update leaves alone what it does not touch.
+    """
+    if "date" in fields and not _is_date(event.get("date")):
+        raise BatchError(index, "date must be YYYY-MM-DD")
+    for key in ("startTime", "endTime"):
+        value = event.get(key)
+        if key in fields and value and not (isinstance(value, str) and TIME_PATTERN.fullmatch(value)):
+            raise BatchError(index, f"{key} must be HH:MM")
+    if event.get("rrule"):
+        error = rule_error(event)
+        if error:
+            raise BatchError(index, error)
+
+
+def _encode(event):
+    return json.dumps(event, separators=(",", ":"))
+
+
+def encode_cursor(event):
+    """Opaque pagination cursor pointing just past `event` in date order"""
+    key = [event.get("date") or "", event.get("startTime") or "", event["id"]]
+    return base64.urlsafe_b64encode(_encode(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, start_time, event_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(date), str(start_time), int(event_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _sort_key(event):
+    return event.get("date") or "", event.get("startTime") or ""
+
+
+def _list_key(event):
+    # Same order as the events_by_date index
+    return event.get("date") or "", event.get("startTime") or "", event["id"]
+
+
+class EventStore:
+    """Per-user event storage backed by a shared SQLite database"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+        self.versions = VersionCache(path)
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Call listener(user_id, event_ids, reset, version, sequence) after every committed write
+
+        event_ids is the set of ids the transaction wrote or deleted; reset
+        is True when the user's calendar was replaced wholesale, version is
+        the calendar version the transaction committed and sequence its
+        change_sequence number. Listeners run on the writing thread, so they
+        should only queue work.
+        """
+        self._listeners.append(listener)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run a block inside a write transaction on this thread's connection"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        # user_id -> [touched ids, reset, version, sequence], filled in by the row helpers
+        changes = self._local.changes = {}
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.changes = None
+        conn.execute("COMMIT")
+        for user_id, (event_ids, reset, version, sequence) in changes.items():
+            for listener in self._listeners:
+                try:
+                    listener(user_id, event_ids, reset, version, sequence)
+                except Exception as e:
+                    print(f"Event store listener failed: {e}")
+
+    def _touch(self, user_id, event_id=None, reset=False, version=None, sequence=None):
+        """Note a change in the current transaction for the listeners"""
+        if not self._listeners:
+            return
+        change = self._local.changes.setdefault(user_id, [set(), False, None, None])
+        if version is not None:
+            change[2] = version
+            change[3] = sequence
+        if reset:
+            # Listeners reload the whole calendar, so the ids are not needed
+            change[0].clear()
+            change[1] = True
+        elif event_id is not None and not change[1]:
+            change[0].add(event_id)
+
+    def _allocate_ids(self, conn, user_id, count):
+        """Reserve `count` consecutive ids for a user; ids are never reused"""
+        conn.execute("INSERT OR IGNORE INTO calendars (user_id) VALUES (?)", (user_id,))
+        (next_id,) = conn.execute(
+            "SELECT next_id FROM calendars WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        conn.execute(
+            "UPDATE calendars SET next_id = ? WHERE user_id = ?", (next_id + count, user_id)
+        )
+        return next_id
+
+    def _bump_version(self, conn, user_id):
+        """Advance a user's calendar version inside the current transaction"""
+        conn.execute("INSERT OR IGNORE INTO calendars (user_id) VALUES (?)", (user_id,))
+        conn.execute("UPDATE calendars SET version = version + 1 WHERE user_id = ?", (user_id,))
+        (version,) = conn.execute(
+            "SELECT version FROM calendars WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        conn.execute("INSERT OR IGNORE INTO change_sequence (id, value) VALUES (0, 0)")
+        conn.execute("UPDATE change_sequence SET value = value + 1 WHERE id = 0")
+        (sequence,) = conn.execute("SELECT value FROM change_sequence WHERE id = 0").fetchone()
+        self._touch(user_id, version=version, sequence=sequence)
+        return version
+
+    def _write_row(self, conn, user_id, event, version):
+        self._touch(user_id, event["id"])
+        conn.execute(
+            "INSERT INTO events (user_id, id, date, start_time, data, version, created_version, series_end) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (user_id, id) DO UPDATE SET date = excluded.date, "
+            "start_time = excluded.start_time, data = excluded.data, version = excluded.version, "
+            "series_end = excluded.series_end",
+            (user_id, event["id"], event.get("date") or "", event.get("startTime") or "",
+             _encode(event), version, version, series_end(event)),
+        )
+
+    def current_version(self, user_id):
+        """Return a user's calendar version, usually without touching the database"""
+        return self.versions.get(user_id, self._read_version)
+
+    def _read_version(self, user_id):
+        row = self._connect().execute(
+            "SELECT version FROM calendars WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def changes_since(self, user_id, since):
+        """Return the events created, updated and deleted after version `since`
+
+        If `since` predates the oldest change still tracked (or comes from a
+        different database), the whole calendar is returned as created with
+        `reset` set, and the client should replace its copy.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT version, feed_floor FROM calendars WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            version, floor = row or (0, 0)
+            if since < floor or since > version:
+                rows = conn.execute(
+                    "SELECT data FROM events WHERE user_id = ? ORDER BY date, start_time, id", (user_id,)
+                )
+                return {"version": version, "reset": True,
+                        "created": [json.loads(data) for (data,) in rows],
+                        "updated": [], "deleted": []}
+            created, updated = [], []
+            rows = conn.execute(
+                "SELECT data, created_version FROM events WHERE user_id = ? AND version > ? "
+                "ORDER BY version, id", (user_id, since)
+            )
+            for data, created_version in rows:
+                (created if created_version > since else updated).append(json.loads(data))
+            deleted = [event_id for (event_id,) in conn.execute(
+                "SELECT id FROM tombstones WHERE user_id = ? AND version > ? ORDER BY version, id",
+                (user_id, since),
+            )]
+            return {"version": version, "reset": False,
+                    "created": created, "updated": updated, "deleted": deleted}
+        finally:
+            conn.execute("COMMIT")
+
+    def all_events(self, user_id):
+        """Return every event for a user, ordered by date and start time"""
+        rows = self._connect().execute(
+            "SELECT data FROM events WHERE user_id = ? ORDER BY date, start_time, id", (user_id,)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def iter_events(self, user_id, page_size=1000):
+        """Yield every stored event (series unexpanded) in id order, reading one page at a time"""
+        conn = self._connect()
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, data FROM events WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (user_id, last_id, page_size),
+            ).fetchall()
+            for last_id, data in rows:
+                yield json.loads(data)
+            if len(rows) < page_size:
+                return
+
+    def iter_upcoming(self, start, page_size=1000):
+        """Yield (user_id, event) for every user's events that may occur on or after `start`
+
+        Single events dated from `start` on and series that have not ended,
+        read one page at a time in (user_id, id) order.
+        """
+        conn = self._connect()
+        after = ("", 0)
+        while True:
+            rows = conn.execute(
+                "SELECT user_id, id, data FROM events WHERE (user_id, id) > (?, ?) "
+                "AND (date >= ? OR series_end >= ?) ORDER BY user_id, id LIMIT ?",
+                (*after, start, start, page_size),
+            ).fetchall()
+            for user_id, event_id, data in rows:
+                yield user_id, json.loads(data)
+            if len(rows) < page_size:
+                return
+            after = rows[-1][:2]
+
+    def change_sequence(self):
+        """Number of version bumps ever committed, across all users and processes"""
+        row = self._connect().execute("SELECT value FROM change_sequence WHERE id = 0").fetchone()
+        return row[0] if row else 0
+
+    def calendar_versions(self):
+        """Current version of every user's calendar"""
+        return dict(self._connect().execute("SELECT user_id, version FROM calendars"))
+
+    def list_events(self, user_id, start=None, end=None, limit=None, cursor=None):
+        """Return events with start <= date <= end in date order, one page at a time
+
+        Single events are read from the (user_id, date, start_time, id) index;
+        recurring series overlapping the window are expanded lazily and merged
+        in. The cost depends on the size of the page rather than the size of
+        the calendar. Returns (events, next_cursor); next_cursor is None on
+        the last page.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        conn = self._connect()
+        
+        clauses = ["user_id = ?", "series_end IS NULL"]
+        params = [user_id]
+        if start:
+            clauses.append("date >= ?")
+            params.append(start)
+        if end:
+            clauses.append("date <= ?")
+            params.append(end)
+        if after:
+            clauses.append("(date, start_time, id) > (?, ?, ?)")
+            params.extend(after)
+        sql = f"SELECT data FROM events WHERE {' AND '.join(clauses)} ORDER BY date, start_time, id"
+        if limit:
+            # Fetch one extra row to learn whether another page exists
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        streams = [(json.loads(data) for (data,) in conn.execute(sql, params))]
+        
+        # Expand only the part of each series inside the window
+        window_start = max(filter(None, [start, after[0] if after else None]), default=None)
+        if end:
+            window_end = end
+        else:
+            # Open-ended queries stop expanding series at a fixed horizon
+            horizon_from = datetime.date.fromisoformat(window_start) if window_start else datetime.date.today()
+            days = min(config.RECURRENCE_HORIZON_DAYS, (datetime.date.max - horizon_from).days)
+            window_end = (horizon_from + datetime.timedelta(days=days)).isoformat()
+        rows = conn.execute(
+            "SELECT data FROM events WHERE user_id = ? AND series_end IS NOT NULL "
+            "AND series_end >= ? AND date <= ?",
+            (user_id, window_start or "", window_end),
+        ).fetchall()
+        for (data,) in rows:
+            occurrences = expand_event(json.loads(data), window_start, window_end)
+            if after:
+                # Before the page limit, or occurrences on the cursor date use up the page
+                occurrences = (o for o in occurrences if _list_key(o) > after)
+            if limit:
+                occurrences = islice(occurrences, limit + 1)
+            streams.append(occurrences)
+        
+        events = []
+        for event in heapq.merge(*streams, key=_list_key):
+            events.append(event)
+            if limit and len(events) > limit:
+                break
+        next_cursor = None
+        if limit and len(events) > limit:
+            events = events[:limit]
+            next_cursor = encode_cursor(events[-1])
+        return events, next_cursor
+
+    def exclude_occurrence(self, user_id, event_id, date, expected_version=None):
+        """Drop one date from a recurring series; returns False if there is no such series"""
+        try:
+            self.apply_batch(user_id, [{"op": "delete", "id": event_id, "date": date}], expected_version)
+        except EventNotFound:
+            return False
+        return True
+
+    def detach_occurrence(self, user_id, event_id, date, updates, expected_version=None):
+        """Replace one occurrence of a series with a standalone event carrying `updates`"""
+        try:
+            return self.apply_batch(
+                user_id, [{"op": "update", "id": event_id, "date": date, "updates": updates}], expected_version
+            )[0]
+        except EventNotFound:
+            return None
+
+    def apply_batch(self, user_id, operations, expected_version=None):
+        """Apply a list of creates, updates and deletes in one transaction
+
+        Operations look like {"op": "create", "event": {...}},
+        {"op": "update", "id": 3, "updates": {...}} or {"op": "delete", "id": 3}.
+        Updates and deletes may carry a "date" to target a single occurrence
+        of a recurring series. The whole batch shares one new version; if any
+        operation fails nothing is written and BatchError is raised. Returns
+        one result per operation: the stored event for creates and updates,
+        {"id": ..., "deleted": True} for deletes.
+
+        With `expected_version`, the batch is only applied if the calendar is
+        still at that version; otherwise VersionConflict is raised.
+        """
+        with self.transaction() as conn:
+            if expected_version is not None:
+                current = self._read_version(user_id)
+                if current != expected_version:
+                    raise VersionConflict(expected_version, current)
+            version = self._bump_version(conn, user_id)
+            creates = sum(1 for operation in operations if operation.get("op") == "create")
+            next_id = self._allocate_ids(conn, user_id, creates) if creates else None
+            results = []
+            for index, operation in enumerate(operations):
+                op = operation.get("op")
+                if op == "create":
+                    event = operation.get("event")
+                    if not isinstance(event, dict):
+                        raise BatchError(index, "create needs an event")
+                    event = dict(event, id=next_id)
+                    next_id += 1
+                    _check_event(index, event)
+                    self._write_row(conn, user_id, event, version)
+                    results.append(event)
+                    continue
+                if op not in ("update", "delete"):
+                    raise BatchError(index, f"unknown op {op!r}")
+                event_id = operation.get("id")
+                if not isinstance(event_id, int):
+                    raise BatchError(index, f"{op} needs an integer id")
+                if op == "update":
+                    updates = operation.get("updates") or {}
+                    if not isinstance(updates, dict):
+                        raise BatchError(index, "updates must be an object")
+                    result = self._update_row(conn, user_id, event_id, operation.get("date"), updates, version, index)
+                else:
+                    result = self._delete_row(conn, user_id, event_id, operation.get("date"), version)
+                if result is None:
+                    raise EventNotFound(index, f"event {event_id} not found")
+                results.append(result)
+        return results
+
+    def _update_row(self, conn, user_id, event_id, date, updates, version, index=0):
+        if date:
+            # Split one occurrence off the series as a standalone event
+            series = self._read_series(conn, user_id, event_id)
+            if series is None:
+                return None
+            self._add_exdate(conn, user_id, series, date, version)
+            event = {key: value for key, value in series.items() if key != "rrule"}
+            event["date"] = date
+            event.update(updates)
+            event.update(id=self._allocate_ids(conn, user_id, 1), series_id=event_id)
+        else:
+            row = conn.execute(
+                "SELECT data FROM events WHERE user_id = ? AND id = ?", (user_id, event_id)
+            ).fetchone()
+            if row is None:
+                return None
+            event = json.loads(row[0])
+            event.update(updates)
+            event["id"] = event_id
+        _check_event(index, event, set(updates) | ({"date"} if date else set()))
+        self._write_row(conn, user_id, event, version)
+        return event
+
+    def _delete_row(self, conn, user_id, event_id, date, version):
+        if date:
+            series = self._read_series(conn, user_id, event_id)
+            if series is None:
+                return None
+            self._add_exdate(conn, user_id, series, date, version)
+            return {"id": event_id, "date": date, "deleted": True}
+        cursor = conn.execute(
+            "DELETE FROM events WHERE user_id = ? AND id = ?", (user_id, event_id)
+        )
+        if cursor.rowcount == 0:
+            return None
+        self._touch(user_id, event_id)
+        conn.execute(
+            "INSERT OR REPLACE INTO tombstones (user_id, id, version) VALUES (?, ?, ?)",
+            (user_id, event_id, version),
+        )
+        return {"id": event_id, "deleted": True}
+
+    def _read_series(self, conn, user_id, event_id):
+        row = conn.execute(
+            "SELECT data FROM events WHERE user_id = ? AND id = ? AND series_end IS NOT NULL",
+            (user_id, event_id),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _add_exdate(self, conn, user_id, event, date, version):
+        rule = event["rrule"]
+        rule["exdates"] = sorted(set(rule.get("exdates") or []) | {date})
+        self._write_row(conn, user_id, event, version)
+
+    def count_events(self, user_id):
+        (count,) = self._connect().execute(
+            "SELECT COUNT(*) FROM events WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return count
+
+    def get_event(self, user_id, event_id):
+        row = self._connect().execute(
+            "SELECT data FROM events WHERE user_id = ? AND id = ?", (user_id, event_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def insert_events(self, user_id, events):
+        """Insert new events, assigning each a fresh id"""
+        if not events:
+            return []
+        with self.transaction() as conn:
+            version = self._bump_version(conn, user_id)
+            first_id = self._allocate_ids(conn, user_id, len(events))
+            stored = []
+            for offset, event in enumerate(events):
+                event = dict(event, id=first_id + offset)
+                self._write_row(conn, user_id, event, version)
+                stored.append(event)
+        return stored
+
+    def insert_event(self, user_id, event):
+        return self.insert_events(user_id, [event])[0]
+
+    def update_event(self, user_id, event_id, updates, expected_version=None):
+        """Apply a partial update to one event; returns None if it does not exist"""
+        try:
+            return self.apply_batch(
+                user_id, [{"op": "update", "id": event_id, "updates": updates}], expected_version
+            )[0]
+        except EventNotFound:
+            return None
+
+    def delete_event(self, user_id, event_id, expected_version=None):
+        """Delete one event; returns False if it did not exist"""
+        try:
+            self.apply_batch(user_id, [{"op": "delete", "id": event_id}], expected_version)
+        except EventNotFound:
+            return False
+        return True
+
+    def replace_all(self, user_id, events):
+        """Replace a user's calendar wholesale, keeping ids that are valid and unique"""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM events WHERE user_id = ?", (user_id,))
+            self._import_rows(conn, user_id, events)
+
+    def _import_rows(self, conn, user_id, events):
+        """Write a full calendar; clients holding older versions must resync"""
+        version = self._bump_version(conn, user_id)
+        self._touch(user_id, reset=True)
+        conn.execute("DELETE FROM tombstones WHERE user_id = ?", (user_id,))
+        conn.execute("UPDATE calendars SET feed_floor = ? WHERE user_id = ?", (version, user_id))
+        seen = set()
+        pending = []
+        for event in events:
+            event_id = event.get("id")
+            if isinstance(event_id, int) and event_id > 0 and event_id not in seen:
+                seen.add(event_id)
+                self._write_row(conn, user_id, event, version)
+            else:
+                pending.append(event)
+        conn.execute("INSERT OR IGNORE INTO calendars (user_id) VALUES (?)", (user_id,))
+        if seen:
+            conn.execute(
+                "UPDATE calendars SET next_id = MAX(next_id, ?) WHERE user_id = ?",
+                (max(seen) + 1, user_id),
+            )
+        if pending:
+            first_id = self._allocate_ids(conn, user_id, len(pending))
+            for offset, event in enumerate(pending):
+                self._write_row(conn, user_id, dict(event, id=first_id + offset), version)
+
+    def migrate_json_file(self, user_id, filename):
+        """Import a legacy `{user_id}_calendar_events.json` file once, then rename it
+
+        Legacy ids were allocated as len(events) + 1 and may collide after
+        deletes; duplicates are given fresh ids on import.
+        """
+        try:
+            with open(filename, "r") as f:
+                events = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading legacy calendar file {filename}: {e}")
+            return 0
+        with self.transaction() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM calendars WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if exists:
+                print(f"Skipping legacy calendar for {user_id}: already migrated")
+                return 0
+            self._import_rows(conn, user_id, sorted(events, key=_sort_key))
+        os.replace(filename, filename + ".migrated")
+        return len(events)
+
+    def migrate_json_dir(self, directory):
+        """Import every legacy per-user JSON calendar found in `directory`
+
+        Worker processes starting together take turns, so each file is
+        imported and renamed exactly once.
+        """
+        migrated = 0
+        with file_lock(self.path):
+            for filename in glob.glob(os.path.join(directory, "*" + LEGACY_SUFFIX)):
+                user_id = os.path.basename(filename)[: -len(LEGACY_SUFFIX)]
+                count = self.migrate_json_file(user_id, filename)
+                if count:
+                    print(f"Migrated {count} events for {user_id} from {filename}")
+                    migrated += count
+        return migrated
+
+
+class VersionCache:
+    """Process-local cache of calendar versions for cheap ETag checks
+
+    A dedicated connection polls PRAGMA data_version, which changes whenever
+    any other connection (in this or another process) commits. That check is
+    served from SQLite's shared-memory WAL index, so an unchanged database
+    answers version lookups without reading any tables.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._versions = {}
+
+    def get(self, user_id, load):
+        with self._lock:
+            (data_version,) = self._conn.execute("PRAGMA data_version").fetchone()
+            if data_version != self._data_version:
+                self._versions.clear()
+                self._data_version = data_version
+            if user_id not in self._versions:
+                self._versions[user_id] = load(user_id)
+            return self._versions[user_id]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide event store, migrating legacy JSON files on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = EventStore(config.CALENDAR_DB)
+                store.migrate_json_dir(config.LEGACY_CALENDAR_DIR)
+                _store = store
+    return _store
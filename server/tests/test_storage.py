@@ -0,0 +1,127 @@
+"""Tests for the SQLite event store
+
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+from storage import BatchError, EventStore  # noqa: E402
+
+
+class ListEventsPagingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = EventStore(os.path.join(self.tmpdir.name, "calendar.db"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def page_through(self, limit, **window):
+        events, cursor = self.store.list_events("u", limit=limit, **window)
+        pages = [events]
+        while cursor:
+            events, cursor = self.store.list_events("u", limit=limit, cursor=cursor, **window)
+            pages.append(events)
+        return [event for page in pages for event in page]
+
+    def test_pages_through_every_occurrence_of_a_series(self):
+        self.store.insert_events("u", [
+            {"title": "Standup", "date": "2025-06-02", "startTime": "09:00", "rrule": {"freq": "daily"}},
+            {"title": "Lunch", "date": "2025-06-04", "startTime": "12:00"},
+        ])
+        window = {"start": "2025-06-02", "end": "2025-06-09"}
+        expected, _ = self.store.list_events("u", **window)
+        self.assertEqual(len(expected), 9)
+        for limit in (1, 2, 3, 4):
+            with self.subTest(limit=limit):
+                events = self.page_through(limit, **window)
+                self.assertEqual([(e["date"], e["title"]) for e in events],
+                                 [(e["date"], e["title"]) for e in expected])
+
+    def test_pages_through_interleaved_series(self):
+        self.store.insert_events("u", [
+            {"title": "Gym", "date": "2025-06-02", "startTime": "07:00",
+             "rrule": {"freq": "weekly", "byday": [0, 2, 4]}},
+            {"title": "Standup", "date": "2025-06-02", "startTime": "09:00",
+             "rrule": {"freq": "daily", "byday": [0, 1, 2, 3, 4]}},
+        ])
+        window = {"start": "2025-06-02", "end": "2025-06-15"}
+        expected, _ = self.store.list_events("u", **window)
+        self.assertEqual(len(expected), 16)
+        for limit in (1, 2, 3, 5):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.page_through(limit, **window), expected)
+
+    def test_open_ended_series_stop_at_the_last_representable_date(self):
+        self.store.insert_events("u", [
+            {"title": "Standup", "date": "2025-06-02", "rrule": {"freq": "daily"}},
+            {"title": "Review", "date": "2025-06-01", "rrule": {"freq": "weekly", "count": 10 ** 9}},
+        ])
+        events, cursor = self.store.list_events("u", start="9999-12-20", limit=20)
+        self.assertEqual(events[-1]["date"], "9999-12-31")
+        self.assertIsNone(cursor)
+        events, _ = self.store.list_events("u", start="9999-12-25", end="9999-12-31")
+        self.assertEqual(len(events), 8)
+
+
+class ApplyBatchValidationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = EventStore(os.path.join(self.tmpdir.name, "calendar.db"))
+        self.event = self.store.insert_event("u", {"title": "Lunch", "date": "2025-06-04"})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assert_rejected(self, operations, index):
+        version = self.store.current_version("u")
+        with self.assertRaises(BatchError) as raised:
+            self.store.apply_batch("u", operations)
+        self.assertEqual(raised.exception.index, index)
+        self.assertEqual(self.store.current_version("u"), version)
+        self.assertEqual(self.store.list_events("u")[0], [self.event])
+
+    def test_rejects_updates_that_are_not_an_object(self):
+        self.assert_rejected([
+            {"op": "create", "event": {"title": "Gym", "date": "2025-06-05"}},
+            {"op": "update", "id": self.event["id"], "updates": 5},
+        ], 1)
+
+    def test_rejects_rules_without_a_valid_freq(self):
+        for rrule in ({"interval": 2}, {"freq": "monthly"}, "daily"):
+            with self.subTest(rrule=rrule):
+                self.assert_rejected([
+                    {"op": "create", "event": {"title": "Gym", "date": "2025-06-05", "rrule": rrule}},
+                ], 0)
+                self.assert_rejected([
+                    {"op": "create", "event": {"title": "Gym", "date": "2025-06-05"}},
+                    {"op": "update", "id": self.event["id"], "updates": {"rrule": rrule}},
+                ], 1)
+
+    def test_rejects_dates_and_times_that_do_not_sort(self):
+        for fields in ({"date": 5}, {"date": "garbage"}, {"date": "2025-02-30"}, {"date": None},
+                       {"startTime": "9am"}, {"endTime": 1300}, {"startTime": "24:00"}):
+            event = dict({"title": "Gym", "date": "2025-06-05"}, **fields)
+            with self.subTest(fields=fields):
+                self.assert_rejected([{"op": "create", "event": event}], 0)
+                self.assert_rejected([
+                    {"op": "create", "event": {"title": "Gym", "date": "2025-06-05"}},
+                    {"op": "update", "id": self.event["id"], "updates": fields},
+                ], 1)
+
+    def test_accepts_all_day_events_and_untouched_fields(self):
+        self.store.apply_batch("u", [
+            {"op": "create", "event": {"title": "Holiday", "date": "2025-06-06", "startTime": None}},
+            {"op": "update", "id": self.event["id"], "updates": {"startTime": "12:30", "endTime": ""}},
+        ])
+        self.assertEqual(self.store.get_event("u", self.event["id"])["startTime"], "12:30")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,7 @@
+"""WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from chat_server import app, initialize
+
+initialize()